@@ -1,51 +1,45 @@
 import streamlit as st
 import os
+import uuid
 from dotenv import load_dotenv
 from audio_recorder_streamlit import audio_recorder
-import speech_recognition as sr
-import io
-from deep_translator import GoogleTranslator
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
-from huggingface_hub import InferenceClient
-
-# Load environment variables from .env file
+
+# Load environment variables from .env file (before our modules read their settings)
 load_dotenv()
 
+from audio_format import AUDIO_FORMAT_OPTIONS, audio_mime
+from audio_store import SessionAudio, get_audio_store
+from clients import connection_stats, get_hf_client, get_polly_client
+from conversation_context import ConversationContext
+from conversation_store import open_conversation
+from metrics import collected_values, counter_values, stage_summary, start_metrics_server
+from pipeline import DEFAULT_PERSONALITY, get_pipeline_engine, make_turn
+from stream_render import ThrottledRenderer
+from tts import DEFAULT_AUDIO_FORMAT, POLLY_VOICE_OPTIONS
+from warmup import start_warm_up, warm_up_report
+
 # Initialize Hugging Face Inference Client
 hf_token = os.getenv("HUGGINGFACE_TOKEN")
 if not hf_token:
     st.error("❌ HUGGINGFACE_TOKEN not found in .env file")
     st.stop()
 
-client = InferenceClient(token=hf_token)
+# Both clients are created once per process and shared by every session and rerun,
+# so their keep-alive connections survive between interactions
+client = get_hf_client(hf_token)
 
 # Initialize AWS Polly client
-polly_client = boto3.client(
-    'polly',
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    region_name=os.getenv("AWS_REGION", "ca-central-1")
-)
+polly_client = get_polly_client()
 
-# AWS Polly language and voice mapping
-# Maps translation language names to Polly language codes and default voices
-POLLY_LANGUAGE_MAP = {
-    "english": {"code": "en-US", "voice": "Joanna", "engine": "standard"},
-    "chinese (simplified)": {"code": "cmn-CN", "voice": "Zhiyu", "engine": "standard"},
-    "chinese (traditional)": {"code": "cmn-CN", "voice": "Zhiyu", "engine": "standard"},
-    "cantonese": {"code": "yue-CN", "voice": "Hiujin", "engine": "neural"},  # Cantonese only has neural voice
-    "french": {"code": "fr-FR", "voice": "Celine", "engine": "standard"},
-    "spanish": {"code": "es-ES", "voice": "Conchita", "engine": "standard"},
-    "german": {"code": "de-DE", "voice": "Marlene", "engine": "standard"},
-    "japanese": {"code": "ja-JP", "voice": "Mizuki", "engine": "standard"},
-    "korean": {"code": "ko-KR", "voice": "Seoyeon", "engine": "standard"},
-    "italian": {"code": "it-IT", "voice": "Carla", "engine": "standard"},
-    "portuguese": {"code": "pt-BR", "voice": "Vitoria", "engine": "standard"},
-    "russian": {"code": "ru-RU", "voice": "Tatyana", "engine": "standard"},
-    "arabic": {"code": "arb", "voice": "Zeina", "engine": "standard"},
-    "hindi": {"code": "hi-IN", "voice": "Aditi", "engine": "standard"},
-}
+# Open connections, load speech recognition and pre-synthesize the fixed phrases
+# in the background the first time the app runs in this process
+start_warm_up(polly_client, client)
+# Prometheus /metrics endpoint on METRICS_PORT (once per process, off when unset)
+start_metrics_server()
+
+# Async STT -> translate -> LLM -> TTS pipeline, shared by every session.
+# This page is only a client of it: server.py serves the same engine over HTTP.
+engine = get_pipeline_engine(client, polly_client)
 
 # Page configuration
 st.set_page_config(
@@ -237,65 +231,49 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# Number of messages shown per "Load earlier messages" page
+HISTORY_PAGE_SIZE = 20
+
 # Initialize session state
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    # Stored message by message (conversation_store.py), with only the newest ones in memory.
+    # The id is kept in the URL, so a reload or an app restart resumes the conversation.
+    try:
+        st.session_state.messages = open_conversation(st.query_params.get("conversation"))
+    except ValueError as e:
+        st.warning(f"⚠️ {e}. Starting a new conversation.")
+        st.session_state.messages = open_conversation()
+    st.query_params["conversation"] = st.session_state.messages.conversation_id
 if "personality" not in st.session_state:
-    st.session_state.personality = "General Assistant"
-if "voice_text" not in st.session_state:
-    st.session_state.voice_text = ""
+    st.session_state.personality = DEFAULT_PERSONALITY
 if "voice_language" not in st.session_state:
     st.session_state.voice_language = "en-US"
 if "translate_to" not in st.session_state:
     st.session_state.translate_to = "english"
 if "show_translation" not in st.session_state:
     st.session_state.show_translation = False
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 if "tts_audio" not in st.session_state:
-    st.session_state.tts_audio = {}  # Store generated audio by message index
+    # Store generated audio by message index (bounded, spills older clips to disk)
+    st.session_state.tts_audio = SessionAudio(get_audio_store(), st.session_state.session_id)
 if "processing" not in st.session_state:
     st.session_state.processing = False
 if "last_audio_bytes" not in st.session_state:
     st.session_state.last_audio_bytes = None
 if "polly_voice" not in st.session_state:
     st.session_state.polly_voice = "Joanna"
-
-# Function to split text into chunks for Polly (max 3000 chars per request)
-def split_text_for_tts(text, max_chars=2800):
-    """Split text into chunks at sentence boundaries for TTS processing"""
-    if len(text) <= max_chars:
-        return [text]
-
-    chunks = []
-    current_chunk = ""
-
-    # Split by sentences (period, exclamation, question mark followed by space)
-    import re
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) + 1 <= max_chars:
-            current_chunk += sentence + " "
-        else:
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-            # If single sentence is too long, split by commas or just truncate
-            if len(sentence) > max_chars:
-                words = sentence.split()
-                current_chunk = ""
-                for word in words:
-                    if len(current_chunk) + len(word) + 1 <= max_chars:
-                        current_chunk += word + " "
-                    else:
-                        if current_chunk:
-                            chunks.append(current_chunk.strip())
-                        current_chunk = word + " "
-            else:
-                current_chunk = sentence + " "
-
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-
-    return chunks
+if "context" not in st.session_state:
+    st.session_state.context = ConversationContext()  # Token-budgeted prompt window
+    st.session_state.messages.restore_context(st.session_state.context)  # Rolling summary of a resumed chat
+if "history_window" not in st.session_state:
+    st.session_state.history_window = HISTORY_PAGE_SIZE  # Number of recent messages rendered
+if "active_turn" not in st.session_state:
+    st.session_state.active_turn = None  # TurnHandle of the turn currently being answered
+if "stream_audio" not in st.session_state:
+    st.session_state.stream_audio = True  # Speak each sentence while the reply is still streaming
+if "audio_format" not in st.session_state:
+    st.session_state.audio_format = DEFAULT_AUDIO_FORMAT  # Polly output format and sample rate
 
 # Function to generate TTS audio using AWS Polly with retry mechanism
 def generate_tts_audio(text, voice_id="Joanna", language="english", max_retries=2):
@@ -305,108 +283,32 @@ def generate_tts_audio(text, voice_id="Joanna", language="english", max_retries=
         text: The text to convert to speech
         voice_id: The Polly voice ID (used for English, ignored for other languages)
         language: The target language (maps to appropriate voice and language code)
-        max_retries: Number of retry attempts
+        max_retries: Number of retry attempts per chunk
     """
-    import time
-
-    # Get language-specific settings from mapping
-    lang_settings = POLLY_LANGUAGE_MAP.get(language.lower(), POLLY_LANGUAGE_MAP["english"])
-    language_code = lang_settings["code"]
-    engine = lang_settings.get("engine", "standard")
-
-    # Use language-specific voice for non-English, otherwise use selected voice
-    if language.lower() != "english":
-        voice_id = lang_settings["voice"]
-
-    # Clean text for TTS (remove markdown, emojis that might cause issues)
-    clean_text = text.replace("**", "").replace("*", "").replace("`", "")
-    clean_text = clean_text.replace("#", "").replace("---", "").replace("```", "")
-    clean_text = " ".join(clean_text.split())  # Normalize whitespace
-
-    # Split text into chunks if too long
-    text_chunks = split_text_for_tts(clean_text)
-    all_audio_bytes = []
-
-    for chunk in text_chunks:
-        if not chunk.strip():
-            continue
-
-        for attempt in range(max_retries + 1):
-            try:
-                # Call AWS Polly to synthesize speech
-                response = polly_client.synthesize_speech(
-                    Engine=engine,
-                    LanguageCode=language_code,
-                    OutputFormat='mp3',
-                    Text=chunk,
-                    VoiceId=voice_id
-                )
-
-                # Read the audio stream
-                if "AudioStream" in response:
-                    audio_bytes = response["AudioStream"].read()
-                    all_audio_bytes.append(audio_bytes)
-                    break
-                else:
-                    if attempt < max_retries:
-                        time.sleep(0.5)
-                        continue
-
-            except (BotoCoreError, ClientError) as e:
-                if attempt < max_retries:
-                    time.sleep(0.5)
-                    continue
-                st.error(f"❌ Audio generation failed: {str(e)}")
-                return None
-            except Exception as e:
-                if attempt < max_retries:
-                    time.sleep(0.5)
-                    continue
-                st.error(f"❌ TTS Error: {str(e)}")
-                return None
-
-    # Combine all audio chunks
-    if all_audio_bytes:
-        return b''.join(all_audio_bytes)
-    return None
-
-# Function to transcribe audio with language support
-def transcribe_audio(audio_bytes, language="en-US"):
-    """Convert audio bytes to text using speech recognition"""
-    recognizer = sr.Recognizer()
-
-    # Adjust recognizer settings for better accuracy
-    recognizer.energy_threshold = 300  # Adjust sensitivity
-    recognizer.dynamic_energy_threshold = True
-    recognizer.pause_threshold = 0.8  # Seconds of non-speaking audio before a phrase is complete
-
-    try:
-        # Save audio to temporary wav file for processing
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_audio:
-            temp_audio.write(audio_bytes)
-            temp_audio_path = temp_audio.name
-
-        # Load audio file and transcribe with specified language
-        with sr.AudioFile(temp_audio_path) as source:
-            # Adjust for ambient noise
-            recognizer.adjust_for_ambient_noise(source, duration=0.5)
-            audio_data = recognizer.record(source)
-
-            # Recognize speech in the specified language with show_all to get confidence
-            text = recognizer.recognize_google(audio_data, language=language, show_all=False)
-
-        # Clean up temp file
-        import os
-        os.unlink(temp_audio_path)
-
-        return text if text else "Could not detect speech. Please try again."
-    except sr.UnknownValueError:
-        return "Could not understand audio. Please speak louder and more clearly, then try again."
-    except sr.RequestError as e:
-        return f"Speech recognition service error: {e}. Please check your internet connection."
-    except Exception as e:
-        return f"Transcription error: {str(e)}. Please try recording again."
+    audio_bytes, failures = engine.synthesize(text, voice_id, language, max_retries, st.session_state.audio_format,
+                                              session_id=st.session_state.session_id)
+
+    if audio_bytes is None:
+        if failures:
+            st.error(f"❌ {failures[0][2]}")
+        return None
+
+    # Keep the parts that worked and report the ones that didn't
+    for number, count, error in failures:
+        st.warning(f"⚠️ Audio for part {number} of {count} is missing: {error}")
+    return audio_bytes
+
+def render_audio_player(audio_bytes):
+    """Show an audio player with the speaker icon next to it"""
+    # Create responsive columns for audio player (3:1 ratio for better mobile)
+    audio_col1, audio_col2 = st.columns([3, 1])
+    with audio_col1:
+        st.audio(audio_bytes, format=audio_mime(audio_bytes))
+    with audio_col2:
+        st.markdown(
+            "<p style='color: rgba(255,255,255,0.7); font-size: 0.8em; margin-top: 8px; text-align: center;'>🔊</p>",
+            unsafe_allow_html=True
+        )
 
 # Voice input section with microphone and text input
 st.markdown("""
@@ -442,99 +344,95 @@ user_input = st.text_input(
 
 st.markdown("</div>", unsafe_allow_html=True)
 
+def start_turn(audio=None, text=None):
+    """Start a pipeline turn for recorded audio or typed text
+
+    A turn from this session that is still running (e.g. the user recorded
+    again mid-answer) is cancelled first.
+    """
+    previous_turn = st.session_state.active_turn
+    if previous_turn is not None and not previous_turn.finished:
+        previous_turn.cancel()
+
+    new_turn = engine.start_turn(make_turn(
+        audio=audio,
+        text=text,
+        history=st.session_state.messages,
+        context=st.session_state.context,
+        voice_language=st.session_state.voice_language,
+        translate_to=st.session_state.translate_to if st.session_state.show_translation else None,
+        personality=st.session_state.personality,
+        voice_id=st.session_state.polly_voice,
+        tts_language=st.session_state.translate_to,
+        stream_audio=st.session_state.stream_audio,
+        audio_format=st.session_state.audio_format,
+        session_id=st.session_state.session_id,
+    ))
+    st.session_state.active_turn = new_turn
+    return new_turn
+
 # Process audio if recorded
+turn = None
+prompt = None
 if audio_bytes and audio_bytes != st.session_state.last_audio_bytes:
     st.session_state.last_audio_bytes = audio_bytes
 
-    # Transcribe audio using selected language
+    # Transcribe (and translate) using selected language; the reply starts
+    # streaming in the background as soon as the prompt is ready
+    turn = start_turn(audio=audio_bytes)
     with st.spinner("🎧 Processing your voice... Please wait."):
-        transcribed_text = transcribe_audio(audio_bytes, st.session_state.voice_language)
-
-    # Handle transcription result
-    if transcribed_text and not any(transcribed_text.startswith(prefix) for prefix in ["Error", "Could not", "Speech recognition", "Transcription error"]):
-        # Show original transcription
-        st.success(f"✅ **Heard you say:** {transcribed_text}")
-
-        # Translate if translation is enabled and target language is different
-        # Map speech recognition language codes to Google Translator language codes
-        lang_code_map = {
-            "en": "english",
-            "zh": "chinese (simplified)",
-            "yue": "chinese (traditional)",
-            "fr": "french"
-        }
-
-        source_lang_code = st.session_state.voice_language.split('-')[0]
-        source_lang = lang_code_map.get(source_lang_code, "auto")
-
-        if st.session_state.show_translation and source_lang != st.session_state.translate_to:
-            with st.spinner("🌐 Translating..."):
-                try:
-                    translated_text = GoogleTranslator(source=source_lang, target=st.session_state.translate_to).translate(transcribed_text)
-                    st.session_state.voice_text = translated_text
-                    st.info(f"🌐 **Translated to {st.session_state.translate_to}:** {translated_text}")
-                except Exception as e:
-                    # Silently use original text if translation fails
-                    st.session_state.voice_text = transcribed_text
-        else:
-            st.session_state.voice_text = transcribed_text
-    else:
-        st.error(f"❌ {transcribed_text}")
-        st.info("💡 **Tips for better recognition:**\n- Speak clearly and at a moderate pace\n- Reduce background noise\n- Hold the microphone closer\n- Ensure good internet connection")
+        for event in turn.events(stop_after=("prompt",)):
+            if event["type"] == "transcript":
+                # Show original transcription
+                st.success(f"✅ **Heard you say:** {event['text']}")
+            elif event["type"] == "translation":
+                st.info(f"🌐 **Translated to {event['target']}:** {event['text']}")
+            elif event["type"] == "warning":
+                st.warning(f"⚠️ {event['text']}")
+            elif event["type"] == "transcript_error":
+                st.error(f"❌ {event['text']}")
+                st.info("💡 **Tips for better recognition:**\n- Speak clearly and at a moderate pace\n- Reduce background noise\n- Hold the microphone closer\n- Ensure good internet connection")
+            elif event["type"] == "audio" and event["audio"]:
+                # The same advice, spoken (pre-synthesized at start-up)
+                render_audio_player(event["audio"])
+            elif event["type"] == "prompt":
+                prompt = event["text"]
 
 # Display chat history with audio players for assistant messages
-for idx, message in enumerate(st.session_state.messages):
+# Only the most recent window is rendered so reruns cost the same for long chats
+first_visible = max(0, len(st.session_state.messages) - st.session_state.history_window)
+if first_visible > 0:
+    if st.button(f"⬆️ Load earlier messages ({first_visible} hidden)", key="load_earlier", use_container_width=True):
+        st.session_state.history_window += HISTORY_PAGE_SIZE
+        st.rerun()
+
+for idx, message in enumerate(st.session_state.messages[first_visible:], start=first_visible):
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
     # Display audio player OUTSIDE chat_message for assistant messages
     if message["role"] == "assistant":
-        # Generate TTS if not already generated for this message
-        if idx not in st.session_state.tts_audio:
-            # Show warning for long messages
-            msg_length = len(message["content"])
-            if msg_length > 500:
-                st.markdown(
-                    "<p style='color: rgba(255,255,255,0.6); font-size: 0.85em; margin: 5px 0;'>"
-                    "⏳ Long message - audio generation may take a moment...</p>",
-                    unsafe_allow_html=True
-                )
-
-            with st.spinner("🎵 Generating audio..."):
-                audio_bytes = generate_tts_audio(message["content"], st.session_state.polly_voice, st.session_state.translate_to)
-                if audio_bytes:
-                    st.session_state.tts_audio[idx] = audio_bytes
-
-        # Display audio player with styled container
-        if idx in st.session_state.tts_audio:
-            # Create responsive columns for audio player (3:1 ratio for better mobile)
-            audio_col1, audio_col2 = st.columns([3, 1])
-            with audio_col1:
-                st.audio(st.session_state.tts_audio[idx], format="audio/mp3")
-            with audio_col2:
-                st.markdown(
-                    "<p style='color: rgba(255,255,255,0.7); font-size: 0.8em; margin-top: 8px; text-align: center;'>🔊</p>",
-                    unsafe_allow_html=True
-                )
-        elif message["content"].startswith("❌"):
-            # Don't show error for error messages
-            pass
-        else:
-            st.markdown(
-                "<p style='color: #e74c3c; font-size: 0.85em;'>❌ Audio unavailable - try refreshing</p>",
-                unsafe_allow_html=True
-            )
+        # Audio is never generated while re-rendering history, only when asked for
+        if idx not in st.session_state.tts_audio and not message["content"].startswith("❌"):
+            long_hint = " (long message - may take a moment)" if len(message["content"]) > 500 else ""
+            if st.button("🔊 Generate audio", key=f"tts_{idx}", help=f"Create audio for this message{long_hint}"):
+                with st.spinner("🎵 Generating audio..."):
+                    audio_bytes = generate_tts_audio(message["content"], st.session_state.polly_voice, st.session_state.translate_to)
+                    if audio_bytes:
+                        st.session_state.tts_audio[idx] = audio_bytes
+
+        # Display audio player with styled container (spilled clips are read back only here)
+        history_audio = st.session_state.tts_audio.get(idx)
+        if history_audio:
+            render_audio_player(history_audio)
 
         # Add subtle divider between messages
         st.markdown("<div style='margin: 15px 0;'></div>", unsafe_allow_html=True)
 
 # Determine prompt from voice or text
-prompt = None
-if st.session_state.voice_text:
-    prompt = st.session_state.voice_text
-    st.session_state.voice_text = ""  # Clear after using
-elif user_input:
+if prompt is None and user_input:
     prompt = user_input
+    turn = start_turn(text=user_input)
 
 if prompt:
     # Add user message to chat history
@@ -544,104 +442,83 @@ if prompt:
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Get AI response
+    # Get AI response (streamed by the pipeline engine)
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
         full_response = ""
-
-        # Create messages for API call including system prompt with personality
-        personality_prompts = {
-            "General Assistant": "You are a helpful and knowledgeable AI assistant. Provide clear, accurate, and useful information. Be friendly and professional in your responses."
-        }
-
-        system_prompt = personality_prompts[st.session_state.personality]
-
-        # Build conversation history for Gemini including system prompt
-        conversation_history = []
-
-        # Add system prompt as first user message if history is empty
-        if len(st.session_state.messages) == 1:  # Only current message
-            conversation_history.append({"role": "user", "parts": [system_prompt]})
-            conversation_history.append({"role": "model", "parts": ["Understood! I'm ready to assist you. How can I help you today?"]})
-
-        for msg in st.session_state.messages[:-1]:  # Exclude the current user message
-            if msg["role"] == "user":
-                conversation_history.append({"role": "user", "parts": [msg["content"]]})
-            else:
-                conversation_history.append({"role": "model", "parts": [msg["content"]]})
-
-        # Stream response from Hugging Face API
-        try:
-            # Build messages for the API
-            messages = []
-
-            # Add system prompt
-            messages.append({
-                "role": "system",
-                "content": system_prompt
-            })
-
-            # Add conversation history
-            for msg in st.session_state.messages[:-1]:  # Exclude current message
-                messages.append({
-                    "role": msg["role"] if msg["role"] == "user" else "assistant",
-                    "content": msg["content"]
-                })
-
-            # Add current user message
-            messages.append({
-                "role": "user",
-                "content": prompt
-            })
-
-            # Stream response from Hugging Face
-            for message in client.chat_completion(
-                messages=messages,
-                model="meta-llama/Llama-3.3-70B-Instruct",
-                max_tokens=2000,
-                stream=True,
-            ):
-                if message.choices and message.choices[0].delta.content:
-                    chunk_text = message.choices[0].delta.content
-                    full_response += chunk_text
-                    message_placeholder.markdown(full_response + "▌")
-
-            # Display final response
-            message_placeholder.markdown(full_response)
-
-        except Exception as e:
-            full_response = f"❌ Error: {str(e)}\n\nPlease check your HUGGINGFACE_TOKEN in the .env file."
-            message_placeholder.markdown(full_response)
+        answered_from_cache = False
+        # Tokens are buffered and the growing reply is re-rendered a few times per second
+        renderer = ThrottledRenderer(message_placeholder.markdown)
+
+        # Sentences are synthesized while the reply streams so the first one is playable early
+        segment_area = st.empty()
+        segment_container = segment_area.container()
+
+        for event in turn.events(stop_after=("response",), idle_timeout=renderer.interval):
+            if event["type"] == "token":
+                renderer.append(event["text"])
+            elif event["type"] == "idle":
+                renderer.flush()  # The model paused: show what is buffered
+            elif event["type"] == "audio_segment":
+                segment_container.audio(event["audio"], format=audio_mime(event["audio"]))
+            elif event["type"] == "response":
+                if event["error"] and event["retryable"]:
+                    full_response = f"❌ Error: {event['error']}\n\nThe language model is busy or unreachable right now. Please try again in a moment."
+                elif event["error"]:
+                    full_response = f"❌ Error: {event['error']}\n\nPlease check your HUGGINGFACE_TOKEN in the .env file."
+                else:
+                    full_response = event["text"]
+                    answered_from_cache = event["cached"]
+
+        # Display final response (always rendered, even if the last tokens were still buffered)
+        renderer.finish(full_response)
+        if answered_from_cache:
+            st.caption("⚡ Answered from cache")
+
+        # Wait for the remaining audio, then swap the segments for one player
+        reply_audio, failures, degraded = None, [], None
+        if not full_response.startswith("❌"):
+            if len(full_response) > 500 and not st.session_state.stream_audio:
+                st.markdown(
+                    "<p style='color: rgba(255,255,255,0.6); font-size: 0.85em; margin: 5px 0;'>"
+                    "⏳ Generating audio for long response...</p>",
+                    unsafe_allow_html=True
+                )
+            with st.spinner("🎵 Generating audio..."):
+                for event in turn.events():
+                    if event["type"] == "audio":
+                        reply_audio, failures, degraded = event["audio"], event["failures"], event["degraded"]
+        else:
+            # A spoken notice for the error (pre-synthesized, so it's instant)
+            for event in turn.events():
+                if event["type"] == "audio":
+                    reply_audio = event["audio"]
+        segment_area.empty()
 
     # Add assistant response to chat history
     st.session_state.messages.append({"role": "assistant", "content": full_response})
 
-    # Generate TTS for the new response (skip for error messages)
+    # Store TTS for the new response (error messages get their spoken notice)
     new_msg_idx = len(st.session_state.messages) - 1
-    if new_msg_idx not in st.session_state.tts_audio and not full_response.startswith("❌"):
-        # Show warning for long messages
-        if len(full_response) > 500:
-            st.markdown(
-                "<p style='color: rgba(255,255,255,0.6); font-size: 0.85em; margin: 5px 0;'>"
-                "⏳ Generating audio for long response...</p>",
-                unsafe_allow_html=True
-            )
-
-        with st.spinner("🎵 Generating audio..."):
-            audio_bytes = generate_tts_audio(full_response, st.session_state.polly_voice, st.session_state.translate_to)
-            if audio_bytes:
-                st.session_state.tts_audio[new_msg_idx] = audio_bytes
+    if reply_audio:
+        # Keep the parts that worked and report the ones that didn't
+        for number, count, error in failures:
+            st.warning(f"⚠️ Audio for part {number} of {count} is missing: {error}")
+        st.session_state.tts_audio[new_msg_idx] = reply_audio
+    elif failures:
+        st.error(f"❌ {failures[0][2]}")
+    elif degraded:
+        st.info(f"🔇 {degraded}. Showing the text reply only.")
 
     # Display audio player for the new response with styled layout
-    if new_msg_idx in st.session_state.tts_audio:
-        audio_col1, audio_col2 = st.columns([3, 1])
-        with audio_col1:
-            st.audio(st.session_state.tts_audio[new_msg_idx], format="audio/mp3")
-        with audio_col2:
-            st.markdown(
-                "<p style='color: rgba(255,255,255,0.7); font-size: 0.8em; margin-top: 8px; text-align: center;'>🔊</p>",
-                unsafe_allow_html=True
-            )
+    new_audio = st.session_state.tts_audio.get(new_msg_idx)
+    if new_audio:
+        render_audio_player(new_audio)
+
+    # Fold turns that no longer fit the prompt budget into the rolling summary
+    # (only when CONTEXT_SUMMARY is enabled), in the background on the engine loop
+    engine.start_fold_context(st.session_state.context, st.session_state.messages, st.session_state.session_id,
+                              on_folded=st.session_state.messages.save_context)
 
 # Sidebar with info
 with st.sidebar:
@@ -669,35 +546,108 @@ with st.sidebar:
         st.metric("💬 Messages", len(st.session_state.messages), help="Total messages in conversation")
         st.divider()
 
+    # Connection reuse for the shared Polly / Hugging Face clients
+    with st.expander("🔌 Connections", expanded=False):
+        for service, counts in connection_stats().items():
+            reuse = f"{counts['reuse_ratio']:.0%}" if counts["reuse_ratio"] is not None else "n/a"
+            st.markdown(f"**{service}:** {counts['requests']} requests, "
+                        f"{counts['new_connections']} connections opened, {reuse} reused")
+
+    # Per-stage latency and counters for this process (also served on /metrics)
+    if os.getenv("SHOW_DIAGNOSTICS", "false").lower() in ("1", "true", "yes"):
+        with st.expander("📊 Diagnostics", expanded=False):
+            stages = stage_summary()
+            if stages:
+                for stage, summary in sorted(stages.items()):
+                    st.markdown(f"**{stage}:** p50 {summary['p50'] * 1000:.0f} ms, "
+                                f"p95 {summary['p95'] * 1000:.0f} ms ({summary['count']} runs)")
+            else:
+                st.caption("No timings recorded yet.")
+
+            totals = {}
+            for (name, labels), value in counter_values().items():
+                totals[(name, ", ".join(v for _, v in labels))] = value
+            generation_seconds = totals.get(("llm_generation_seconds_total", ""), 0)
+            if generation_seconds:
+                st.markdown(f"**LLM throughput:** {totals[('llm_tokens_total', '')] / generation_seconds:.1f} tokens/s")
+            trimmed_seconds = totals.get(("audio_seconds_removed_total", ""), 0)
+            if trimmed_seconds:
+                st.markdown(f"**Audio trimmed before recognition:** {trimmed_seconds:.1f} s, "
+                            f"{totals[('audio_bytes_removed_total', '')] / 1024:.0f} KB")
+            for (name, label), value in sorted(totals.items()):
+                if name in ("retries_total", "errors_total"):
+                    st.markdown(f"**{name.replace('_total', '')} ({label}):** {value}")
+
+            collected = collected_values()
+            for cache in ("response", "tts", "translation"):
+                labels = (("cache", cache),)
+                hits = collected.get(("cache_hits_total", labels), 0)
+                lookups = hits + collected.get(("cache_misses_total", labels), 0)
+                if lookups:
+                    st.markdown(f"**{cache} cache:** {hits / lookups:.0%} hit rate ({lookups} lookups)")
+
+            # Requests waiting for an upstream rate limit right now
+            waiting = {}
+            for (name, labels), depth in collected.items():
+                if name == "scheduler_queue_depth" and depth:
+                    service = dict(labels)["service"]
+                    waiting[service] = waiting.get(service, 0) + depth
+            for service, depth in sorted(waiting.items()):
+                st.markdown(f"**{service} queue:** {depth} waiting")
+
+            report = warm_up_report()
+            if report is None:
+                st.caption("Warm-up still running.")
+            else:
+                stages = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in report["stages"].items())
+                st.markdown(f"**Warm-up:** {report['seconds']:.1f}s ({stages})")
+                if report.get("error"):
+                    st.markdown(f"**Warm-up failed:** {report['error']}")
+                if report["phrases"]:
+                    phrases = report["phrases"]
+                    st.markdown(f"**Pre-synthesized phrases:** {phrases['cached'] + phrases['synthesized']} ready, "
+                                f"{phrases['failed']} failed")
+
     # Voice & Audio Settings in Expander
     with st.expander("🔊 Voice & Audio Settings", expanded=True):
         # AWS Polly Voice Selection
         st.markdown("**AI Voice**")
 
-        polly_voice_options = {
-            "👩 Joanna (Female)": "Joanna",
-            "👨 Matthew (Male)": "Matthew",
-            "👧 Ivy (Child)": "Ivy",
-            "👩 Salli (Female)": "Salli",
-            "👨 Joey (Male)": "Joey",
-            "👩 Kendra (Female)": "Kendra",
-            "👨 Justin (Male)": "Justin"
-        }
-
         selected_voice = st.selectbox(
             "Select AI voice:",
-            options=list(polly_voice_options.keys()),
+            options=list(POLLY_VOICE_OPTIONS.keys()),
             index=0,
             label_visibility="collapsed",
             key="voice_select",
             help="Choose the voice for AI responses"
         )
 
-        new_voice = polly_voice_options[selected_voice]
+        new_voice = POLLY_VOICE_OPTIONS[selected_voice]
         if new_voice != st.session_state.polly_voice:
             st.session_state.polly_voice = new_voice
             # Clear cached audio when voice changes
-            st.session_state.tts_audio = {}
+            st.session_state.tts_audio.clear()
+
+        st.session_state.stream_audio = st.checkbox(
+            "⚡ Speak while typing",
+            value=st.session_state.stream_audio,
+            help="Start audio for each sentence as soon as it is written"
+        )
+
+        # Smaller formats use less memory and load faster on mobile connections
+        audio_format_options = dict(AUDIO_FORMAT_OPTIONS)
+        if DEFAULT_AUDIO_FORMAT not in audio_format_options.values():
+            audio_format_options[f"⚙️ {DEFAULT_AUDIO_FORMAT.name} · {DEFAULT_AUDIO_FORMAT.sample_rate} Hz"] = DEFAULT_AUDIO_FORMAT
+        format_labels = list(audio_format_options.keys())
+
+        selected_format = st.selectbox(
+            "Audio quality:",
+            options=format_labels,
+            index=list(audio_format_options.values()).index(DEFAULT_AUDIO_FORMAT),
+            key="audio_format_select",
+            help="Format and sample rate of the spoken replies"
+        )
+        st.session_state.audio_format = audio_format_options[selected_format]
 
         st.markdown("---")
 
@@ -779,8 +729,8 @@ with st.sidebar:
         - Select your language before recording
 
         **Audio Playback:**
-        - Each AI response has an audio player
-        - Change voice to regenerate audio
+        - Each new AI response gets an audio player
+        - After changing voice, click 🔊 Generate audio on older messages
         - Long messages may take longer
 
         **Translation:**
@@ -806,6 +756,8 @@ with st.sidebar:
 
     # Clear chat button at bottom
     if st.button("🗑️ Clear Chat History", use_container_width=True, help="Remove all messages and start fresh"):
-        st.session_state.messages = []
-        st.session_state.tts_audio = {}  # Also clear audio cache
+        st.session_state.messages.delete()  # Also from the conversation store
+        st.session_state.tts_audio.clear()  # Also clear audio cache
+        st.session_state.context.reset()
+        st.session_state.history_window = HISTORY_PAGE_SIZE
         st.rerun()
@@ -0,0 +1,155 @@
+import io
+import os
+import wave
+
+# Polly output formats and the sample rates each one accepts
+OUTPUT_FORMATS = {
+    "mp3": {"mime": "audio/mpeg", "sample_rates": ("8000", "16000", "22050", "24000")},
+    "ogg_vorbis": {"mime": "audio/ogg", "sample_rates": ("8000", "16000", "22050", "24000")},
+    # Polly returns raw 16-bit little-endian mono PCM; it is wrapped in a WAV container
+    "pcm": {"mime": "audio/wav", "sample_rates": ("8000", "16000")},
+}
+
+# Sample rate used when none is given (Polly's own default for mp3/ogg depends on the voice engine)
+DEFAULT_SAMPLE_RATES = {"mp3": "22050", "ogg_vorbis": "22050", "pcm": "16000"}
+
+
+class AudioFormat:
+    """A Polly output format and sample rate, e.g. AudioFormat("mp3", "16000")"""
+
+    def __init__(self, name="mp3", sample_rate=None):
+        if name not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported audio format '{name}'. Available: {', '.join(OUTPUT_FORMATS)}")
+        sample_rate = str(sample_rate or DEFAULT_SAMPLE_RATES[name])
+        if sample_rate not in OUTPUT_FORMATS[name]["sample_rates"]:
+            raise ValueError(f"{name} supports sample rates {', '.join(OUTPUT_FORMATS[name]['sample_rates'])} Hz, "
+                             f"not {sample_rate}")
+        self.name = name
+        self.sample_rate = sample_rate
+
+    @property
+    def mime(self):
+        return OUTPUT_FORMATS[self.name]["mime"]
+
+    @property
+    def cache_tag(self):
+        """Part of the audio cache key, so each format and rate is cached separately"""
+        return f"{self.name}@{self.sample_rate}"
+
+    def polly_params(self):
+        """Extra synthesize_speech arguments for this format"""
+        return {"OutputFormat": self.name, "SampleRate": self.sample_rate}
+
+    def __eq__(self, other):
+        return isinstance(other, AudioFormat) and self.cache_tag == other.cache_tag
+
+    def __hash__(self):
+        return hash(self.cache_tag)
+
+    def __repr__(self):
+        return f"AudioFormat({self.name!r}, {self.sample_rate!r})"
+
+
+def default_audio_format():
+    """The deployment's audio format from TTS_OUTPUT_FORMAT / TTS_SAMPLE_RATE"""
+    return AudioFormat(os.getenv("TTS_OUTPUT_FORMAT", "mp3"), os.getenv("TTS_SAMPLE_RATE") or None)
+
+
+# Formats offered in the app's "Audio quality" menu (and pre-synthesized by warm-up)
+AUDIO_FORMAT_OPTIONS = {
+    "🎵 MP3 · 22 kHz": AudioFormat("mp3", "22050"),
+    "📱 MP3 · 16 kHz (smaller)": AudioFormat("mp3", "16000"),
+    "🎶 Ogg Vorbis · 16 kHz": AudioFormat("ogg_vorbis", "16000"),
+    "📞 WAV · 16 kHz": AudioFormat("pcm", "16000"),
+    "📞 WAV · 8 kHz": AudioFormat("pcm", "8000"),
+}
+
+
+def audio_mime(audio_bytes):
+    """MIME type of an assembled clip, from its first bytes"""
+    if audio_bytes[:4] == b"RIFF":
+        return "audio/wav"
+    if audio_bytes[:4] == b"OggS":
+        return "audio/ogg"
+    return "audio/mpeg"
+
+
+# MP3 frame header tables (kbps, Hz) for Layer III
+_MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),  # MPEG-1
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),      # MPEG-2 / 2.5
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _mp3_frame_length(data, offset):
+    """Length of the Layer III frame starting at offset, or None if there is no valid header"""
+    if offset + 4 > len(data) or data[offset] != 0xFF or (data[offset + 1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (data[offset + 1] >> 3) & 0x03  # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    layer_bits = (data[offset + 1] >> 1) & 0x03    # 1 = Layer III
+    bitrate_index = data[offset + 2] >> 4
+    rate_index = (data[offset + 2] >> 2) & 0x03
+    padding = (data[offset + 2] >> 1) & 0x01
+    if version_bits == 1 or layer_bits != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _MP3_BITRATES[1 if version_bits == 3 else 2][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version_bits][rate_index]
+    samples_factor = 144 if version_bits == 3 else 72
+    return samples_factor * bitrate // sample_rate + padding
+
+
+def _strip_mp3_metadata(data):
+    """Return the MPEG audio frames of one clip without ID3 tags or a Xing/Info header frame
+
+    Every Polly chunk is a complete MP3 file. Their tags and per-file
+    Xing/Info headers (frame counts for one chunk only) would make the
+    joined stream report the wrong duration, so only audio frames are kept.
+    """
+    start, end = 0, len(data)
+    # ID3v2 tag: "ID3", version, flags, then a 4 byte syncsafe size
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        start = 10 + size + (10 if data[5] & 0x10 else 0)
+    # ID3v1 tag: the last 128 bytes start with "TAG"
+    if end - start >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+
+    frame_length = _mp3_frame_length(data, start)
+    if frame_length and (b"Xing" in data[start:start + 64] or b"Info" in data[start:start + 64]):
+        start += frame_length
+    return data[start:end]
+
+
+def _wav_container(pcm, sample_rate):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(int(sample_rate))
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def assemble_audio(chunks, audio_format):
+    """Join synthesized chunks into one valid clip of audio_format
+
+    Args:
+        chunks: Polly responses in playback order (raw bytes as returned by Polly)
+        audio_format: The AudioFormat the chunks were synthesized with
+
+    Returns:
+        pcm: one WAV file holding all samples.
+        mp3: one MPEG stream (ID3 tags and Xing/Info headers removed).
+        ogg_vorbis: a chained Ogg stream, one logical stream per chunk. Vorbis
+            chunks each carry their own codebooks, so they can't be merged into
+            a single logical stream without re-encoding; chaining is valid Ogg.
+    """
+    chunks = [chunk for chunk in chunks if chunk]
+    if not chunks:
+        return None
+    if audio_format.name == "pcm":
+        return _wav_container(b"".join(chunks), audio_format.sample_rate)
+    if audio_format.name == "mp3":
+        return b"".join(_strip_mp3_metadata(chunk) for chunk in chunks)
+    return b"".join(chunks)
@@ -0,0 +1,155 @@
+import io
+import os
+import time
+import wave
+
+import numpy as np
+
+import metrics
+
+# Speech recognizers work at 16 kHz; more only makes the upload bigger
+TARGET_SAMPLE_RATE = 16000
+# VAD frame size and how far above the noise floor a frame must be to count as speech
+VAD_FRAME_MS = 30
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "12"))
+# Speech is never required to be closer than this to the loudest frame, so a clip
+# that is all speech (no silence to measure a noise floor from) isn't trimmed into
+VAD_PEAK_RANGE_DB = 30
+# Frames quieter than this are always silence, even in a perfectly quiet recording
+VAD_MIN_SPEECH_DBFS = float(os.getenv("VAD_MIN_SPEECH_DBFS", "-45"))
+# Silence kept before and after speech so word onsets and endings aren't clipped
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "200"))
+
+# Taps of the low-pass filter applied before downsampling (odd, so it has a center tap)
+_FILTER_TAPS = 63
+
+
+def _read_samples(wav_file):
+    """Return (float32 array of shape (frames, channels) in [-1, 1], sample_rate)"""
+    channels = wav_file.getnchannels()
+    width = wav_file.getsampwidth()
+    raw = wav_file.readframes(wav_file.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768
+    elif width == 3:
+        # Pad each 24-bit sample to 32 bits (little-endian) and reuse the int32 path
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((packed.shape[0], 4), dtype=np.uint8)
+        padded[:, 1:] = packed
+        samples = padded.view("<i4").reshape(-1).astype(np.float32) / 2147483648
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width} bytes")
+
+    frames = len(samples) // channels
+    return samples[:frames * channels].reshape(frames, channels), wav_file.getframerate()
+
+
+def _lowpass_kernel(cutoff):
+    """Windowed-sinc low-pass FIR kernel, cutoff as a fraction of the sample rate"""
+    taps = np.arange(_FILTER_TAPS) - (_FILTER_TAPS - 1) / 2
+    kernel = np.sinc(2 * cutoff * taps) * np.hamming(_FILTER_TAPS)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+def resample(samples, source_rate, target_rate=TARGET_SAMPLE_RATE):
+    """Resample mono float samples with linear interpolation
+
+    When downsampling, a low-pass filter first removes frequencies above the
+    new Nyquist limit so they don't fold back into the speech band.
+    """
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+    if target_rate < source_rate:
+        samples = np.convolve(samples, _lowpass_kernel(0.5 * target_rate / source_rate), mode="same")
+    duration = len(samples) / source_rate
+    target_times = np.arange(int(duration * target_rate)) / target_rate
+    source_times = np.arange(len(samples)) / source_rate
+    return np.interp(target_times, source_times, samples).astype(np.float32)
+
+
+def speech_bounds(samples, sample_rate, frame_ms=VAD_FRAME_MS, margin_db=VAD_MARGIN_DB,
+                  min_speech_dbfs=VAD_MIN_SPEECH_DBFS, padding_ms=VAD_PADDING_MS):
+    """Energy-based VAD: (start, end) sample offsets of the speech, padded, or None if none found
+
+    A frame is speech when its RMS level is margin_db above the noise floor
+    (the 10th percentile frame level), or within VAD_PEAK_RANGE_DB of the
+    loudest frame, and above min_speech_dbfs. Pauses inside the speech are
+    kept; only leading and trailing silence is cut.
+    """
+    frame_size = max(1, sample_rate * frame_ms // 1000)
+    frame_count = len(samples) // frame_size
+    if frame_count == 0:
+        return None
+
+    frames = samples[:frame_count * frame_size].reshape(frame_count, frame_size)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    level_db = 20 * np.log10(np.maximum(rms, 1e-10))
+    noise_floor = np.percentile(level_db, 10)
+    threshold = max(min(noise_floor + margin_db, level_db.max() - VAD_PEAK_RANGE_DB), min_speech_dbfs)
+
+    speech = np.flatnonzero(level_db > threshold)
+    if len(speech) == 0:
+        return None
+    padding = sample_rate * padding_ms // 1000
+    start = max(0, speech[0] * frame_size - padding)
+    end = min(len(samples), (speech[-1] + 1) * frame_size + padding)
+    return start, end
+
+
+def _to_wav(samples, sample_rate):
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def preprocess_audio(audio_bytes, target_rate=TARGET_SAMPLE_RATE, trim_silence=True):
+    """Downmix to mono, resample to target_rate and trim leading/trailing silence
+
+    Args:
+        audio_bytes: A WAV recording (any channel count, 8-32 bit PCM)
+        target_rate: Output sample rate
+        trim_silence: Cut silence before and after the speech
+
+    Returns:
+        (wav_bytes, stats): a 16-bit mono WAV and a dict with input/output
+        bytes and seconds, bytes_removed, seconds_removed and speech_found.
+        A clip without detectable speech is returned untrimmed so the
+        recognizer still gets to decide.
+    """
+    start_time = time.perf_counter()
+    with wave.open(io.BytesIO(bytes(audio_bytes)), "rb") as wav_file:
+        samples, source_rate = _read_samples(wav_file)
+    input_seconds = len(samples) / source_rate if source_rate else 0.0
+
+    mono = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+    mono = resample(mono, source_rate, target_rate)
+
+    bounds = speech_bounds(mono, target_rate) if trim_silence else None
+    if bounds:
+        mono = mono[bounds[0]:bounds[1]]
+
+    output = _to_wav(mono, target_rate)
+    stats = {
+        "input_bytes": len(audio_bytes),
+        "output_bytes": len(output),
+        "bytes_removed": len(audio_bytes) - len(output),
+        "input_seconds": input_seconds,
+        "output_seconds": len(mono) / target_rate,
+        "seconds_removed": input_seconds - len(mono) / target_rate,
+        "speech_found": bounds is not None,
+    }
+
+    metrics.observe("stage_seconds", time.perf_counter() - start_time, stage="preprocess")
+    metrics.inc("audio_bytes_removed_total", max(0, stats["bytes_removed"]))
+    metrics.inc("audio_seconds_removed_total", max(0.0, stats["seconds_removed"]))
+    return output, stats
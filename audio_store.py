@@ -0,0 +1,294 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AudioStore:
+    """Process-wide store for the audio clips of every live session
+
+    Clips are kept in memory up to a per-session and a global byte quota.
+    Beyond that the oldest clips are spilled to disk (least recently active
+    sessions first for the global quota) and read back lazily when a player
+    asks for them. Sessions that stay idle for idle_seconds are dropped
+    (checked on writes, at most once every sweep_seconds).
+    """
+
+    def __init__(self, spill_dir, session_bytes=8 * 1024 * 1024,
+                 global_bytes=256 * 1024 * 1024, idle_seconds=30 * 60, sweep_seconds=60):
+        self.spill_dir = spill_dir
+        self.session_bytes = session_bytes
+        self.global_bytes = global_bytes
+        self.idle_seconds = idle_seconds
+        self.sweep_seconds = sweep_seconds
+        self._next_sweep = 0.0
+
+        self._lock = threading.Lock()
+        # session_id -> {"clips": OrderedDict(key -> bytes or None if spilled),
+        #                "memory": bytes held in memory, "last_access": time}
+        self._sessions = {}
+        self._memory = 0
+        # (session_id, key) -> bytes picked for spilling whose file isn't written yet
+        self._spilling = {}
+        self.spilled = 0
+        self.spill_failures = 0
+        self.reloaded = 0
+        self.evicted_sessions = 0
+
+    def _session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = {"clips": OrderedDict(), "memory": 0, "last_access": time.time()}
+            self._sessions[session_id] = session
+        return session
+
+    def _spill_path(self, session_id, key):
+        return os.path.join(self.spill_dir, session_id, f"{key}.audio")
+
+    def _spill_oldest(self, session_id, session, victims, keep=None):
+        """Pick the session's oldest in-memory clip to spill to disk (lock held)
+
+        The clip leaves the memory accounting at once and is appended to
+        victims; its bytes stay readable from _spilling until
+        _write_spills has put them on disk.
+        """
+        for key, audio in session["clips"].items():
+            if audio is None or key == keep or (session_id, key) in self._spilling:
+                continue
+            session["clips"][key] = None
+            session["memory"] -= len(audio)
+            self._memory -= len(audio)
+            self._spilling[(session_id, key)] = audio
+            victims.append((session_id, session, key, audio))
+            return True
+        return False
+
+    def _enforce_quotas(self, session_id, keep):
+        """Pick clips to spill until the session and global quotas hold (lock held)
+
+        Returns:
+            The victims to hand to _write_spills once the lock is released
+        """
+        victims = []
+        session = self._sessions[session_id]
+        while session["memory"] > self.session_bytes:
+            if not self._spill_oldest(session_id, session, victims, keep):
+                break
+
+        if self._memory <= self.global_bytes:
+            return victims
+        # Spill from the least recently active sessions first
+        by_activity = sorted(self._sessions.items(), key=lambda item: item[1]["last_access"])
+        for other_id, other in by_activity:
+            while self._memory > self.global_bytes and other["memory"] > 0:
+                if not self._spill_oldest(other_id, other, victims, keep if other_id == session_id else None):
+                    break
+            if self._memory <= self.global_bytes:
+                break
+        return victims
+
+    def _write_spills(self, victims):
+        """Write picked clips to disk (lock not held); a clip that can't be written is dropped"""
+        for session_id, session, key, audio in victims:
+            path = self._spill_path(session_id, key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(audio)
+                error = None
+            except OSError as e:
+                error = e
+
+            with self._lock:
+                if self._spilling.get((session_id, key)) is audio:
+                    del self._spilling[(session_id, key)]
+                # Still ours unless the session was dropped or the clip replaced meanwhile
+                live = self._sessions.get(session_id) is session and key in session["clips"] \
+                    and session["clips"][key] is None
+                if error is None:
+                    self.spilled += 1
+                elif live:
+                    del session["clips"][key]
+                    self.spill_failures += 1
+
+            if error is not None:
+                logger.warning("⚠️ Could not spill audio clip %s of session %s, dropping it: %s",
+                               key, session_id, error)
+            elif not live:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _drop_session(self, session_id):
+        """Forget a session (lock held)
+
+        Returns:
+            Its spill directory, for _delete_spill_dirs once the lock is released,
+            or None if there was no such session
+        """
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return None
+        self._memory -= session["memory"]
+        return os.path.join(self.spill_dir, session_id)
+
+    @staticmethod
+    def _delete_spill_dirs(directories):
+        """Delete dropped sessions' spilled files (lock not held)"""
+        for directory in directories:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def evict_idle(self):
+        """Drop every session that hasn't been touched for idle_seconds"""
+        now = time.time()
+        cutoff = now - self.idle_seconds
+        with self._lock:
+            self._next_sweep = now + self.sweep_seconds
+            directories = [self._drop_session(sid) for sid, s in list(self._sessions.items())
+                           if s["last_access"] < cutoff]
+            self.evicted_sessions += len(directories)
+        self._delete_spill_dirs(directories)
+
+    def put(self, session_id, key, audio):
+        with self._lock:
+            session = self._session(session_id)
+            session["last_access"] = time.time()
+            old = session["clips"].pop(key, None)
+            if old is not None:
+                session["memory"] -= len(old)
+                self._memory -= len(old)
+            session["clips"][key] = audio
+            session["memory"] += len(audio)
+            self._memory += len(audio)
+            victims = self._enforce_quotas(session_id, keep=key)
+        self._write_spills(victims)
+        if time.time() >= self._next_sweep:
+            self.evict_idle()
+
+    def contains(self, session_id, key):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session is not None and key in session["clips"]
+
+    def get(self, session_id, key):
+        """Return the clip bytes, reading spilled clips back from disk on demand"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or key not in session["clips"]:
+                return None
+            session["last_access"] = time.time()
+            audio = session["clips"][key]
+            if audio is not None:
+                return audio
+            pending = self._spilling.get((session_id, key))
+            if pending is not None:
+                return pending
+            path = self._spill_path(session_id, key)
+            self.reloaded += 1
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            with self._lock:
+                session["clips"].pop(key, None)
+            return None
+
+    def keys(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return list(session["clips"]) if session else []
+
+    def clear_session(self, session_id):
+        with self._lock:
+            directory = self._drop_session(session_id)
+        if directory is not None:
+            self._delete_spill_dirs([directory])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "memory_bytes": self._memory,
+                "clips": sum(len(s["clips"]) for s in self._sessions.values()),
+                "spilled": self.spilled,
+                "spill_failures": self.spill_failures,
+                "reloaded": self.reloaded,
+                "evicted_sessions": self.evicted_sessions,
+            }
+
+
+class SessionAudio:
+    """Dict-like view of one session's clips in the shared AudioStore
+
+    Supports `key in audio`, `audio[key]`, `audio[key] = clip` and clear(),
+    so it can stand in for the plain dict previously kept in session state.
+    """
+
+    def __init__(self, store, session_id):
+        self.store = store
+        self.session_id = session_id
+
+    def __contains__(self, key):
+        return self.store.contains(self.session_id, key)
+
+    def __getitem__(self, key):
+        audio = self.store.get(self.session_id, key)
+        if audio is None:
+            raise KeyError(key)
+        return audio
+
+    def get(self, key, default=None):
+        audio = self.store.get(self.session_id, key)
+        return default if audio is None else audio
+
+    def __setitem__(self, key, audio):
+        self.store.put(self.session_id, key, audio)
+
+    def keys(self):
+        return self.store.keys(self.session_id)
+
+    def clear(self):
+        self.store.clear_session(self.session_id)
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def get_audio_store():
+    """Return the process-wide session audio store, configured from env settings"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            spill_dir = os.getenv("AUDIO_SPILL_DIR") or os.path.join(tempfile.gettempdir(), "voice-assistant-audio")
+            _shared_store = AudioStore(
+                spill_dir=spill_dir,
+                session_bytes=int(float(os.getenv("SESSION_AUDIO_MB", "8")) * 1024 * 1024),
+                global_bytes=int(float(os.getenv("GLOBAL_AUDIO_MB", "256")) * 1024 * 1024),
+                idle_seconds=int(float(os.getenv("SESSION_IDLE_MINUTES", "30")) * 60),
+            )
+        return _shared_store
+
+
+def _store_samples():
+    """Export session audio memory and spill counters (metrics collector)"""
+    if _shared_store is None:
+        return []
+    stats = _shared_store.stats()
+    return [
+        ("session_audio_bytes", "gauge", {}, stats["memory_bytes"]),
+        ("session_audio_sessions", "gauge", {}, stats["sessions"]),
+        ("session_audio_spilled_total", "counter", {}, stats["spilled"]),
+        ("session_audio_spill_failures_total", "counter", {}, stats["spill_failures"]),
+    ]
+
+
+metrics.register_collector(_store_samples)
@@ -0,0 +1,397 @@
+"""Run a batch of recorded questions through the voice pipeline
+
+Takes a directory of WAV files (searched recursively) or a manifest and
+answers each recording like the app would: speech recognition, optional
+translation, the chat model and the spoken reply. Files are processed on a
+pool of worker processes; the number of requests in flight to each upstream
+service is bounded across the whole pool.
+
+Results are written as they complete: one JSON line per file in
+<output>/results.jsonl (transcript, translation, answer, timings, errors) and
+the reply audio in <output>/audio/. results.jsonl is also the checkpoint: a
+rerun with the same output directory skips files that already succeeded.
+
+A manifest is a JSON Lines file with one object per recording:
+{"path": "q1.wav", "id": "q1", "voice_language": "fr-FR", "translate_to": "english", ...}
+(id and the turn settings are optional), or a text file with one path per
+line. Relative paths are resolved against the manifest's directory.
+
+Usage:
+    python batch.py recordings/ --output answers/ --workers 4
+    python batch.py manifest.jsonl --output answers/ --max-llm 2 --retry-failed
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import wave
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file (before our modules read their settings)
+load_dotenv()
+
+from audio_format import AudioFormat, audio_mime  # noqa: E402
+from clients import get_hf_client, get_polly_client  # noqa: E402
+from pipeline import DEFAULT_PERSONALITY, PERSONALITY_PROMPTS, PipelineEngine, make_turn  # noqa: E402
+from scheduler import DEFAULT_RATE_LIMITS, rate_limit_for  # noqa: E402
+from stt import STTBackend, get_stt_backend, register_stt_backend  # noqa: E402
+
+# Requests in flight across all workers, per upstream service
+BATCH_MAX_STT = int(os.getenv("BATCH_MAX_STT", "4"))
+BATCH_MAX_LLM = int(os.getenv("BATCH_MAX_LLM", "4"))
+BATCH_MAX_TTS = int(os.getenv("BATCH_MAX_TTS", "8"))
+
+# Per-file settings a manifest may set (the command line gives the defaults)
+ITEM_SETTINGS = ("voice_language", "translate_to", "personality", "voice_id", "tts_language")
+
+RESULTS_FILE = "results.jsonl"
+AUDIO_EXTENSIONS = {"audio/mpeg": ".mp3", "audio/ogg": ".ogg", "audio/wav": ".wav"}
+
+
+def _item_id(path, root):
+    """A file-name-safe id from the path relative to root ("a/b.wav" -> "a__b")"""
+    relative = os.path.splitext(os.path.relpath(path, root))[0]
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", relative.replace(os.sep, "__"))
+
+
+def load_items(source):
+    """Return the batch as [{"id", "path", settings...}] from a directory or a manifest"""
+    if os.path.isdir(source):
+        items = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(".wav"):
+                    path = os.path.join(root, name)
+                    items.append({"id": _item_id(path, source), "path": path})
+        return items
+
+    base = os.path.dirname(os.path.abspath(source))
+    items = []
+    with open(source, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                try:
+                    entry = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{source}:{number}: invalid JSON ({e})") from e
+                if "path" not in entry:
+                    raise ValueError(f"{source}:{number}: entry has no \"path\"")
+            else:
+                entry = {"path": line}
+            entry["path"] = os.path.join(base, entry["path"])
+            entry.setdefault("id", _item_id(entry["path"], base))
+            items.append(entry)
+
+    duplicates = sorted(item_id for item_id, count in Counter(item["id"] for item in items).items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Duplicate ids in {source}: {', '.join(duplicates[:5])}")
+    return items
+
+
+def load_checkpoint(results_path, retry_failed=False):
+    """Ids already done according to results.jsonl (failed ones too unless retry_failed)"""
+    done = set()
+    if not os.path.exists(results_path):
+        return done
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # A line cut short when the last run was killed
+            if result.get("status") == "ok" or not retry_failed:
+                done.add(result["id"])
+            else:
+                done.discard(result["id"])
+    return done
+
+
+class _Limited:
+    """Holds a slot of a cross-process semaphore around each call to method"""
+
+    def __init__(self, target, method, slots):
+        self._target = target
+        self._method = method
+        self._slots = slots
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name != self._method:
+            return attribute
+
+        def call(*args, **kwargs):
+            self._slots.acquire()
+            try:
+                result = attribute(*args, **kwargs)
+            except BaseException:
+                self._slots.release()
+                raise
+            if kwargs.get("stream"):
+                return self._hold_while_streaming(result)
+            self._slots.release()
+            return result
+
+        return call
+
+    def _hold_while_streaming(self, stream):
+        # A streamed completion keeps its slot until it is read to the end or closed
+        try:
+            yield from stream
+        finally:
+            if hasattr(stream, "close"):
+                stream.close()
+            self._slots.release()
+
+
+class _LimitedSTTBackend(STTBackend):
+    """The configured STT backend, with a cross-process bound on concurrent recognitions"""
+
+    def __init__(self, backend, slots):
+        self.backend = backend
+        self.name = backend.name
+        self._slots = slots
+
+    def recognize(self, recognizer, audio_data, language):
+        with self._slots:
+            return self.backend.recognize(recognizer, audio_data, language)
+
+
+# Per-worker state, set by _init_worker
+_engine = None
+_settings = None
+
+
+def _init_worker(settings, limits, rate_limits):
+    """Build this worker's clients and pipeline engine"""
+    global _engine, _settings
+    _settings = settings
+    # This worker's share of the account rate limits (read when the schedulers are created)
+    os.environ.update(rate_limits)
+
+    # Recognition goes through the configured backend, wrapped (registered like any other backend)
+    stt_backend = get_stt_backend()
+    register_stt_backend("batch", lambda: _LimitedSTTBackend(stt_backend, limits["stt"]))
+    os.environ["STT_BACKEND"] = "batch"
+
+    hf_client = _Limited(get_hf_client(os.getenv("HUGGINGFACE_TOKEN")), "chat_completion", limits["llm"])
+    polly_client = _Limited(get_polly_client(), "synthesize_speech", limits["tts"])
+    _engine = PipelineEngine(hf_client, polly_client)
+
+
+def _wav_seconds(audio):
+    """Duration of a WAV recording, or None if it can't be read"""
+    try:
+        with wave.open(io.BytesIO(audio)) as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError, ZeroDivisionError):
+        return None
+
+
+def _process_item(item):
+    """Answer one recording in a worker; writes its audio and returns its result line"""
+    start = time.perf_counter()
+    result = {"id": item["id"], "path": item["path"], "status": "error", "transcript": None,
+              "translation": None, "prompt": None, "answer": None, "audio": None, "error": None,
+              "input_seconds": None, "stages": {}}
+    try:
+        with open(item["path"], "rb") as f:
+            audio = f.read()
+        result["input_seconds"] = _wav_seconds(audio)
+
+        settings = {name: item.get(name, _settings[name]) for name in ITEM_SETTINGS}
+        turn = _engine.start_turn(make_turn(audio=audio, audio_format=_settings["audio_format"],
+                                            session_id=item["id"], **settings))
+        deadline = time.monotonic() + _settings["item_timeout"]
+        for event in turn.events(idle_timeout=1.0):
+            elapsed = time.perf_counter() - start
+            if event["type"] == "transcript":
+                result["transcript"] = event["text"]
+                result["stages"]["transcript"] = elapsed
+            elif event["type"] == "transcript_error":
+                result["error"] = event["text"]
+            elif event["type"] == "translation":
+                result["translation"] = event["text"]
+            elif event["type"] == "prompt":
+                result["prompt"] = event["text"]
+            elif event["type"] == "response":
+                result["stages"]["answer"] = elapsed
+                if event["error"]:
+                    result["error"] = f"Chat model: {event['error']}"
+                else:
+                    result["answer"] = event["text"]
+            elif event["type"] == "audio" and result["answer"] is not None:
+                result["stages"]["audio"] = elapsed
+                if event["audio"]:
+                    result["audio"] = _write_audio(item["id"], event["audio"])
+                if event["failures"]:
+                    result["audio_error"] = event["failures"][0][2]
+                elif event["degraded"]:
+                    result["audio_error"] = event["degraded"]
+            if time.monotonic() > deadline and not turn.cancelled:
+                turn.cancel()
+                result["error"] = f"Timed out after {_settings['item_timeout']:g}s"
+        if result["answer"] is not None and result["error"] is None:
+            result["status"] = "ok"
+        elif result["error"] is None:
+            result["error"] = "Turn ended without a response"
+    except Exception as e:
+        result["error"] = str(e) or type(e).__name__
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _write_audio(item_id, audio):
+    """Write the reply clip next to the others (atomically) and return its path relative to the output"""
+    relative = os.path.join("audio", item_id + AUDIO_EXTENSIONS[audio_mime(audio)])
+    path = os.path.join(_settings["output"], relative)
+    with open(path + ".tmp", "wb") as f:
+        f.write(audio)
+    os.replace(path + ".tmp", path)
+    return relative
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def print_summary(results, skipped, wall_seconds):
+    """Print counts, throughput and per-stage latency for the files processed in this run"""
+    succeeded = [r for r in results if r["status"] == "ok"]
+    failed = len(results) - len(succeeded)
+    print(f"\n✅ {len(succeeded)} answered, ❌ {failed} failed, ⏭️ {skipped} skipped (already done)")
+    if not results:
+        return
+    input_seconds = sum(r["input_seconds"] or 0 for r in results)
+    print(f"⏱️ {wall_seconds:.1f}s wall, {len(results) / wall_seconds:.2f} files/s, "
+          f"{len(results) * 60 / wall_seconds:.1f} files/min, {input_seconds / wall_seconds:.1f}s of speech per second")
+    for stage in ("transcript", "answer", "audio"):
+        values = [r["stages"][stage] for r in results if stage in r["stages"]]
+        if values:
+            print(f"   {stage:<10} p50 {_percentile(values, 50):6.2f}s   p95 {_percentile(values, 95):6.2f}s")
+    errors = {}
+    for r in results:
+        if r["status"] != "ok":
+            error = r["error"] or "unknown error"
+            errors[error] = errors.get(error, 0) + 1
+    for error, count in sorted(errors.items(), key=lambda item: -item[1])[:5]:
+        print(f"   {count} × {error}")
+
+
+def run_batch(items, output, workers, limits, settings, retry_failed=False):
+    """Process items on a pool of worker processes; returns (results of this run, skipped count)"""
+    os.makedirs(os.path.join(output, "audio"), exist_ok=True)
+    results_path = os.path.join(output, RESULTS_FILE)
+    done = load_checkpoint(results_path, retry_failed)
+    pending = [item for item in items if item["id"] not in done]
+    skipped = len(items) - len(pending)
+
+    # Each worker gets an equal share of the per-process upstream rate limits
+    rate_limits = {}
+    for key in DEFAULT_RATE_LIMITS:
+        limit = rate_limit_for(key)
+        if limit:
+            rate, burst = limit
+            rate_limits[f"RATE_LIMIT_{key.upper()}"] = f"{rate / workers:g}/{max(1.0, burst / workers):g}"
+
+    context = multiprocessing.get_context()
+    slots = {service: context.BoundedSemaphore(max(1, limit)) for service, limit in limits.items()}
+    settings = dict(settings, output=output)
+
+    results = []
+    print(f"🎙️ {len(pending)} files to process on {workers} workers ({skipped} already done)")
+    with open(results_path, "a", encoding="utf-8") as results_file, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                initargs=(settings, slots, rate_limits)) as executor:
+        # Only a few files per worker are queued at once, so huge batches don't pile up in memory
+        queue = iter(pending)
+        in_flight = set()
+        try:
+            while True:
+                while len(in_flight) < workers * 2:
+                    item = next(queue, None)
+                    if item is None:
+                        break
+                    in_flight.add(executor.submit(_process_item, item))
+                if not in_flight:
+                    break
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    result["finished_at"] = time.time()
+                    # One flushed line per file: this is the checkpoint a rerun resumes from
+                    results_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    results_file.flush()
+                    os.fsync(results_file.fileno())
+                    results.append(result)
+                    mark = "✅" if result["status"] == "ok" else "❌"
+                    detail = "" if result["status"] == "ok" else f": {result['error'] or 'unknown error'}"
+                    print(f"{mark} [{skipped + len(results)}/{len(items)}] {result['id']} "
+                          f"({result['seconds']:.1f}s){detail}")
+        except KeyboardInterrupt:
+            print("\n⏹️ Interrupted: rerun the same command to resume")
+            executor.shutdown(wait=False, cancel_futures=True)
+    return results, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="Directory of WAV files, or a manifest (JSON Lines or one path per line)")
+    parser.add_argument("--output", default="batch_output", help="Results directory (also the checkpoint)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--max-stt", type=int, default=BATCH_MAX_STT, help="Recognitions in flight, all workers")
+    parser.add_argument("--max-llm", type=int, default=BATCH_MAX_LLM, help="Chat completions in flight, all workers")
+    parser.add_argument("--max-tts", type=int, default=BATCH_MAX_TTS, help="Polly requests in flight, all workers")
+    parser.add_argument("--retry-failed", action="store_true", help="Also redo files that failed in earlier runs")
+    parser.add_argument("--item-timeout", type=float, default=300, help="Seconds before a file is given up")
+    parser.add_argument("--voice-language", default="en-US", help="Speech recognition language code")
+    parser.add_argument("--translate-to", default=None, help="Translate transcripts to this language")
+    parser.add_argument("--personality", default=DEFAULT_PERSONALITY, choices=list(PERSONALITY_PROMPTS))
+    parser.add_argument("--voice-id", default="Joanna")
+    parser.add_argument("--tts-language", default="english", help="Language of the spoken reply")
+    parser.add_argument("--audio-format", default=os.getenv("TTS_OUTPUT_FORMAT", "mp3"))
+    parser.add_argument("--sample-rate", default=os.getenv("TTS_SAMPLE_RATE") or None)
+    args = parser.parse_args()
+
+    if not os.getenv("HUGGINGFACE_TOKEN"):
+        raise SystemExit("❌ HUGGINGFACE_TOKEN not found in .env file")
+    try:
+        audio_format = AudioFormat(args.audio_format, args.sample_rate)
+        items = load_items(args.source)
+    except (ValueError, OSError) as e:
+        raise SystemExit(f"❌ {e}")
+    if not items:
+        raise SystemExit(f"❌ No WAV files found in {args.source}")
+
+    settings = {
+        "voice_language": args.voice_language,
+        "translate_to": args.translate_to,
+        "personality": args.personality,
+        "voice_id": args.voice_id,
+        "tts_language": args.tts_language,
+        "audio_format": audio_format,
+        "item_timeout": args.item_timeout,
+    }
+    limits = {"stt": args.max_stt, "llm": args.max_llm, "tts": args.max_tts}
+    workers = max(1, args.workers)
+
+    start = time.perf_counter()
+    results, skipped = run_batch(items, args.output, workers, limits, settings, args.retry_failed)
+    print_summary(results, skipped, time.perf_counter() - start)
+    if any(result["status"] != "ok" for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Micro-benchmark: per-token vs throttled rendering of a streamed reply
+
+Streamlit re-sends the whole markdown element on every placeholder update,
+so the bytes sent to the browser are the sum of the text length at each
+render. Replays a token stream with a simulated clock through the previous
+per-token loop and through stream_render.ThrottledRenderer, and reports
+renders, bytes sent and the CPU time of the loop itself.
+
+Usage:
+    python benchmarks/bench_render.py
+    python benchmarks/bench_render.py --tokens-per-second 80 --fps 5
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream_render import ThrottledRenderer  # noqa: E402
+
+WORDS = ("the assistant streams each token of the answer as soon as the model "
+         "produces it, including **markdown**, lists and `code` spans").split()
+
+
+def make_tokens(count, seed=1234):
+    rng = random.Random(seed)
+    return [rng.choice(WORDS) + " " for _ in range(count)]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ByteCounter:
+    """Stands in for placeholder.markdown and counts what would be sent"""
+
+    def __init__(self):
+        self.renders = 0
+        self.bytes_sent = 0
+
+    def __call__(self, text):
+        self.renders += 1
+        self.bytes_sent += len(text.encode("utf-8"))
+
+
+def render_per_token(tokens, tokens_per_second):
+    """The previous loop: concatenate and re-render on every delta"""
+    sink = ByteCounter()
+    full_response = ""
+    for token in tokens:
+        full_response += token
+        sink(full_response + "▌")
+    sink(full_response)
+    return sink.renders, sink.bytes_sent
+
+
+def render_throttled(tokens, tokens_per_second, fps, max_pending):
+    clock = FakeClock()
+    sink = ByteCounter()
+    renderer = ThrottledRenderer(sink, fps=fps, max_pending=max_pending, clock=clock)
+    for token in tokens:
+        clock.now += 1.0 / tokens_per_second
+        renderer.append(token)
+    renderer.finish()
+    return renderer.renders, renderer.bytes_sent
+
+
+def cpu_time(func, *args):
+    start = time.process_time()
+    result = func(*args)
+    return result, time.process_time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens-per-second", type=float, default=40, help="Simulated model speed")
+    parser.add_argument("--fps", type=float, default=10, help="Throttled renders per second")
+    parser.add_argument("--max-pending", type=int, default=400, help="Flush once this many chars are buffered")
+    args = parser.parse_args()
+
+    print(f"{'tokens':>7} {'renders before':>15} {'renders after':>14} {'KB before':>10} {'KB after':>9} "
+          f"{'saved':>7} {'cpu before':>11} {'cpu after':>10}")
+    for count in (200, 500, 2000):
+        tokens = make_tokens(count)
+        (before_renders, before_bytes), before_cpu = cpu_time(render_per_token, tokens, args.tokens_per_second)
+        (after_renders, after_bytes), after_cpu = cpu_time(
+            render_throttled, tokens, args.tokens_per_second, args.fps, args.max_pending
+        )
+        print(f"{count:>7} {before_renders:>15} {after_renders:>14} {before_bytes / 1024:>10.0f} "
+              f"{after_bytes / 1024:>9.0f} {1 - after_bytes / before_bytes:>7.1%} "
+              f"{before_cpu * 1000:>9.1f}ms {after_cpu * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
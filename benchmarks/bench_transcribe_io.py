@@ -0,0 +1,98 @@
+"""Micro-benchmark: temp-file vs in-memory audio loading for transcribe_audio
+
+Compares the old NamedTemporaryFile + sr.AudioFile(path) path with the
+in-memory path used by stt.load_audio_data. Only the audio loading part is
+timed (no network recognition call).
+
+Usage:
+    python benchmarks/bench_transcribe_io.py
+    python benchmarks/bench_transcribe_io.py --fixtures path/to/wavs --repeat 50
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import speech_recognition as sr  # noqa: E402
+
+from benchmarks.fakes import make_wav  # noqa: E402
+from stt import borrowed_recognizer, load_audio_data  # noqa: E402
+
+
+def default_fixtures():
+    """A small set of clips similar to what the browser recorder produces"""
+    return {
+        "2s_16k_mono": make_wav(2, 16000, 1),
+        "5s_44k_mono": make_wav(5, 44100, 1),
+        "5s_48k_stereo": make_wav(5, 48000, 2),
+        "15s_44k_stereo": make_wav(15, 44100, 2),
+    }
+
+
+def load_fixtures(directory):
+    fixtures = {}
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(".wav"):
+            with open(os.path.join(directory, name), "rb") as f:
+                fixtures[name] = f.read()
+    return fixtures
+
+
+def load_via_tempfile(audio_bytes):
+    """The previous transcribe_audio path: new Recognizer + temp file on disk"""
+    recognizer = sr.Recognizer()
+    recognizer.energy_threshold = 300
+    recognizer.dynamic_energy_threshold = True
+    recognizer.pause_threshold = 0.8
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_audio:
+        temp_audio.write(audio_bytes)
+        temp_audio_path = temp_audio.name
+    try:
+        with sr.AudioFile(temp_audio_path) as source:
+            recognizer.adjust_for_ambient_noise(source, duration=0.5)
+            return recognizer.record(source)
+    finally:
+        os.unlink(temp_audio_path)
+
+
+def load_in_memory(audio_bytes):
+    with borrowed_recognizer() as recognizer:
+        return load_audio_data(recognizer, audio_bytes)
+
+
+def time_path(func, audio_bytes, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(audio_bytes)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", help="Directory of .wav files (default: generated clips)")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per fixture and path")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else default_fixtures()
+
+    print(f"{'fixture':<20} {'size':>10} {'tempfile p50':>14} {'memory p50':>12} {'speedup':>8}")
+    for name, audio_bytes in fixtures.items():
+        # Warm up both paths once (imports, recognizer pool)
+        load_via_tempfile(audio_bytes)
+        load_in_memory(audio_bytes)
+
+        temp_p50 = time_path(load_via_tempfile, audio_bytes, args.repeat)
+        memory_p50 = time_path(load_in_memory, audio_bytes, args.repeat)
+        print(f"{name:<20} {len(audio_bytes):>10} {temp_p50 * 1000:>12.2f}ms "
+              f"{memory_p50 * 1000:>10.2f}ms {temp_p50 / memory_p50:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
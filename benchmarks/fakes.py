@@ -0,0 +1,164 @@
+"""Local stand-ins for Polly, the Hugging Face InferenceClient and the recognizer
+
+They mimic the response shapes the app relies on, with configurable latency
+and jitter, so the real code paths can be measured without credentials.
+"""
+import io
+import math
+import random
+import struct
+import time
+import wave
+
+import stt
+
+
+def _sleep(latency, jitter, rng):
+    """Sleep latency seconds +/- up to jitter seconds"""
+    delay = latency + rng.uniform(-jitter, jitter) if jitter else latency
+    if delay > 0:
+        time.sleep(delay)
+
+
+class FakePollyClient:
+    """Mimics boto3 polly.synthesize_speech / describe_voices
+
+    Latency is base_latency plus per_char_latency for each character, so long
+    chunks take longer like the real service.
+    """
+
+    def __init__(self, base_latency=0.08, per_char_latency=0.00002, jitter=0.02,
+                 bytes_per_char=180, seed=None):
+        self.base_latency = base_latency
+        self.per_char_latency = per_char_latency
+        self.jitter = jitter
+        self.bytes_per_char = bytes_per_char
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+        # boto3 clients expose an event system; clients.py registers on it
+        class _Events:
+            def register(self, *args, **kwargs):
+                pass
+
+        class _Meta:
+            events = _Events()
+
+        self.meta = _Meta()
+
+    def synthesize_speech(self, Text, OutputFormat="mp3", SampleRate="22050", **kwargs):
+        self.calls += 1
+        _sleep(self.base_latency + self.per_char_latency * len(Text), self.jitter, self._rng)
+        # bytes_per_char is for 22 kHz; lower rates produce proportionally less audio
+        size = len(Text) * self.bytes_per_char * int(SampleRate) // 22050
+        if OutputFormat == "pcm":
+            # Uncompressed 16-bit samples are ~7x the size of 48 kbps MP3
+            return {"AudioStream": io.BytesIO(b"\x00" * (size * 7 // 2 * 2)), "ContentType": "audio/pcm"}
+        if OutputFormat == "ogg_vorbis":
+            return {"AudioStream": io.BytesIO(b"OggS" + b"\x00" * size), "ContentType": "audio/ogg"}
+        return {"AudioStream": io.BytesIO(b"\xff\xfb" + b"\x00" * size), "ContentType": "audio/mpeg"}
+
+    def describe_voices(self, **kwargs):
+        _sleep(self.base_latency, self.jitter, self._rng)
+        return {"Voices": []}
+
+
+class _Delta:
+    def __init__(self, content):
+        self.content = content
+
+
+class _Choice:
+    def __init__(self, content):
+        self.delta = _Delta(content)
+        self.message = _Delta(content)
+
+
+class _Chunk:
+    def __init__(self, content):
+        self.choices = [_Choice(content)]
+
+
+DEFAULT_REPLY = (
+    "Sure! Here is a short overview. The app records your voice, transcribes it and "
+    "optionally translates it. Then the language model writes an answer, which is "
+    "streamed back token by token. Finally, each sentence is turned into speech. "
+    "Let me know if you would like more detail on any of these steps!"
+)
+
+
+class FakeInferenceClient:
+    """Mimics InferenceClient.chat_completion, streaming or not
+
+    The reply is streamed one word at a time after time_to_first_token, with
+    token_latency between tokens.
+    """
+
+    def __init__(self, reply=DEFAULT_REPLY, time_to_first_token=0.25, token_latency=0.01,
+                 jitter=0.005, seed=None):
+        self.reply = reply
+        self.time_to_first_token = time_to_first_token
+        self.token_latency = token_latency
+        self.jitter = jitter
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    def _tokens(self):
+        words = self.reply.split(" ")
+        return [word + " " for word in words[:-1]] + words[-1:]
+
+    def chat_completion(self, messages, model=None, max_tokens=None, stream=False, **kwargs):
+        self.calls += 1
+        if not stream:
+            _sleep(self.time_to_first_token + self.token_latency * len(self._tokens()), self.jitter, self._rng)
+            return _Chunk(self.reply)
+        return self._stream()
+
+    def _stream(self):
+        _sleep(self.time_to_first_token, self.jitter, self._rng)
+        for token in self._tokens():
+            yield _Chunk(token)
+            _sleep(self.token_latency, self.jitter / 4, self._rng)
+
+
+class FakeRecognizerBackend(stt.STTBackend):
+    """STT backend that mimics recognize_google's network latency
+
+    Latency grows with the clip length (upload and decoding), per_second_latency
+    for every second of audio sent.
+    """
+
+    name = "fake"
+
+    def __init__(self, transcript="What can you help me with today?", latency=0.3, per_second_latency=0.03,
+                 jitter=0.05, seed=None):
+        self.transcript = transcript
+        self.latency = latency
+        self.per_second_latency = per_second_latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+
+    def recognize(self, recognizer, audio_data, language):
+        # Touch the audio like the real client does when it encodes FLAC
+        raw = audio_data.get_raw_data(convert_rate=16000, convert_width=2)
+        seconds = len(raw) / (16000 * 2)
+        _sleep(self.latency + self.per_second_latency * seconds, self.jitter, self._rng)
+        return self.transcript
+
+
+def make_wav(seconds, sample_rate=16000, channels=1, frequency=440.0):
+    """Build a WAV clip with a tone surrounded by silence"""
+    frames = int(seconds * sample_rate)
+    samples = []
+    for i in range(frames):
+        in_tone = frames // 4 <= i < frames * 3 // 4
+        value = int(8000 * math.sin(2 * math.pi * frequency * i / sample_rate)) if in_tone else 0
+        samples.extend([value] * channels)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(struct.pack(f"<{len(samples)}h", *samples))
+    return buffer.getvalue()
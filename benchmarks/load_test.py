@@ -0,0 +1,394 @@
+"""Multi-session load test: many simulated users driving app.py at once
+
+The app runs in a real `streamlit run` server (benchmarks/load_test_app.py:
+app.py with Polly, Hugging Face and the recognizer replaced by the local
+fakes from benchmarks/fakes.py). Every simulated user is a browser-like
+websocket session speaking Streamlit's protocol, so sessions share the
+server's process-wide clients, caches and pipeline engine exactly like real
+users on one instance. Sessions type prompts and send recorded WAV clips
+(as the recorder component's value) with a think time between turns.
+
+For every concurrency level it reports p50/p95/p99 turn latency (a full
+rerun: prompt to reply text and audio on screen), time to first token and
+time to first audio (from the server's Prometheus histograms), the server's
+CPU use and resident memory, then the highest level that stays within the
+--slo-p95 turn latency.
+
+Usage:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --sessions 1,4,8,16,32 --turns 6 --think-time 2 --voice-ratio 0.5
+    python benchmarks/load_test.py --ttft 0.8 --polly-latency 0.2 --json capacity.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import make_wav  # noqa: E402
+from benchmarks.run_benchmarks import percentile  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, "benchmarks", "load_test_app.py")
+
+PROMPTS = (
+    "What can you help me with today?",
+    "Explain how speech recognition works in two sentences.",
+    "Give me three tips for a good night's sleep.",
+    "Summarize the plot of a famous novel.",
+    "How do I make a simple tomato sauce?",
+)
+
+# Histogram bucket bounds -> count lines of the server's stage_seconds metric
+_BUCKET_RE = re.compile(r'^voice_stage_seconds_bucket\{(?P<labels>[^}]*)\} (?P<count>\S+)$', re.M)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class AppServer:
+    """`streamlit run benchmarks/load_test_app.py` in a subprocess, on free local ports"""
+
+    def __init__(self, args):
+        self.port = free_port()
+        self.metrics_port = free_port()
+        env = dict(
+            os.environ,
+            HUGGINGFACE_TOKEN=os.getenv("HUGGINGFACE_TOKEN", "load-test"),
+            # Every session shares the process-wide memory caches, like on a real instance
+            TTS_CACHE_DIR="",
+            TRANSLATION_CACHE_DIR="",
+            # Conversations are really stored (SQLite), in a throwaway file
+            CONVERSATION_DB=os.getenv("CONVERSATION_DB") or os.path.join(
+                tempfile.mkdtemp(prefix="load-test-"), "conversations.db"),
+            # Voice turns use the fake recognizer registered by load_test_app.py
+            STT_BACKEND="fake",
+            METRICS_PORT=str(self.metrics_port),
+            LOAD_TEST_TTFT=str(args.ttft),
+            LOAD_TEST_TOKEN_LATENCY=str(args.token_latency),
+            LOAD_TEST_POLLY_LATENCY=str(args.polly_latency),
+            LOAD_TEST_STT_LATENCY=str(args.stt_latency),
+            LOAD_TEST_SEED=str(args.seed),
+        )
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", APP_PATH,
+             "--server.headless", "true", "--server.address", "127.0.0.1", "--server.port", str(self.port),
+             "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false",
+             # Recordings travel as widget values
+             "--server.maxMessageSize", "64"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        self.url = f"ws://127.0.0.1:{self.port}/_stcore/stream"
+        self._wait_until_healthy(args.timeout)
+
+    def _wait_until_healthy(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"streamlit run exited: {self.process.stderr.read()[-2000:]}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/_stcore/health", timeout=1) as response:
+                    if response.status == 200:
+                        return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        self.close()
+        raise RuntimeError(f"streamlit run didn't answer within {timeout:g}s")
+
+    def stage_buckets(self):
+        """{stage: [(upper bound, cumulative count)]} of the server's stage_seconds histogram"""
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{self.metrics_port}/metrics", timeout=5) as response:
+                text = response.read().decode()
+        except OSError:
+            return {}
+        buckets = {}
+        for match in _BUCKET_RE.finditer(text):
+            labels = dict(re.findall(r'(\w+)="([^"]*)"', match.group("labels")))
+            bound = float("inf") if labels["le"] == "+Inf" else float(labels["le"])
+            buckets.setdefault(labels.get("stage", ""), []).append((bound, float(match.group("count"))))
+        return {stage: sorted(pairs) for stage, pairs in buckets.items()}
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def histogram_quantile(before, after, q):
+    """q-quantile (0..1) of the samples added between two bucket snapshots, like Prometheus does
+
+    Interpolates linearly inside the bucket holding the quantile; None without samples.
+    """
+    earlier = dict(before)
+    counts = [(bound, count - earlier.get(bound, 0)) for bound, count in after]
+    if not counts or counts[-1][1] <= 0:
+        return None
+    rank = q * counts[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, count in counts:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / max(count - lower_count, 1e-9)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+class ResourceSampler:
+    """Samples a process's CPU time and resident memory (from /proc) in a background thread"""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.rss_samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+
+    def rss_bytes(self):
+        try:
+            with open(f"/proc/{self.pid}/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return None  # No /proc (e.g. macOS)
+
+    def cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                # Fields after the command name; utime and stime are the 12th and 13th
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def _sample(self):
+        rss = self.rss_bytes()
+        if rss is not None:
+            self.rss_samples.append(rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = self.cpu_seconds()
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        self.wall_seconds = time.perf_counter() - self._wall
+        cpu = self.cpu_seconds()
+        self.cpu_used = cpu - self._cpu if cpu is not None and self._cpu is not None else None
+
+
+class BrowserSession:
+    """One app session over Streamlit's websocket protocol, as the browser frontend drives it
+
+    Reruns send the current widget values (the message box and the recorder
+    component); a rerun is complete when the script run that it started
+    finishes, including any st.rerun() it triggers.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.page_script_hash = ""
+        self.widget_ids = {}  # "text" / "recorder" -> widget id, from the rendered elements
+        self.values = {}      # "text" / "recorder" -> WidgetState value field and value
+        self.exceptions = []
+        self._finished = None
+
+    async def rerun(self, timeout):
+        self._finished = asyncio.get_running_loop().create_future()
+        message = BackMsg()
+        message.rerun_script.page_script_hash = self.page_script_hash
+        for name, (field, value) in self.values.items():
+            if name in self.widget_ids:
+                state = WidgetState(id=self.widget_ids[name])
+                setattr(state, field, value)
+                message.rerun_script.widget_states.widgets.append(state)
+        await self.websocket.send(message.SerializeToString())
+        await asyncio.wait_for(self._receive_until_finished(), timeout)
+
+    async def _receive_until_finished(self):
+        while True:
+            message = ForwardMsg()
+            message.ParseFromString(await self.websocket.recv())
+            kind = message.WhichOneof("type")
+            if kind == "new_session":
+                self.page_script_hash = message.new_session.main_script_hash
+            elif kind == "delta" and message.delta.WhichOneof("type") == "new_element":
+                self._see_element(message.delta.new_element)
+            elif kind == "script_finished" and message.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return
+
+    def _see_element(self, element):
+        kind = element.WhichOneof("type")
+        if kind == "text_input" and element.text_input.label == "Message Input":
+            self.widget_ids["text"] = element.text_input.id
+        elif kind == "component_instance" and "audio_recorder" in element.component_instance.component_name:
+            self.widget_ids["recorder"] = element.component_instance.id
+        elif kind == "exception":
+            self.exceptions.append(element.exception.message)
+
+    def type_text(self, text):
+        self.values["text"] = ("string_value", text)
+
+    def record(self, wav):
+        # The component returns JSON of the clip's byte list, which audio_recorder() decodes
+        self.values["recorder"] = ("json_value", json.dumps(json.dumps(list(wav))))
+
+
+async def run_session(index, args, server, recordings, latencies, errors, start_barrier):
+    """One simulated user: open the app, then alternate think time and turns"""
+    rng = random.Random(args.seed + index)
+    try:
+        async with websockets.connect(server.url, subprotocols=["streamlit"], max_size=None) as websocket:
+            session = BrowserSession(websocket)
+            await session.rerun(args.timeout)
+            await start_barrier.wait()
+            for turn in range(args.turns):
+                # Exponential think time, so sessions don't march in lockstep
+                await asyncio.sleep(rng.expovariate(1 / args.think_time) if args.think_time else 0)
+
+                start = time.perf_counter()
+                if rng.random() < args.voice_ratio:
+                    # A different clip than last time, so the app treats it as a new recording
+                    session.record(recordings[turn % len(recordings)])
+                    await session.rerun(args.timeout)
+                else:
+                    session.type_text(rng.choice(PROMPTS))
+                    await session.rerun(args.timeout)
+                    # Empty the box without a rerun, like the browser after the message was sent
+                    session.type_text("")
+                latencies.append(time.perf_counter() - start)
+
+                errors.extend(session.exceptions)
+                session.exceptions.clear()
+    except Exception as e:
+        errors.append(f"session {index}: {e!r}")
+        await start_barrier.abort()
+
+
+async def run_sessions(sessions, args, server, recordings, latencies, errors):
+    barrier = asyncio.Barrier(sessions)
+    await asyncio.gather(*(run_session(i, args, server, recordings, latencies, errors, barrier)
+                           for i in range(sessions)))
+
+
+def run_level(sessions, args, server, recordings):
+    latencies, errors = [], []
+    buckets_before = server.stage_buckets()
+    with ResourceSampler(server.process.pid) as usage:
+        asyncio.run(run_sessions(sessions, args, server, recordings, latencies, errors))
+    buckets_after = server.stage_buckets()
+
+    def pct(values, p):
+        return percentile(values, p) * 1000 if values else None
+
+    def stage_pct(stage, p):
+        value = histogram_quantile(buckets_before.get(stage, []), buckets_after.get(stage, []), p / 100)
+        return value * 1000 if value is not None else None
+
+    return {
+        "sessions": sessions,
+        "turns": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "turn_p50_ms": pct(latencies, 50),
+        "turn_p95_ms": pct(latencies, 95),
+        "turn_p99_ms": pct(latencies, 99),
+        "ttft_p50_ms": stage_pct("llm_first_token", 50),
+        "ttft_p95_ms": stage_pct("llm_first_token", 95),
+        "audio_p50_ms": stage_pct("first_audio", 50),
+        "audio_p95_ms": stage_pct("first_audio", 95),
+        "turns_per_s": len(latencies) / usage.wall_seconds,
+        "cpu_cores": usage.cpu_used / usage.wall_seconds if usage.cpu_used is not None else None,
+        "rss_mb": sum(usage.rss_samples) / len(usage.rss_samples) / 1024 / 1024 if usage.rss_samples else None,
+        "rss_peak_mb": max(usage.rss_samples) / 1024 / 1024 if usage.rss_samples else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--turns", type=int, default=4, help="Turns per session at each level")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean seconds between a session's turns")
+    parser.add_argument("--voice-ratio", type=float, default=0.3, help="Share of turns sent as recordings")
+    parser.add_argument("--clip-seconds", type=float, default=3.0, help="Length of the WAV fixtures")
+    parser.add_argument("--polly-latency", type=float, default=0.08, help="Fake Polly base latency (s)")
+    parser.add_argument("--ttft", type=float, default=0.25, help="Fake LLM time to first token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Fake LLM seconds per token")
+    parser.add_argument("--stt-latency", type=float, default=0.3, help="Fake recognizer base latency (s)")
+    parser.add_argument("--slo-p95", type=float, default=3.0, help="p95 turn latency (s) a level must meet")
+    parser.add_argument("--timeout", type=float, default=120, help="Max seconds for one app rerun")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    # Two alternating fixtures: consecutive recordings always differ
+    recordings = [make_wav(args.clip_seconds, 16000, 1, frequency) for frequency in (440.0, 523.0)]
+    server = AppServer(args)
+
+    print(f"{'sessions':>8} {'turns':>6} {'err':>4} {'turn p50':>9} {'p95':>7} {'p99':>7} "
+          f"{'ttft p50':>9} {'p95':>6} {'audio p50':>10} {'p95':>6} {'turns/s':>8} {'cpu':>5} {'rss MB':>7}")
+    results = []
+    try:
+        for sessions in (int(level) for level in args.sessions.split(",")):
+            result = run_level(sessions, args, server, recordings)
+            results.append(result)
+
+            def fmt(value, spec=".0f"):
+                return format(value, spec) if value is not None else "-"
+
+            print(f"{sessions:>8} {result['turns']:>6} {result['errors']:>4} {fmt(result['turn_p50_ms']):>9} "
+                  f"{fmt(result['turn_p95_ms']):>7} {fmt(result['turn_p99_ms']):>7} {fmt(result['ttft_p50_ms']):>9} "
+                  f"{fmt(result['ttft_p95_ms']):>6} {fmt(result['audio_p50_ms']):>10} {fmt(result['audio_p95_ms']):>6} "
+                  f"{result['turns_per_s']:>8.2f} {fmt(result['cpu_cores'], '.2f'):>5} "
+                  f"{fmt(result['rss_peak_mb']):>7}")
+            for error in result["error_samples"]:
+                print(f"         ! {error}")
+    finally:
+        server.close()
+
+    within_slo = [r["sessions"] for r in results
+                  if not r["errors"] and r["turn_p95_ms"] is not None and r["turn_p95_ms"] <= args.slo_p95 * 1000]
+    if within_slo:
+        print(f"\nCapacity: {max(within_slo)} concurrent sessions within a p95 turn latency of {args.slo_p95:g} s "
+              f"({os.cpu_count()} CPUs)")
+    else:
+        print(f"\nNo level met a p95 turn latency of {args.slo_p95:g} s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cpus": os.cpu_count(), "slo_p95_s": args.slo_p95,
+                       "capacity_sessions": max(within_slo) if within_slo else 0, "levels": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
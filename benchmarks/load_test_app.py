@@ -0,0 +1,35 @@
+"""Entry script for the load test's `streamlit run` server: app.py on the local fakes
+
+load_test.py starts `streamlit run benchmarks/load_test_app.py`. On the
+first run in the server process this installs the fakes from
+benchmarks/fakes.py (configured by the LOAD_TEST_* environment variables),
+then every run executes the real app.py unchanged.
+"""
+import os
+import runpy
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import clients  # noqa: E402
+import warmup  # noqa: E402
+from benchmarks.fakes import FakeInferenceClient, FakePollyClient, FakeRecognizerBackend  # noqa: E402
+from stt import STT_BACKENDS, register_stt_backend  # noqa: E402
+
+if "fake" not in STT_BACKENDS:
+    seed = int(os.getenv("LOAD_TEST_SEED", "1234"))
+    # app.py picks these up through the process-wide client registry
+    clients._clients["huggingface"] = FakeInferenceClient(
+        time_to_first_token=float(os.getenv("LOAD_TEST_TTFT", "0.25")),
+        token_latency=float(os.getenv("LOAD_TEST_TOKEN_LATENCY", "0.01")),
+        seed=seed,
+    )
+    clients._clients["polly"] = FakePollyClient(base_latency=float(os.getenv("LOAD_TEST_POLLY_LATENCY", "0.08")),
+                                                seed=seed)
+    warmup._warm_up_started = True  # No real connections to warm up
+    register_stt_backend("fake", lambda: FakeRecognizerBackend(
+        latency=float(os.getenv("LOAD_TEST_STT_LATENCY", "0.3")), seed=seed))
+
+runpy.run_path(os.path.join(ROOT, "app.py"), run_name="__main__")
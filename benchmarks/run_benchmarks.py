@@ -0,0 +1,257 @@
+"""Offline benchmark suite for the voice pipeline
+
+Runs the real split_text_for_tts, synthesize_text (the core of
+generate_tts_audio), transcribe_audio, prompt building and full pipeline
+turns against the local fakes in benchmarks/fakes.py, and reports latency
+percentiles, throughput and allocations per stage.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --iterations 50 --json results.json
+    python benchmarks/run_benchmarks.py --budgets benchmarks/budgets.json   # exits 1 on regression
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Measure the uncached paths: memory-only caches that are cleared between runs
+os.environ["TTS_CACHE_DIR"] = ""
+os.environ["TRANSLATION_CACHE_DIR"] = ""
+# Voice turns use the fake recognizer registered below
+os.environ["STT_BACKEND"] = "fake"
+
+from benchmarks.fakes import (  # noqa: E402
+    FakeInferenceClient,
+    FakePollyClient,
+    FakeRecognizerBackend,
+    make_wav,
+)
+from conversation_context import ConversationContext  # noqa: E402
+from pipeline import PipelineEngine  # noqa: E402
+import stt  # noqa: E402
+from audio_preprocess import preprocess_audio  # noqa: E402
+from stt import register_stt_backend, transcribe_audio  # noqa: E402
+from tts import split_text_for_tts, synthesize_text  # noqa: E402
+from tts_cache import get_tts_cache  # noqa: E402
+
+SENTENCE = "The quick brown fox jumps over the lazy dog while the assistant keeps talking. "
+CJK_SENTENCE = "今天天气很好。我们去公园散步吧！你觉得怎么样？"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(name, timings, peak_bytes=None, extra=None):
+    total = sum(timings)
+    result = {
+        "stage": name,
+        "runs": len(timings),
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p95_ms": percentile(timings, 95) * 1000,
+        "p99_ms": percentile(timings, 99) * 1000,
+        "throughput_per_s": len(timings) / total if total else None,
+        "peak_alloc_kb": peak_bytes / 1024 if peak_bytes is not None else None,
+    }
+    if extra:
+        result.update(extra)
+    return result
+
+
+def measure(func, iterations, setup=None):
+    """Time func over iterations, then measure peak allocations on one extra run"""
+    timings = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timings, peak
+
+
+def bench_split(iterations):
+    results = []
+    for label, repeat in (("2k", 26), ("20k", 260), ("200k", 2600)):
+        text = SENTENCE * repeat
+        timings, peak = measure(lambda: split_text_for_tts(text), iterations)
+        results.append(summarize(f"split_text_{label}", timings, peak))
+
+    # Multi-megabyte inputs: western text and CJK text without any spaces
+    for label, text in (("4mb", SENTENCE * 52000), ("cjk_4mb", CJK_SENTENCE * 58000)):
+        runs = max(3, iterations // 5)
+        timings, peak = measure(lambda: split_text_for_tts(text), runs)
+        megabytes = len(text.encode("utf-8")) / 1e6
+        results.append(summarize(f"split_text_{label}", timings, peak, {
+            "mb_per_s": megabytes / percentile(timings, 50),
+            "chunks": len(split_text_for_tts(text)),
+        }))
+    return results
+
+
+def bench_tts(iterations, polly):
+    text = SENTENCE * 100  # ~8k chars -> several Polly chunks
+    cache = get_tts_cache()
+    timings, peak = measure(lambda: synthesize_text(polly, text), iterations, setup=cache.clear)
+    return [summarize("synthesize_text_8k", timings, peak)]
+
+
+def bench_transcribe(iterations):
+    clip = make_wav(5, 44100, 2)  # Browser-style stereo 44.1 kHz, half of it silence
+    results = []
+
+    _, stats = preprocess_audio(clip)
+    timings, peak = measure(lambda: preprocess_audio(clip), iterations)
+    results.append(summarize("preprocess_audio_5s", timings, peak, {
+        "bytes_removed": stats["bytes_removed"],
+        "seconds_removed": stats["seconds_removed"],
+    }))
+
+    enabled = stt.STT_PREPROCESS
+    try:
+        stt.STT_PREPROCESS = False
+        timings, peak = measure(lambda: transcribe_audio(clip, "en-US", backend="fake"), iterations)
+        results.append(summarize("transcribe_audio_5s_raw", timings, peak))
+    finally:
+        stt.STT_PREPROCESS = enabled
+    timings, peak = measure(lambda: transcribe_audio(clip, "en-US", backend="fake"), iterations)
+    results.append(summarize("transcribe_audio_5s", timings, peak))
+    return results
+
+
+def bench_prompt(iterations):
+    history = []
+    for i in range(200):
+        history.append({"role": "user", "content": f"Question {i}: " + SENTENCE * 2})
+        history.append({"role": "assistant", "content": f"Answer {i}: " + SENTENCE * 6})
+    context = ConversationContext(token_budget=3000, summarize=False)
+    timings, peak = measure(
+        lambda: context.build_messages("You are a helpful assistant.", history, "And one more thing?"),
+        iterations,
+    )
+    return [summarize("build_messages_400", timings, peak)]
+
+
+def bench_turns(iterations, polly, hf):
+    clip = make_wav(3, 16000, 1)
+    engine = PipelineEngine(hf, polly)
+    cache = get_tts_cache()
+
+    totals, first_tokens, first_audio = [], [], []
+    for _ in range(iterations):
+        cache.clear()
+        start = time.perf_counter()
+        handle = engine.start_turn({
+            "audio": clip,
+            "text": None,
+            "voice_language": "en-US",
+            "translate_from": "english",
+            "translate_to": None,
+            "system_prompt": "You are a helpful assistant.",
+            "history": [],
+            "context": ConversationContext(summarize=False),
+            "voice_id": "Joanna",
+            "tts_language": "english",
+            "stream_audio": True,
+        })
+        first_token = first_segment = None
+        for event in handle.events():
+            now = time.perf_counter() - start
+            if event["type"] == "token" and first_token is None:
+                first_token = now
+            elif event["type"] == "audio_segment" and first_segment is None:
+                first_segment = now
+        totals.append(time.perf_counter() - start)
+        first_tokens.append(first_token or totals[-1])
+        first_audio.append(first_segment or totals[-1])
+
+    return [
+        summarize("turn_total", totals),
+        summarize("turn_time_to_first_token", first_tokens),
+        summarize("turn_time_to_first_audio", first_audio),
+    ]
+
+
+def check_budgets(results, budgets):
+    """Return a list of budget violations like "turn_total p95_ms 950.1 > 900" """
+    by_stage = {result["stage"]: result for result in results}
+    violations = []
+    for stage, limits in budgets.items():
+        if stage not in by_stage:
+            continue
+        for metric, limit in limits.items():
+            value = by_stage[stage].get(metric)
+            if value is not None and value > limit:
+                violations.append(f"{stage} {metric} {value:.1f} > {limit}")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for the voice pipeline")
+    parser.add_argument("--iterations", type=int, default=20, help="Runs per stage")
+    parser.add_argument("--stages", default="split,tts,transcribe,prompt,turn",
+                        help="Comma-separated stage groups to run")
+    parser.add_argument("--polly-latency", type=float, default=0.08, help="Fake Polly base latency (s)")
+    parser.add_argument("--ttft", type=float, default=0.25, help="Fake LLM time to first token (s)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Latency jitter (s)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--budgets", help="JSON file of {stage: {metric: max}}; exit 1 if exceeded")
+    args = parser.parse_args()
+
+    polly = FakePollyClient(base_latency=args.polly_latency, jitter=args.jitter, seed=args.seed)
+    hf = FakeInferenceClient(time_to_first_token=args.ttft, jitter=args.jitter / 4, seed=args.seed)
+    stages = set(args.stages.split(","))
+    register_stt_backend("fake", FakeRecognizerBackend)
+
+    results = []
+    if "split" in stages:
+        results += bench_split(args.iterations)
+    if "tts" in stages:
+        results += bench_tts(args.iterations, polly)
+    if "transcribe" in stages:
+        results += bench_transcribe(args.iterations)
+    if "prompt" in stages:
+        results += bench_prompt(args.iterations)
+    if "turn" in stages:
+        results += bench_turns(args.iterations, polly, hf)
+
+    print(f"{'stage':<28} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>9} {'peak KB':>9} {'MB/s':>7}")
+    for result in results:
+        peak = f"{result['peak_alloc_kb']:.0f}" if result["peak_alloc_kb"] is not None else "-"
+        rate = f"{result['mb_per_s']:.0f}" if "mb_per_s" in result else "-"
+        print(f"{result['stage']:<28} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+              f"{result['p99_ms']:>9.2f} {result['throughput_per_s']:>9.1f} {peak:>9} {rate:>7}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.budgets:
+        with open(args.budgets) as f:
+            violations = check_budgets(results, json.load(f))
+        if violations:
+            print("\nLatency budget exceeded:")
+            for violation in violations:
+                print(f"  - {violation}")
+            sys.exit(1)
+        print("\nAll latency budgets met.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import logging
+import os
+import threading
+
+import boto3
+import huggingface_hub
+from botocore.awsrequest import AWSHTTPConnectionPool, AWSHTTPSConnectionPool
+from botocore.config import Config
+from huggingface_hub import InferenceClient
+
+import metrics
+
+# Connection pool settings, shared by the Polly and Hugging Face clients
+HTTP_MAX_POOL_CONNECTIONS = int(os.getenv("HTTP_MAX_POOL_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+
+logger = logging.getLogger(__name__)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Requests sent and connections opened per service; reuse = 1 - opened / requests
+_connection_stats = {
+    "polly": {"requests": 0, "new_connections": 0},
+    "huggingface": {"requests": 0, "new_connections": 0},
+}
+_stats_lock = threading.Lock()
+
+
+def _count(service, name):
+    with _stats_lock:
+        _connection_stats[service][name] += 1
+
+
+def _service_for_host(host):
+    host = str(host)
+    if "polly" in host:
+        return "polly"
+    if "huggingface" in host or host.endswith("hf.co"):
+        return "huggingface"
+    return None
+
+
+def _counting_connection(connection_cls):
+    """Subclass an urllib3 connection class to count the connections it opens"""
+
+    class CountingConnection(connection_cls):
+        _counts_connections = True
+
+        def connect(self):
+            super().connect()
+            service = _service_for_host(self.host)
+            if service:
+                _count(service, "new_connections")
+
+    CountingConnection.__name__ = f"Counting{connection_cls.__name__}"
+    return CountingConnection
+
+
+def _install_botocore_connection_counter():
+    """Count the connections botocore's pools open (one connect per new socket)"""
+    for pool_cls in (AWSHTTPConnectionPool, AWSHTTPSConnectionPool):
+        if not getattr(pool_cls.ConnectionCls, "_counts_connections", False):
+            pool_cls.ConnectionCls = _counting_connection(pool_cls.ConnectionCls)
+
+
+def _hf_trace(event_name, info):
+    """httpx trace callback: one connect_tcp per newly opened connection"""
+    if event_name == "connection.connect_tcp.started":
+        _count("huggingface", "new_connections")
+
+
+def _hf_http_internals():
+    """huggingface_hub's httpx module and request hook, or (None, None) if this release lacks them"""
+    try:
+        from huggingface_hub.utils import _http
+    except ImportError:
+        return None, None
+    httpx = getattr(_http, "httpx2", None) or getattr(_http, "httpx", None)
+    return httpx, getattr(_http, "hf_request_event_hook", None)
+
+
+def _configure_hf_httpx_client():
+    """huggingface_hub >= 1.0 uses an httpx client; returns False when it can't be tuned"""
+    httpx, hub_hook = _hf_http_internals()
+    if httpx is None:
+        return False
+
+    def on_request(request):
+        _count("huggingface", "requests")
+        request.extensions["trace"] = _hf_trace
+        if hub_hook:
+            hub_hook(request)
+
+    def client_factory():
+        return httpx.Client(
+            event_hooks={"request": [on_request]},
+            follow_redirects=True,
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_POOL_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_POOL_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+            ),
+        )
+
+    huggingface_hub.set_client_factory(client_factory)
+    return True
+
+
+def _configure_hf_requests_session():
+    """Older huggingface_hub releases use a requests.Session"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    pool_classes = {
+        "http": type("CountingHTTPConnectionPool", (HTTPConnectionPool,),
+                     {"ConnectionCls": _counting_connection(HTTPConnectionPool.ConnectionCls)}),
+        "https": type("CountingHTTPSConnectionPool", (HTTPSConnectionPool,),
+                      {"ConnectionCls": _counting_connection(HTTPSConnectionPool.ConnectionCls)}),
+    }
+
+    class CountingAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = pool_classes
+
+    def backend_factory():
+        session = requests.Session()
+        adapter = CountingAdapter(pool_connections=HTTP_MAX_POOL_CONNECTIONS,
+                                  pool_maxsize=HTTP_MAX_POOL_CONNECTIONS)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.hooks["response"].append(lambda response, *args, **kwargs: _count("huggingface", "requests"))
+        return session
+
+    huggingface_hub.configure_http_backend(backend_factory=backend_factory)
+    return True
+
+
+def _configure_hf_session():
+    """Give huggingface_hub's shared HTTP session a tuned, keep-alive connection pool
+
+    Falls back to huggingface_hub's own client (and no connection counts)
+    when this release offers neither configuration hook.
+    """
+    try:
+        if hasattr(huggingface_hub, "set_client_factory"):
+            configured = _configure_hf_httpx_client()
+        elif hasattr(huggingface_hub, "configure_http_backend"):
+            configured = _configure_hf_requests_session()
+        else:
+            configured = False
+    except Exception as e:
+        logger.warning("⚠️ Could not tune the Hugging Face HTTP client: %s", e)
+        return
+    if not configured:
+        logger.warning("⚠️ Could not tune the Hugging Face HTTP client: no known hook in huggingface_hub %s",
+                       huggingface_hub.__version__)
+
+
+def get_hf_client(token):
+    """Return the process-wide Hugging Face InferenceClient"""
+    with _clients_lock:
+        if "huggingface" not in _clients:
+            _configure_hf_session()
+            _clients["huggingface"] = InferenceClient(token=token, timeout=HTTP_READ_TIMEOUT)
+        return _clients["huggingface"]
+
+
+def get_polly_client():
+    """Return the process-wide boto3 Polly client (boto3 clients are thread-safe)"""
+    with _clients_lock:
+        if "polly" not in _clients:
+            _install_botocore_connection_counter()
+            polly_client = boto3.client(
+                'polly',
+                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                region_name=os.getenv("AWS_REGION", "ca-central-1"),
+                config=Config(
+                    max_pool_connections=HTTP_MAX_POOL_CONNECTIONS,
+                    connect_timeout=HTTP_CONNECT_TIMEOUT,
+                    read_timeout=HTTP_READ_TIMEOUT,
+                    tcp_keepalive=True,
+                    # Retries are done by resilience.call_with_retry (with jitter and a
+                    # circuit breaker); botocore's own retries would multiply them
+                    retries={"total_max_attempts": 1},
+                ),
+            )
+            polly_client.meta.events.register(
+                "before-send.polly", lambda **kwargs: _count("polly", "requests")
+            )
+            _clients["polly"] = polly_client
+        return _clients["polly"]
+
+
+def warm_up_clients(polly_client, hf_client):
+    """Open connections to both services with cheap calls so the first user doesn't pay for it"""
+    results = {}
+    try:
+        polly_client.describe_voices(LanguageCode="en-US")
+        results["polly"] = None
+    except Exception as e:
+        results["polly"] = str(e)
+    try:
+        huggingface_hub.get_session().head(os.getenv("HF_WARMUP_URL", "https://router.huggingface.co"))
+        results["huggingface"] = None
+    except Exception as e:
+        results["huggingface"] = str(e)
+    return results
+
+
+def connection_stats():
+    """Return requests, new connections and reuse ratio per service"""
+    with _stats_lock:
+        stats = {service: dict(counts) for service, counts in _connection_stats.items()}
+    for counts in stats.values():
+        requests = counts["requests"]
+        counts["reuse_ratio"] = 1 - counts["new_connections"] / requests if requests else None
+    return stats
+
+
+def _connection_samples():
+    """Export connection counters per service (metrics collector)"""
+    samples = []
+    for service, counts in connection_stats().items():
+        samples.append(("requests_total", "counter", {"service": service}, counts["requests"]))
+        samples.append(("connections_opened_total", "counter", {"service": service}, counts["new_connections"]))
+    return samples
+
+
+metrics.register_collector(_connection_samples)
@@ -0,0 +1,128 @@
+import math
+import os
+
+# Rough per-message overhead of the chat template (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _is_cjk(char):
+    code = ord(char)
+    return (0x3040 <= code <= 0x30FF      # Hiragana, Katakana
+            or 0x3400 <= code <= 0x4DBF   # CJK Extension A
+            or 0x4E00 <= code <= 0x9FFF   # CJK Unified Ideographs
+            or 0xAC00 <= code <= 0xD7AF   # Hangul syllables
+            or 0xF900 <= code <= 0xFAFF)  # CJK Compatibility Ideographs
+
+
+def estimate_tokens(text):
+    """Estimate the token count of text without loading a tokenizer
+
+    Latin-script text averages about four characters per token, while CJK
+    characters are usually one token each.
+    """
+    cjk = sum(1 for char in text if _is_cjk(char))
+    return cjk + math.ceil((len(text) - cjk) / 4) + MESSAGE_OVERHEAD_TOKENS
+
+
+def message_tokens(message):
+    """Return the token count of a chat message, counting it only once
+
+    The count is cached on the message dict itself so every later turn reuses it.
+    """
+    if "tokens" not in message:
+        message["tokens"] = estimate_tokens(message["content"])
+    return message["tokens"]
+
+
+class ConversationContext:
+    """Builds the chat_completion prompt within a token budget
+
+    Only the most recent messages that fit the budget are sent. When
+    summaries are enabled, turns that fall out of the window are folded into
+    a rolling summary that is sent right after the system prompt.
+    """
+
+    def __init__(self, token_budget=None, summarize=None, summary_max_tokens=300):
+        self.token_budget = token_budget or int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+        if summarize is None:
+            summarize = os.getenv("CONTEXT_SUMMARY", "0").lower() in ("1", "true", "yes")
+        self.summarize = summarize
+        self.summary_max_tokens = summary_max_tokens
+
+        self.summary = ""
+        self.summarized_count = 0  # History messages already folded into the summary
+        self.window_start = 0      # Index of the oldest history message in the last prompt
+        self.generation = 0        # Bumped by reset(), so a fold still running for the old history is dropped
+
+    def reset(self):
+        self.summary = ""
+        self.summarized_count = 0
+        self.window_start = 0
+        self.generation += 1
+
+    def _summary_message(self):
+        return {"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}
+
+    def build_messages(self, system_prompt, history, prompt):
+        """Return the messages for chat_completion
+
+        Args:
+            system_prompt: The personality system prompt
+            history: Previous chat messages (without the current prompt)
+            prompt: The current user message
+        """
+        head = [{"role": "system", "content": system_prompt}]
+        if self.summary:
+            head.append(self._summary_message())
+        current = {"role": "user", "content": prompt}
+
+        used = sum(estimate_tokens(message["content"]) for message in head) + estimate_tokens(prompt)
+
+        # Walk backwards from the newest message until the budget is spent
+        start = len(history)
+        for index in range(len(history) - 1, -1, -1):
+            cost = message_tokens(history[index])
+            if used + cost > self.token_budget:
+                break
+            used += cost
+            start = index
+
+        # Don't open the window on an assistant reply without its question
+        if start < len(history) and history[start]["role"] != "user":
+            start += 1
+        self.window_start = start
+
+        window = [
+            {"role": msg["role"] if msg["role"] == "user" else "assistant", "content": msg["content"]}
+            for msg in history[start:]
+        ]
+        return head + window + [current]
+
+    def fold_older_turns(self, history, summarize_fn):
+        """Fold messages that left the window into the rolling summary
+
+        Args:
+            history: The full chat history
+            summarize_fn: Callable taking a prompt string and returning summary text
+
+        Returns True if the summary changed. Does nothing when summaries are off.
+        """
+        # The next turn may move the window while the summary is being written
+        window_start, generation = self.window_start, self.generation
+        if not self.summarize or window_start <= self.summarized_count:
+            return False
+
+        dropped = history[self.summarized_count:window_start]
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in dropped)
+        request = (
+            f"Update this conversation summary in at most {self.summary_max_tokens // 2} words. "
+            "Keep names, facts, decisions and open questions.\n\n"
+            f"Current summary: {self.summary or '(none)'}\n\nNew messages:\n{transcript}"
+        )
+        summary = summarize_fn(request)
+        if not summary or self.generation != generation:
+            return False
+
+        self.summary = summary.strip()
+        self.summarized_count = window_start
+        return True
@@ -0,0 +1,423 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Sequence
+
+import metrics
+from conversation_context import message_tokens
+
+# Messages of a conversation kept in memory (the newest ones, which every prompt needs)
+CONVERSATION_MEMORY_MESSAGES = int(os.getenv("CONVERSATION_MEMORY_MESSAGES", "200"))
+# Older messages are read back in pages of this size, and this many pages are kept
+CONVERSATION_PAGE_SIZE = int(os.getenv("CONVERSATION_PAGE_SIZE", "50"))
+CONVERSATION_PAGE_CACHE = int(os.getenv("CONVERSATION_PAGE_CACHE", "4"))
+
+# Ids come from URLs and API clients: keep them short and plain
+_CONVERSATION_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class ConversationStore(ABC):
+    """Durable, append-only conversation history
+
+    Messages are addressed by their position in the conversation (0 = first).
+    Implementations must be thread-safe: one store is shared by every session.
+    """
+
+    @abstractmethod
+    def create(self, conversation_id):
+        """Create an empty conversation (no-op if it exists)"""
+
+    @abstractmethod
+    def exists(self, conversation_id):
+        """True if the conversation exists"""
+
+    @abstractmethod
+    def append(self, conversation_id, message):
+        """Store one {"role", "content"} message at the end and return its position
+
+        The position must be read in the same transaction as the insert, so
+        it is right even when other writers append to the conversation.
+        """
+
+    @abstractmethod
+    def count(self, conversation_id):
+        """Number of messages in the conversation (0 if it doesn't exist)"""
+
+    @abstractmethod
+    def messages(self, conversation_id, start, stop):
+        """Messages at positions start..stop-1, oldest first"""
+
+    @abstractmethod
+    def load_summary(self, conversation_id):
+        """Return (summary, summarized_count) of the rolling summary"""
+
+    @abstractmethod
+    def save_summary(self, conversation_id, summary, summarized_count):
+        """Store the rolling summary and how many messages it covers"""
+
+    @abstractmethod
+    def delete(self, conversation_id):
+        """Delete the conversation; returns True if it existed"""
+
+    @abstractmethod
+    def purge(self, max_age_seconds):
+        """Delete conversations not updated for max_age_seconds; returns how many"""
+
+
+class SQLiteConversationStore(ConversationStore):
+    """ConversationStore in one SQLite file, one row per message
+
+    Appends are single-row inserts, so a message is durable as soon as it is
+    added and nothing is ever rewritten. The file uses write-ahead logging so
+    readers don't block the writer, and several processes (app instances on
+    one host) can share it. path=":memory:" keeps everything in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Autocommit mode: transactions are opened explicitly where needed
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")  # Durable across crashes of the app, not of the OS
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                summary TEXT NOT NULL DEFAULT '',
+                summarized_count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                conversation_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                tokens INTEGER,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (conversation_id, position)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at);
+        """)
+
+    def create(self, conversation_id):
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO conversations (id, created_at, updated_at) VALUES (?, ?, ?)",
+                             (conversation_id, now, now))
+
+    def exists(self, conversation_id):
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row is not None
+
+    def append(self, conversation_id, message):
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes can't pick the same position
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("INSERT OR IGNORE INTO conversations (id, created_at, updated_at) VALUES (?, ?, ?)",
+                                 (conversation_id, now, now))
+                position = self._db.execute("SELECT message_count FROM conversations WHERE id = ?",
+                                            (conversation_id,)).fetchone()[0]
+                self._db.execute(
+                    "INSERT INTO messages (conversation_id, position, role, content, tokens, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (conversation_id, position, message["role"], message["content"], message.get("tokens"), now),
+                )
+                self._db.execute("UPDATE conversations SET message_count = ?, updated_at = ? WHERE id = ?",
+                                 (position + 1, now, conversation_id))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return position
+
+    def count(self, conversation_id):
+        with self._lock:
+            row = self._db.execute("SELECT message_count FROM conversations WHERE id = ?",
+                                   (conversation_id,)).fetchone()
+        return row[0] if row else 0
+
+    def messages(self, conversation_id, start, stop):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT role, content, tokens FROM messages "
+                "WHERE conversation_id = ? AND position >= ? AND position < ? ORDER BY position",
+                (conversation_id, start, stop),
+            ).fetchall()
+        messages = []
+        for role, content, tokens in rows:
+            message = {"role": role, "content": content}
+            if tokens is not None:
+                message["tokens"] = tokens  # Saves re-estimating it for every prompt
+            messages.append(message)
+        return messages
+
+    def load_summary(self, conversation_id):
+        with self._lock:
+            row = self._db.execute("SELECT summary, summarized_count FROM conversations WHERE id = ?",
+                                   (conversation_id,)).fetchone()
+        return tuple(row) if row else ("", 0)
+
+    def save_summary(self, conversation_id, summary, summarized_count):
+        with self._lock:
+            self._db.execute("UPDATE conversations SET summary = ?, summarized_count = ? WHERE id = ?",
+                             (summary, summarized_count, conversation_id))
+
+    def delete(self, conversation_id):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                deleted = self._db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,)).rowcount
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return deleted > 0
+
+    def purge(self, max_age_seconds):
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM messages WHERE conversation_id IN "
+                                 "(SELECT id FROM conversations WHERE updated_at < ?)", (cutoff,))
+                purged = self._db.execute("DELETE FROM conversations WHERE updated_at < ?", (cutoff,)).rowcount
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return purged
+
+
+# Available stores by name (CONVERSATION_STORE env); each factory takes no arguments
+CONVERSATION_STORES = {
+    "sqlite": lambda: SQLiteConversationStore(os.getenv("CONVERSATION_DB", ".conversations.db") or ":memory:"),
+}
+_store_instances = {}
+_store_lock = threading.Lock()
+
+
+def register_conversation_store(name, factory):
+    """Make a store available by name (e.g. a shared database for several hosts)"""
+    with _store_lock:
+        CONVERSATION_STORES[name] = factory
+        _store_instances.pop(name, None)
+
+
+def get_conversation_store(name=None):
+    """Return the shared store for name (default: CONVERSATION_STORE env, "sqlite")
+
+    Conversations idle for longer than CONVERSATION_RETENTION_DAYS are
+    purged when the store is opened (0 keeps them forever).
+    """
+    name = (name or os.getenv("CONVERSATION_STORE", "sqlite")).lower()
+    with _store_lock:
+        if name not in _store_instances:
+            if name not in CONVERSATION_STORES:
+                raise ValueError(f"Unknown conversation store '{name}'. Available: {', '.join(CONVERSATION_STORES)}")
+            store = CONVERSATION_STORES[name]()
+            retention_days = float(os.getenv("CONVERSATION_RETENTION_DAYS", "30"))
+            if retention_days > 0:
+                store.purge(retention_days * 86400)
+            _store_instances[name] = store
+        return _store_instances[name]
+
+
+class Conversation(Sequence):
+    """One conversation's messages, backed by a ConversationStore
+
+    A list-like stand-in for the plain list of messages previously kept in
+    session state: len(), indexing, slicing and append() work as before.
+    Every append is written through to the store. Only the newest
+    memory_messages are held in memory; older positions are paged in from
+    the store on demand and a few pages are kept (LRU).
+    """
+
+    def __init__(self, store, conversation_id, memory_messages=CONVERSATION_MEMORY_MESSAGES,
+                 page_size=CONVERSATION_PAGE_SIZE, page_cache=CONVERSATION_PAGE_CACHE):
+        self.store = store
+        self.conversation_id = conversation_id
+        self.memory_messages = max(1, memory_messages)
+        self.page_size = max(1, page_size)
+        self.page_cache = page_cache
+
+        self._lock = threading.RLock()
+        self._pages = OrderedDict()  # page number -> messages
+        self._views = weakref.WeakSet()  # Live snapshots, detached on delete()
+        self._length = 0
+        self._reload(store.count(conversation_id))
+
+    def _reload(self, length):
+        """Re-read the newest messages for a conversation of length messages (lock held)"""
+        if length < self._length:
+            self._pages.clear()  # Deleted and restarted elsewhere: the older pages are gone
+        self._length = length
+        # The newest messages, from position _tail_start on
+        self._tail_start = max(0, length - self.memory_messages)
+        self._tail = self.store.messages(self.conversation_id, self._tail_start, length)
+
+    def __len__(self):
+        with self._lock:
+            return self._length
+
+    def __getitem__(self, index):
+        with self._lock:
+            if isinstance(index, slice):
+                start, stop, step = index.indices(self._length)
+                if step != 1:
+                    return [self[i] for i in range(start, stop, step)]
+                return self._range(start, stop)
+            if index < 0:
+                index += self._length
+            if not 0 <= index < self._length:
+                raise IndexError("conversation index out of range")
+            if index >= self._tail_start:
+                return self._tail[index - self._tail_start]
+            page = self._page(index // self.page_size)
+            return page[index % self.page_size]
+
+    def _range(self, start, stop):
+        """Messages start..stop-1: older pages from the store, the rest from memory (lock held)"""
+        messages = []
+        position = start
+        while position < min(stop, self._tail_start):
+            number = position // self.page_size
+            page = self._page(number)
+            page_start = number * self.page_size
+            messages.extend(page[position - page_start:min(stop, self._tail_start) - page_start])
+            position = page_start + self.page_size
+        if stop > self._tail_start:
+            messages.extend(self._tail[max(start, self._tail_start) - self._tail_start:stop - self._tail_start])
+        return messages
+
+    def _page(self, number):
+        """Page number of the older messages, read from the store on a miss (lock held)"""
+        page = self._pages.get(number)
+        if page is None:
+            start = number * self.page_size
+            page = self.store.messages(self.conversation_id, start, start + self.page_size)
+            metrics.inc("conversation_pages_loaded_total")
+            if self.page_cache > 0:
+                self._pages[number] = page
+                while len(self._pages) > self.page_cache:
+                    self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(number)
+        return page
+
+    def append(self, message):
+        """Store message and add it to the in-memory tail"""
+        message_tokens(message)  # Counted once and stored with the message
+        with self._lock:
+            position = self.store.append(self.conversation_id, message)
+            if position != self._length:
+                # Someone else (another tab, process or Conversation) wrote to this id
+                self._reload(position)
+            self._tail.append(message)
+            self._length += 1
+            excess = len(self._tail) - self.memory_messages
+            if excess > 0:
+                del self._tail[:excess]
+                self._tail_start += excess
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def snapshot(self):
+        """A read-only view of the messages so far, unaffected by later appends"""
+        with self._lock:
+            view = ConversationView(self, self._length)
+            self._views.add(view)
+            return view
+
+    def restore_context(self, context):
+        """Load the stored rolling summary into a ConversationContext"""
+        context.summary, context.summarized_count = self.store.load_summary(self.conversation_id)
+
+    def save_context(self, context):
+        """Store the ConversationContext's rolling summary"""
+        self.store.save_summary(self.conversation_id, context.summary, context.summarized_count)
+
+    def delete(self):
+        """Delete the conversation from the store and forget its messages
+
+        Snapshots still in use (a running turn) keep the messages they cover.
+        """
+        with self._lock:
+            for view in list(self._views):
+                view._detach(self._range(0, view.length))
+            self._views = weakref.WeakSet()
+            self.store.delete(self.conversation_id)
+            self._length = self._tail_start = 0
+            self._tail = []
+            self._pages.clear()
+
+
+class ConversationView(Sequence):
+    """The first length messages of a Conversation (what a running turn sees)
+
+    Reads go through the conversation until it is deleted; from then on
+    the view serves the messages it was detached with.
+    """
+
+    def __init__(self, conversation, length):
+        self.conversation = conversation
+        self.length = length
+        self._messages = None
+
+    def _detach(self, messages):
+        """Keep these messages as the view's own (conversation lock held)"""
+        self._messages = messages
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        with self.conversation._lock:
+            source = self.conversation if self._messages is None else self._messages
+            if isinstance(index, slice):
+                start, stop, step = index.indices(self.length)
+                if step != 1:
+                    return [source[i] for i in range(start, stop, step)]
+                return source[start:stop]
+            if index < 0:
+                index += self.length
+            if not 0 <= index < self.length:
+                raise IndexError("conversation index out of range")
+            return source[index]
+
+
+def open_conversation(conversation_id=None, store=None):
+    """Resume the conversation with this id, or start a new one
+
+    Only the message count, the newest messages and the rolling summary
+    are read, however long the conversation is.
+
+    Args:
+        conversation_id: Id to resume (created if it doesn't exist), or None for a new id
+        store: The ConversationStore (default: get_conversation_store())
+
+    Raises ValueError for a malformed conversation_id.
+    """
+    valid = isinstance(conversation_id, str) and _CONVERSATION_ID_RE.fullmatch(conversation_id)
+    if conversation_id and not valid:
+        raise ValueError("Conversation ids are 1-64 letters, digits, '-' or '_'")
+    store = store or get_conversation_store()
+    conversation_id = conversation_id or uuid.uuid4().hex
+    store.create(conversation_id)
+    return Conversation(store, conversation_id)
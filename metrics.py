@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# All metric names are exported with this prefix
+METRIC_PREFIX = "voice_"
+
+# Histogram buckets in seconds, from a fast cache hit to a very slow LLM reply
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Recent samples kept per histogram series for the diagnostics panel percentiles
+RECENT_SAMPLES = 200
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> {"buckets": [...], "sum": float, "count": int, "recent": deque}
+_collectors = []  # callables returning [(name, type, labels dict, value)]
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    """Increase a counter, e.g. inc("retries_total", service="polly")"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    """Record one sample in a histogram (values in seconds unless the name says otherwise)"""
+    key = _key(name, labels)
+    with _lock:
+        series = _histograms.get(key)
+        if series is None:
+            series = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0,
+                      "recent": deque(maxlen=RECENT_SAMPLES)}
+            _histograms[key] = series
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                series["buckets"][index] += 1
+        series["sum"] += value
+        series["count"] += 1
+        series["recent"].append(value)
+
+
+@contextmanager
+def timed(stage, **labels):
+    """Timing span: records the duration of the block in stage_seconds{stage=...}
+
+    Errors raised inside the block are counted in errors_total and re-raised.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc("errors_total", stage=stage)
+        raise
+    finally:
+        observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+
+def register_collector(collector):
+    """Add a callable that returns extra samples [(name, type, labels, value)] at export time"""
+    with _lock:
+        if collector not in _collectors:
+            _collectors.append(collector)
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def stage_summary():
+    """Return {stage: {"count", "p50", "p95"}} from recent stage_seconds samples"""
+    with _lock:
+        series = [(dict(labels), data["count"], list(data["recent"]))
+                  for (name, labels), data in _histograms.items() if name == "stage_seconds"]
+    summary = {}
+    for labels, count, recent in series:
+        stage = labels.get("stage", "")
+        if recent:
+            summary[stage] = {"count": count, "p50": _percentile(recent, 50), "p95": _percentile(recent, 95)}
+    return summary
+
+
+def counter_values():
+    """Return {(name, labels): value} for every counter"""
+    with _lock:
+        return dict(_counters)
+
+
+def collected_values():
+    """Return {(name, labels): value} reported by the registered collectors"""
+    with _lock:
+        collectors = list(_collectors)
+    values = {}
+    for collector in collectors:
+        try:
+            samples = collector()
+        except Exception:
+            continue
+        for name, _, labels, value in samples:
+            if value is not None:
+                values[_key(name, labels)] = value
+    return values
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def render_prometheus():
+    """Export every metric in the Prometheus text exposition format"""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, dict(data, buckets=list(data["buckets"]))) for key, data in _histograms.items())
+        collectors = list(_collectors)
+
+    # Samples of one metric must be grouped under a single TYPE line
+    families = {}  # full name -> (type, [sample lines])
+
+    def add(name, metric_type, line):
+        families.setdefault(METRIC_PREFIX + name, (metric_type, []))[1].append(METRIC_PREFIX + line)
+
+    for (name, labels), value in counters:
+        add(name, "counter", f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), data in histograms:
+        for bound, count in zip(BUCKETS, data["buckets"]):
+            add(name, "histogram", f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {count}")
+        add(name, "histogram", f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {data['count']}")
+        add(name, "histogram", f"{name}_sum{_format_labels(labels)} {data['sum']}")
+        add(name, "histogram", f"{name}_count{_format_labels(labels)} {data['count']}")
+
+    for collector in collectors:
+        try:
+            samples = collector()
+        except Exception:
+            continue  # A broken collector must not take the whole endpoint down
+        for name, metric_type, labels, value in samples:
+            if value is not None:
+                add(name, metric_type, f"{name}{_format_labels(tuple(sorted(labels.items())))} {value}")
+
+    lines = []
+    for full_name, (metric_type, samples) in families.items():
+        lines.append(f"# TYPE {full_name} {metric_type}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the log
+
+
+_server = None
+
+
+def start_metrics_server(port=None, host=None):
+    """Serve /metrics on METRICS_HOST:METRICS_PORT in a background thread (once per process)
+
+    Does nothing when no port is configured. Returns the server or None.
+    """
+    global _server
+    port = port or int(os.getenv("METRICS_PORT", "0") or 0)
+    # Loopback by default: the metrics carry no auth, so exposing them is an explicit choice
+    host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+    with _lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError:
+            return None  # Port already taken (e.g. another worker in this host serves it)
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _server
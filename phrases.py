@@ -0,0 +1,129 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_format import AUDIO_FORMAT_OPTIONS
+from scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from translation import translate_batch, translate_text
+from tts import DEFAULT_AUDIO_FORMAT, POLLY_LANGUAGE_MAP, clean_text_for_tts, resolve_voice, synthesize_text
+from tts_cache import get_tts_cache, make_cache_key
+
+# Fixed notices the assistant speaks instead of a reply, in English. They are
+# translated for each reply language and pre-synthesized at start-up (warmup.py).
+DEFAULT_PHRASES = {
+    "llm_busy": "The language model is busy right now. Please try again in a moment.",
+    "llm_error": "Sorry, I couldn't get an answer this time. Please try again.",
+    "not_understood": "Sorry, I didn't catch that. Please speak clearly, reduce background noise "
+                      "and hold the microphone closer.",
+}
+
+# Parallel Polly requests while pre-synthesizing (they run at background priority)
+PHRASE_WORKERS = int(os.getenv("PHRASE_WORKERS", "4"))
+
+
+def load_phrases():
+    """DEFAULT_PHRASES plus (or replaced by) the {key: text} JSON file in PHRASES_FILE"""
+    phrases = dict(DEFAULT_PHRASES)
+    path = os.getenv("PHRASES_FILE")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            phrases.update(json.load(f))
+    return phrases
+
+
+PHRASES = load_phrases()
+
+
+def phrase_text(key, language):
+    """The phrase in the reply language, or None if it couldn't be translated"""
+    text = PHRASES[key]
+    if language.lower() == "english":
+        return text
+    # Served from the translation cache once the phrases were pre-synthesized
+    try:
+        translated, error = translate_text(text, "english", language.lower())
+    except Exception:
+        return None  # The translator doesn't support this language
+    return None if error else translated
+
+
+def phrase_audio(polly_client, key, voice_id, language, audio_format=None, session_id=None):
+    """Spoken phrase for the reply voice and language (from the audio cache when warm), or None"""
+    text = phrase_text(key, language)
+    if not text:
+        return None
+    audio, _ = synthesize_text(polly_client, text, voice_id, language, audio_format=audio_format,
+                               priority=PRIORITY_INTERACTIVE, session_id=session_id)
+    return audio
+
+
+def offered_audio_formats():
+    """The audio formats a session can pick: the app's menu plus the deployment default, default first"""
+    formats = [DEFAULT_AUDIO_FORMAT]
+    formats.extend(audio_format for audio_format in AUDIO_FORMAT_OPTIONS.values() if audio_format not in formats)
+    return formats
+
+
+def presynthesize_phrases(polly_client, languages=None, voices=None, audio_formats=None):
+    """Put every phrase, for the voice of every language in POLLY_LANGUAGE_MAP, into the audio cache
+
+    By default only each language's mapped voice in the deployment's audio
+    format is prepared; other English voices and formats are opt-in (they
+    multiply the Polly requests of a cold start).
+
+    Args:
+        polly_client: The boto3 Polly client
+        languages: Languages to prepare (default: all of POLLY_LANGUAGE_MAP)
+        voices: Extra English voices to prepare (e.g. POLLY_VOICE_OPTIONS values); other
+            languages always speak with their mapped voice (see tts.resolve_voice)
+        audio_formats: AudioFormats to cache (default: TTS_OUTPUT_FORMAT; see offered_audio_formats())
+
+    Returns:
+        {"cached": already in the cache, "synthesized": new, "failed": n,
+         "skipped_languages": languages whose translation failed}
+    """
+    audio_formats = list(audio_formats or [DEFAULT_AUDIO_FORMAT])
+    languages = list(languages or POLLY_LANGUAGE_MAP)
+    english_voices = [POLLY_LANGUAGE_MAP["english"]["voice"]]
+    english_voices.extend(voice for voice in (voices or ()) if voice not in english_voices)
+    keys = list(PHRASES)
+    report = {"cached": 0, "synthesized": 0, "failed": 0, "skipped_languages": []}
+
+    prepared = []  # (language, voice_ids, texts)
+    for language in languages:
+        texts = [PHRASES[key] for key in keys]
+        if language != "english":
+            # One batched request per language; a failed language is skipped, never spoken in English
+            try:
+                texts, errors = translate_batch(texts, "english", language)
+            except Exception as e:
+                errors = [str(e)]
+            if any(errors):
+                report["skipped_languages"].append(language)
+                continue
+        voice_ids = english_voices if language == "english" else [POLLY_LANGUAGE_MAP[language]["voice"]]
+        prepared.append((language, voice_ids, texts))
+
+    # Format by format, in the given order: put the most requested one first
+    jobs = [(text, voice_id, language, audio_format)
+            for audio_format in audio_formats
+            for language, voice_ids, texts in prepared
+            for voice_id in voice_ids
+            for text in texts]
+
+    tts_cache = get_tts_cache()
+
+    def prepare(job):
+        text, voice_id, language, audio_format = job
+        resolved_voice, language_code, engine = resolve_voice(voice_id, language)
+        key = make_cache_key(clean_text_for_tts(text), resolved_voice, language_code, engine, audio_format.cache_tag)
+        if tts_cache.get(key):
+            return "cached"
+        audio, failures = synthesize_text(polly_client, text, voice_id, language, audio_format=audio_format,
+                                          priority=PRIORITY_BACKGROUND)
+        return "synthesized" if audio and not failures else "failed"
+
+    with ThreadPoolExecutor(max_workers=PHRASE_WORKERS, thread_name_prefix="phrases") as executor:
+        for outcome in executor.map(prepare, jobs):
+            report[outcome] += 1
+    return report
@@ -0,0 +1,558 @@
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+
+import metrics
+from audio_format import assemble_audio
+from conversation_context import ConversationContext
+from conversation_store import Conversation
+from phrases import phrase_audio
+from resilience import call_with_retry, is_retryable
+from response_cache import RESPONSE_CACHE_REPLAY_DELAY, get_response_cache, replay_tokens, response_cache_key
+from scheduler import PRIORITY_BACKGROUND, PRIORITY_FIRST_AUDIO, PRIORITY_INTERACTIVE
+from stt import is_transcription_error, transcribe_audio
+from translation import source_language_for, translate_text
+from tts import (
+    DEFAULT_AUDIO_FORMAT,
+    SentenceSplitter,
+    TTS_MAX_WORKERS,
+    clean_text_for_tts,
+    polly_available,
+    resolve_voice,
+    synthesize_cached,
+    synthesize_text,
+)
+from tts_cache import get_tts_cache, make_cache_key
+
+CHAT_MODEL = "meta-llama/Llama-3.3-70B-Instruct"
+CHAT_MAX_TOKENS = 2000
+
+# System prompts for the chat model, by personality
+PERSONALITY_PROMPTS = {
+    "General Assistant": "You are a helpful and knowledgeable AI assistant. Provide clear, accurate, and useful information. Be friendly and professional in your responses."
+}
+DEFAULT_PERSONALITY = "General Assistant"
+
+# Max items waiting between two stages; a slow stage makes the one before it wait
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "64"))
+# LLM streams read at once. Each holds a thread for the whole reply (blocked while its
+# consumer catches up), so they get their own pool instead of the loop's default
+# executor, which sentence synthesis, STT and translation need to make progress.
+PIPELINE_MAX_STREAMS = int(os.getenv("PIPELINE_MAX_STREAMS", "64"))
+
+logger = logging.getLogger(__name__)
+
+# Events emitted for a turn, in the order they can occur:
+#   transcript       {"text"}                 speech recognized
+#   transcript_error {"text"}                 recognition failed; an "audio" event with the spoken
+#                                             "not understood" notice follows and the turn ends
+#   translation      {"text", "target"}       transcript translated
+#   warning          {"text"}                 non-fatal problem (e.g. translation fell back)
+#   prompt           {"text"}                 final user prompt sent to the model
+#   token            {"text"}                 streamed response delta
+#   audio_segment    {"audio"}                playable clip for the next sentence, in order
+#   response         {"text", "error",        full response (error is set if the LLM failed;
+#                     "retryable", "cached"}  retryable: the service was busy or down, not misconfigured;
+#                                             cached: replayed from the response cache; after an error
+#                                             the "audio" event carries a spoken notice instead)
+#   audio            {"audio", "failures",    full reply as one clip (None if nothing synthesized);
+#                     "degraded"}             degraded explains a text-only reply (Polly circuit open)
+#   cancelled        {}                       the turn was cancelled
+#   done             {}                       always the last event
+#   idle             {}                       nothing happened for idle_timeout (events() only, not queued)
+
+
+def make_turn(audio=None, text=None, history=(), context=None, voice_language="en-US", translate_to=None,
+              personality=DEFAULT_PERSONALITY, voice_id="Joanna", tts_language="english", stream_audio=True,
+              audio_format=None, session_id=None):
+    """Build the turn dict for PipelineEngine.start_turn from client settings
+
+    Args:
+        audio: Recorded WAV bytes, or None for a typed prompt
+        text: The typed prompt (ignored when audio is given)
+        history: The conversation so far (copied, or a snapshot of a Conversation)
+        context: The conversation's ConversationContext (a fresh one if None)
+        voice_language: Speech recognition language code
+        translate_to: Translate the transcript to this language, or None
+        personality: Key of PERSONALITY_PROMPTS
+        voice_id, tts_language: Polly voice settings
+        stream_audio: Synthesize sentences while the reply streams
+        audio_format: AudioFormat of the reply audio (None = TTS_OUTPUT_FORMAT)
+        session_id: The client session, so upstream requests are shared fairly between sessions
+    """
+    if personality not in PERSONALITY_PROMPTS:
+        raise ValueError(f"Unknown personality '{personality}'. Available: {', '.join(PERSONALITY_PROMPTS)}")
+    return {
+        "audio": audio,
+        "text": text,
+        "voice_language": voice_language,
+        "translate_from": source_language_for(voice_language),
+        "translate_to": translate_to,
+        "system_prompt": PERSONALITY_PROMPTS[personality],
+        "history": history.snapshot() if isinstance(history, Conversation) else list(history),
+        "context": context if context is not None else ConversationContext(),
+        "voice_id": voice_id,
+        "tts_language": tts_language,
+        "stream_audio": stream_audio,
+        "audio_format": audio_format or DEFAULT_AUDIO_FORMAT,
+        "session_id": session_id,
+    }
+
+
+class TurnHandle:
+    """Thread-safe handle to a running turn
+
+    The UI thread reads events with events() and can stop the turn with
+    cancel(). Events are buffered, so consumers can read them in several
+    passes (e.g. up to the prompt, then the rest).
+    """
+
+    def __init__(self):
+        self._events = queue.Queue()
+        self._cancelled = threading.Event()
+        self._task = None
+        self._loop = None
+        self.finished = False
+        self.started_at = time.perf_counter()
+        self._responded = False
+
+    def _emit(self, event_type, **data):
+        data["type"] = event_type
+        if event_type == "response":
+            self._responded = True
+        self._events.put(data)
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Stop the turn: pending stages are cancelled and the LLM stream is closed"""
+        self._cancelled.set()
+        if self._loop and self._task:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+
+    def events(self, stop_after=(), idle_timeout=None):
+        """Yield events as they arrive until "done" or an event type in stop_after
+
+        With idle_timeout, an {"type": "idle"} event is yielded whenever nothing
+        arrived for that many seconds (e.g. to flush buffered UI updates).
+        """
+        while not self.finished:
+            try:
+                event = self._events.get(timeout=idle_timeout)
+            except queue.Empty:
+                yield {"type": "idle"}
+                continue
+            if event["type"] == "done":
+                self.finished = True
+            yield event
+            if event["type"] in stop_after:
+                return
+
+
+class PipelineEngine:
+    """Runs voice turns as async stages on one background event loop
+
+    STT -> translate -> LLM token stream -> sentence splitter -> TTS are
+    connected by bounded asyncio queues, so sentences are synthesized while
+    later tokens are still streaming. Blocking client calls run in worker
+    threads. One engine (and loop) is shared by every session.
+    """
+
+    def __init__(self, hf_client, polly_client, model=CHAT_MODEL, max_tokens=CHAT_MAX_TOKENS,
+                 queue_size=PIPELINE_QUEUE_SIZE, tts_concurrency=TTS_MAX_WORKERS, response_cache=None,
+                 max_streams=PIPELINE_MAX_STREAMS):
+        self.hf_client = hf_client
+        self.polly_client = polly_client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.queue_size = queue_size
+        self.tts_concurrency = tts_concurrency
+        # Opt-in answer cache (RESPONSE_CACHE); None sends every prompt to the model
+        self.response_cache = response_cache or get_response_cache()
+        self._stream_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_streams,
+                                                                      thread_name_prefix="llm-stream")
+
+        self._folding = set()  # ids of contexts being folded (only touched on the loop)
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="pipeline-loop", daemon=True)
+        self._thread.start()
+
+    def start_turn(self, turn):
+        """Start a turn and return its TurnHandle
+
+        Args:
+            turn: dict with
+                audio: recorded WAV bytes, or None for a typed prompt
+                text: the typed prompt (ignored when audio is given)
+                voice_language: speech recognition language code
+                translate_from / translate_to: translator languages, or None to skip translation
+                system_prompt, history, context: prompt inputs (history is a list snapshot,
+                    context a ConversationContext)
+                voice_id, tts_language: Polly voice settings
+                audio_format: AudioFormat for the reply audio (optional, default TTS_OUTPUT_FORMAT)
+                stream_audio: synthesize sentences while the reply streams
+                session_id: the client session (optional), for fair upstream scheduling
+        """
+        handle = TurnHandle()
+        handle._loop = self._loop
+
+        def create_task():
+            if handle.cancelled:
+                # Cancelled before the loop picked it up
+                handle._emit("cancelled")
+                handle._emit("done")
+                return
+            handle._task = self._loop.create_task(self._run_turn(turn, handle))
+
+        self._loop.call_soon_threadsafe(create_task)
+        return handle
+
+    def synthesize(self, text, voice_id, language, max_retries=2, audio_format=None, session_id=None):
+        """Speak a whole text outside a turn (e.g. an older message)
+
+        Scheduled behind the requests of active turns. Returns
+        (audio_bytes or None, failures) like tts.synthesize_text.
+        """
+        return synthesize_text(self.polly_client, text, voice_id, language, max_retries, audio_format,
+                               priority=PRIORITY_BACKGROUND, session_id=session_id)
+
+    def summarize(self, request, max_tokens, session_id=None):
+        """One non-streamed completion for the rolling summary, or None if it failed"""
+        try:
+            response = call_with_retry(
+                "huggingface", self.hf_client.chat_completion,
+                messages=[{"role": "user", "content": request}],
+                model=self.model,
+                max_tokens=max_tokens,
+                max_attempts=2,
+                priority=PRIORITY_BACKGROUND,
+                session_id=session_id,
+            )
+            return response.choices[0].message.content
+        except Exception:
+            return None  # Keep the previous summary and try again next turn
+
+    def fold_context(self, context, history, session_id=None):
+        """Fold turns that no longer fit the prompt budget into the rolling summary
+
+        Only does work when CONTEXT_SUMMARY is enabled. Call it after the
+        reply (and its audio) has been delivered.
+        """
+        return context.fold_older_turns(
+            history, lambda request: self.summarize(request, context.summary_max_tokens, session_id)
+        )
+
+    def start_fold_context(self, context, history, session_id=None, on_folded=None):
+        """Run fold_context on the engine loop and return at once
+
+        The summary request is a full (non-streamed) LLM call, so it must not
+        hold up the caller. One fold runs per context at a time; a request
+        made while one is running is skipped (the next turn folds again).
+
+        Args:
+            context: The ConversationContext to fold
+            history: The conversation so far (copied, or a snapshot of a Conversation)
+            session_id: The client session (optional), for fair upstream scheduling
+            on_folded: Called with the context when the summary changed, e.g. to store it
+
+        Returns a concurrent.futures.Future of fold_context's result.
+        """
+        if not context.summarize:
+            done = concurrent.futures.Future()
+            done.set_result(False)
+            return done
+        history = history.snapshot() if isinstance(history, Conversation) else list(history)
+
+        async def fold():
+            if id(context) in self._folding:
+                return False
+            self._folding.add(id(context))
+            try:
+                folded = await asyncio.to_thread(self.fold_context, context, history, session_id)
+                if folded and on_folded:
+                    await asyncio.to_thread(on_folded, context)
+                return folded
+            finally:
+                self._folding.discard(id(context))
+
+        return asyncio.run_coroutine_threadsafe(fold(), self._loop)
+
+    async def _run_turn(self, turn, handle):
+        try:
+            prompt = await self._prepare_prompt(turn, handle)
+            if prompt is None:
+                return
+            handle._emit("prompt", text=prompt)
+
+            messages = turn["context"].build_messages(turn["system_prompt"], turn["history"], prompt)
+            await self._chat_and_speak(messages, turn, handle)
+        except asyncio.CancelledError:
+            handle._cancelled.set()
+            handle._emit("cancelled")
+            metrics.inc("turns_cancelled_total")
+        except Exception as e:
+            # A bug or an unexpected service error: the user still gets an answer
+            logger.exception("❌ Turn failed")
+            metrics.inc("errors_total", stage="turn")
+            if not handle._responded:
+                handle._emit("response", text="", error=str(e) or type(e).__name__, retryable=False, cached=False)
+        finally:
+            metrics.observe("stage_seconds", time.perf_counter() - handle.started_at, stage="turn")
+            handle._emit("done")
+
+    async def _prepare_prompt(self, turn, handle):
+        """STT and translation stages; returns the prompt or None if the turn ends here"""
+        if turn.get("audio") is None:
+            return turn["text"]
+
+        translate_from, translate_to = turn.get("translate_from"), turn.get("translate_to")
+        translating = bool(translate_to) and translate_from != translate_to
+
+        transcript = await asyncio.to_thread(transcribe_audio, turn["audio"], turn["voice_language"])
+
+        if is_transcription_error(transcript):
+            handle._emit("transcript_error", text=transcript)
+            await self._speak_phrase("not_understood", turn, handle)
+            return None
+        handle._emit("transcript", text=transcript)
+
+        if not translating:
+            return transcript
+
+        translated, error = await asyncio.to_thread(translate_text, transcript, translate_from, translate_to)
+        if error:
+            handle._emit("warning", text=f"{error}. Using your original words instead.")
+            return transcript
+        handle._emit("translation", text=translated, target=translate_to)
+        return translated
+
+    async def _speak_phrase(self, key, turn, handle):
+        """Emit a fixed notice (phrases.py) as the turn's "audio" event, pre-synthesized at start-up"""
+        audio = None
+        if polly_available():
+            audio = await asyncio.to_thread(
+                phrase_audio, self.polly_client, key, turn["voice_id"], turn["tts_language"],
+                turn.get("audio_format"), turn.get("session_id"),
+            )
+        handle._emit("audio", audio=audio, failures=[], degraded=None)
+
+    def _stream_tokens(self, messages, token_queue, handle, session_id=None):
+        """Worker thread: push streamed deltas into token_queue, then a final marker"""
+
+        def put(item):
+            future = asyncio.run_coroutine_threadsafe(token_queue.put(item), self._loop)
+            # Wait for room in the bounded queue, but give up if the turn is cancelled
+            while True:
+                try:
+                    return future.result(timeout=0.1)
+                except concurrent.futures.TimeoutError:
+                    if handle.cancelled:
+                        future.cancel()
+                        return None
+
+        def open_stream():
+            stream = self.hf_client.chat_completion(
+                messages=messages,
+                model=self.model,
+                max_tokens=self.max_tokens,
+                stream=True,
+            )
+            # The request may only be sent on the first read, so that read is retried too.
+            # Later errors are not retried: the tokens already shown can't be taken back.
+            iterator = iter(stream)
+            try:
+                return stream, itertools.chain([next(iterator)], iterator)
+            except StopIteration:
+                return stream, iter(())
+            except Exception:
+                if hasattr(stream, "close"):
+                    stream.close()
+                raise
+
+        stream = None
+        start = time.perf_counter()
+        first_token_at = None
+        tokens = 0
+        try:
+            stream, messages_iter = call_with_retry("huggingface", open_stream, stop_event=handle._cancelled,
+                                                    priority=PRIORITY_INTERACTIVE, session_id=session_id)
+            for message in messages_iter:
+                if handle.cancelled:
+                    break
+                if message.choices and message.choices[0].delta.content:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        metrics.observe("stage_seconds", first_token_at - start, stage="llm_first_token")
+                    tokens += 1
+                    put(message.choices[0].delta.content)
+            put(None)
+        except Exception as e:
+            metrics.inc("errors_total", stage="llm")
+            put(e)
+        finally:
+            # Throughput is tokens_total / generation seconds_total, measured after the first token
+            if first_token_at is not None:
+                metrics.inc("llm_tokens_total", tokens)
+                metrics.inc("llm_generation_seconds_total", time.perf_counter() - first_token_at)
+            metrics.observe("stage_seconds", time.perf_counter() - start, stage="llm_stream")
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+
+    async def _replay_tokens(self, text, token_queue):
+        """Feed a cached answer into token_queue like a live stream"""
+        for token in replay_tokens(text):
+            await token_queue.put(token)
+            if RESPONSE_CACHE_REPLAY_DELAY:
+                await asyncio.sleep(RESPONSE_CACHE_REPLAY_DELAY)
+        await token_queue.put(None)
+
+    async def _chat_and_speak(self, messages, turn, handle):
+        token_queue = asyncio.Queue(maxsize=self.queue_size)
+        segment_queue = asyncio.Queue(maxsize=self.queue_size)
+        stream_audio = turn.get("stream_audio", True)
+        voice_id, language_code, engine = resolve_voice(turn["voice_id"], turn["tts_language"])
+        audio_format = turn.get("audio_format") or DEFAULT_AUDIO_FORMAT
+        session_id = turn.get("session_id")
+        # Don't queue sentences for a service that is failing fast: degrade to text only
+        stream_audio = stream_audio and polly_available()
+        slots = asyncio.Semaphore(self.tts_concurrency)
+
+        def reply_audio_key(text):
+            """Audio cache key of the whole reply, the same one synthesize_text uses"""
+            return make_cache_key(clean_text_for_tts(text), voice_id, language_code, engine, audio_format.cache_tag)
+
+        cache_key = cached_text = cached_audio = None
+        if self.response_cache is not None:
+            cache_key = response_cache_key(self.model, messages)
+            cached_text = await asyncio.to_thread(self.response_cache.get, cache_key)
+            if cached_text is not None:
+                # The answer's audio is linked through the audio cache (same text, voice and format)
+                cached_audio = await asyncio.to_thread(get_tts_cache().get, reply_audio_key(cached_text))
+                if cached_audio:
+                    stream_audio = False  # The whole clip is ready, no sentence needs synthesizing
+
+        async def synthesize(sentence, priority):
+            async with slots:
+                return await asyncio.to_thread(
+                    synthesize_cached, self.polly_client, sentence, voice_id, language_code, engine,
+                    audio_format=audio_format, priority=priority, session_id=session_id,
+                )
+
+        async def split_sentences():
+            """Tokens -> UI events and sentence synthesis tasks (in order)"""
+            splitter = SentenceSplitter()
+            parts = []
+            try:
+                while True:
+                    item = await token_queue.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        return "".join(parts), item
+                    parts.append(item)
+                    handle._emit("token", text=item)
+                    if stream_audio:
+                        for sentence in splitter.feed(item):
+                            await queue_sentence(sentence)
+                if stream_audio:
+                    for sentence in splitter.flush():
+                        await queue_sentence(sentence)
+                return "".join(parts), None
+            finally:
+                await segment_queue.put(None)
+
+        queued_sentences = 0
+
+        async def queue_sentence(sentence):
+            nonlocal queued_sentences
+            clean_text = clean_text_for_tts(sentence)
+            if clean_text:
+                # The first sentence decides when the user hears something: it goes first
+                priority = PRIORITY_FIRST_AUDIO if queued_sentences == 0 else PRIORITY_INTERACTIVE
+                queued_sentences += 1
+                await segment_queue.put(asyncio.ensure_future(synthesize(clean_text, priority)))
+
+        async def emit_segments():
+            """Await synthesis tasks in sentence order and emit each segment"""
+            audio, failures = [], []
+            number = 0
+            while True:
+                task = await segment_queue.get()
+                if task is None:
+                    # Segment count is only known now, fill it in
+                    return audio, [(failed, number, error) for failed, error in failures]
+                number += 1
+                audio_bytes, error = await task
+                if audio_bytes:
+                    if not audio:
+                        metrics.observe("stage_seconds", time.perf_counter() - handle.started_at, stage="first_audio")
+                    audio.append(audio_bytes)
+                    handle._emit("audio_segment", audio=assemble_audio([audio_bytes], audio_format))
+                else:
+                    failures.append((number, error))
+
+        replay = None
+        if cached_text is not None:
+            replay = asyncio.ensure_future(self._replay_tokens(cached_text, token_queue))
+        else:
+            # The producer thread stops by itself once the handle is cancelled
+            asyncio.get_running_loop().run_in_executor(self._stream_executor, self._stream_tokens, messages,
+                                                       token_queue, handle, session_id)
+        try:
+            (full_response, llm_error), (segments, failures) = await asyncio.gather(
+                split_sentences(), emit_segments()
+            )
+        finally:
+            if replay is not None:
+                replay.cancel()
+
+        handle._emit("response", text=full_response, error=str(llm_error) if llm_error else None,
+                     retryable=llm_error is not None and is_retryable(llm_error), cached=cached_text is not None)
+        if llm_error:
+            await self._speak_phrase("llm_busy" if is_retryable(llm_error) else "llm_error", turn, handle)
+            return
+        if cache_key and cached_text is None and full_response.strip() and not handle.cancelled:
+            await asyncio.to_thread(self.response_cache.put, cache_key, full_response, self.model)
+
+        if cached_audio:
+            metrics.observe("stage_seconds", time.perf_counter() - handle.started_at, stage="first_audio")
+            handle._emit("audio", audio=cached_audio, failures=[], degraded=None)
+        elif stream_audio and segments:
+            reply_audio = assemble_audio(segments, audio_format)
+            if not failures and cache_key:
+                # Link the answer to its audio for the next cache hit
+                await asyncio.to_thread(get_tts_cache().put, reply_audio_key(full_response), reply_audio)
+            handle._emit("audio", audio=reply_audio, failures=failures, degraded=None)
+        elif not polly_available():
+            metrics.inc("degraded_replies_total", reason="polly_circuit_open")
+            handle._emit("audio", audio=None, failures=[],
+                         degraded="Voice replies are paused while the speech service recovers")
+        else:
+            audio_bytes, failures = await asyncio.to_thread(
+                synthesize_text, self.polly_client, full_response, turn["voice_id"], turn["tts_language"],
+                audio_format=audio_format, session_id=session_id,
+            )
+            if audio_bytes:
+                metrics.observe("stage_seconds", time.perf_counter() - handle.started_at, stage="first_audio")
+            handle._emit("audio", audio=audio_bytes, failures=failures, degraded=None)
+
+
+_shared_engine = None
+_shared_engine_lock = threading.Lock()
+
+
+def get_pipeline_engine(hf_client, polly_client):
+    """Return the process-wide PipelineEngine"""
+    global _shared_engine
+    with _shared_engine_lock:
+        if _shared_engine is None:
+            _shared_engine = PipelineEngine(hf_client, polly_client)
+        return _shared_engine
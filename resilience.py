@@ -0,0 +1,277 @@
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import (
+    BotoCoreError,
+    ClientError,
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+import metrics
+from scheduler import PRIORITY_INTERACTIVE, QueueTimeoutError, get_scheduler
+
+# Retry and circuit breaker settings, shared by every upstream service
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.25"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "8"))
+# Throttling backs off this many times longer than other transient errors
+THROTTLE_DELAY_FACTOR = 4
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Error kinds returned by classify_error
+THROTTLED = "throttled"    # The service asked us to slow down: retry, later
+TRANSIENT = "transient"    # Network problem or server error: retry
+PERMANENT = "permanent"    # Bad request, auth, unsupported voice...: retrying won't help
+
+# AWS error codes that mean "slow down"
+THROTTLING_CODES = {
+    "Throttling", "ThrottlingException", "ThrottledException", "TooManyRequestsException",
+    "RequestLimitExceeded", "ProvisionedThroughputExceededException", "SlowDown",
+}
+# AWS error codes for a failing service rather than a bad request
+TRANSIENT_CODES = {"ServiceFailureException", "ServiceUnavailable", "ServiceUnavailableException",
+                   "InternalFailure", "InternalServerError", "RequestTimeout", "RequestTimeoutException"}
+
+
+class EmptyResponseError(Exception):
+    """A service answered without the body it should have (retried like a server error)"""
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit breaker is open"""
+
+    def __init__(self, service, retry_in):
+        super().__init__(f"{service} is temporarily unavailable, retrying in {retry_in:.0f}s")
+        self.service = service
+        self.retry_in = retry_in
+
+
+def _status_code(error):
+    """HTTP status of an httpx/requests/huggingface_hub error, if it has one"""
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def classify_error(error):
+    """Return THROTTLED, TRANSIENT or PERMANENT for an exception from Polly or Hugging Face"""
+    if isinstance(error, CircuitOpenError):
+        return PERMANENT
+    if isinstance(error, QueueTimeoutError):
+        return THROTTLED  # Our own rate limit, but it means the same: busy, try again later
+
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code", "")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        if code in THROTTLING_CODES or status == 429:
+            return THROTTLED
+        if code in TRANSIENT_CODES or status >= 500:
+            return TRANSIENT
+        return PERMANENT
+    if isinstance(error, (EndpointConnectionError, ConnectTimeoutError, ReadTimeoutError, ConnectionClosedError)):
+        return TRANSIENT
+    if isinstance(error, BotoCoreError):
+        return PERMANENT  # Missing credentials, invalid parameters...
+
+    status = _status_code(error)
+    if status is not None:
+        if status == 429:
+            return THROTTLED
+        if status >= 500 or status == 408:
+            return TRANSIENT
+        return PERMANENT
+
+    # httpx / requests timeouts and connection errors don't share a base class
+    if isinstance(error, (ConnectionError, TimeoutError)) or any(
+        "Timeout" in cls.__name__ or "Connect" in cls.__name__ for cls in type(error).__mro__
+    ):
+        return TRANSIENT
+    if isinstance(error, EmptyResponseError):
+        return TRANSIENT
+    # Anything else is most likely a bug on our side (a KeyError, a bad argument...): retrying won't help
+    return PERMANENT
+
+
+def is_retryable(error):
+    """True if the error means the service is busy or down (including an open circuit)"""
+    return isinstance(error, CircuitOpenError) or classify_error(error) != PERMANENT
+
+
+def _retry_after(error):
+    """Seconds from a Retry-After header, if the service sent one"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After") or headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, kind=TRANSIENT, base_delay=None, max_delay=None):
+    """Exponential backoff with full jitter for the given retry (attempt 0 = first retry)
+
+    Full jitter spreads retries from many sessions over the whole window so
+    they don't hit a recovering service in synchronized waves.
+    """
+    base_delay = RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = RETRY_MAX_DELAY if max_delay is None else max_delay
+    if kind == THROTTLED:
+        base_delay *= THROTTLE_DELAY_FACTOR
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Per-service circuit breaker shared by every session
+
+    After failure_threshold consecutive retryable failures the circuit opens
+    and calls fail fast with CircuitOpenError. After reset_seconds one trial
+    call is let through (half-open): success closes the circuit, failure opens
+    it again. Permanent errors don't count, they say nothing about the service.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, service, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    @property
+    def is_open(self):
+        """True while calls would be rejected (a half-open circuit still allows its trial)"""
+        return self.state == self.OPEN
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not go through"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            waited = time.monotonic() - self._opened_at
+            if waited < self.reset_seconds or self._trial_running:
+                raise CircuitOpenError(self.service, max(0.0, self.reset_seconds - waited))
+            # Half-open: this call is the trial
+            self._state = self.HALF_OPEN
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                metrics.inc("circuit_transitions_total", service=self.service, state=self.CLOSED)
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    metrics.inc("circuit_transitions_total", service=self.service, state=self.OPEN)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release_trial(self):
+        """End a half-open trial that finished with a permanent error (says nothing either way)"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trial_running = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(service):
+    """Return the process-wide circuit breaker for a service ("polly", "huggingface", ...)"""
+    with _breakers_lock:
+        if service not in _breakers:
+            _breakers[service] = CircuitBreaker(service)
+        return _breakers[service]
+
+
+def call_with_retry(service, func, *args, max_attempts=None, stop_event=None, lane=None,
+                    priority=PRIORITY_INTERACTIVE, session_id=None, **kwargs):
+    """Call func(*args, **kwargs) with backoff, retry classification and the service's breaker
+
+    Every attempt first waits for its turn in the service's rate-limited
+    scheduler (see scheduler.py).
+
+    Args:
+        service: Name of the upstream service, selects the circuit breaker and scheduler
+        func: The blocking client call
+        max_attempts: Total attempts including the first (default RETRY_MAX_ATTEMPTS)
+        stop_event: Optional threading.Event; a set event stops waiting and retrying
+        lane: Rate limit lane within the service (the Polly voice engine)
+        priority: Scheduler priority class (PRIORITY_FIRST_AUDIO, _INTERACTIVE, _BACKGROUND)
+        session_id: Session the request is for, so sessions are served fairly
+
+    Raises:
+        CircuitOpenError if the service's circuit is open, QueueTimeoutError
+        if the request waited too long for the rate limit, otherwise the last
+        error once it is permanent or the attempts are used up.
+    """
+    breaker = get_breaker(service)
+    scheduler = get_scheduler(service)
+    max_attempts = max_attempts or RETRY_MAX_ATTEMPTS
+    for attempt in range(max_attempts):
+        breaker.before_call()
+        try:
+            scheduler.acquire(lane, priority, session_id, stop_event)
+        except QueueTimeoutError:
+            breaker.release_trial()
+            raise
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            kind = classify_error(e)
+            if kind == PERMANENT:
+                breaker.release_trial()
+                raise
+            breaker.record_failure()
+            metrics.inc("upstream_errors_total", service=service, kind=kind)
+            if attempt + 1 >= max_attempts or breaker.is_open:
+                raise
+
+            retry_after = _retry_after(e)
+            delay = min(retry_after, RETRY_MAX_DELAY) if retry_after else backoff_delay(attempt, kind)
+            metrics.inc("retries_total", service=service)
+            if stop_event is not None:
+                if stop_event.wait(delay):
+                    raise
+            else:
+                time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+def _circuit_samples():
+    """Export circuit breaker states, 1 for the current state (metrics collector)"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [
+        ("circuit_state", "gauge", {"service": breaker.service, "state": state}, int(breaker.state == state))
+        for breaker in breakers
+        for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)
+    ]
+
+
+metrics.register_collector(_circuit_samples)
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import metrics
+from tts_cache import TTSCache
+
+# Opt-in: cached answers are replayed to everyone who asks the same thing
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0").lower() in ("1", "true", "yes")
+# Recent messages (before the prompt) that are part of the key; 0 = prompt only
+RESPONSE_CACHE_CONTEXT_MESSAGES = int(os.getenv("RESPONSE_CACHE_CONTEXT_MESSAGES", "2"))
+# Delay between replayed tokens, so a cached answer streams in like a live one
+RESPONSE_CACHE_REPLAY_DELAY = float(os.getenv("RESPONSE_CACHE_REPLAY_DELAY", "0.01"))
+
+# Word-sized pieces for replay (keeps the whitespace with the word before it)
+_REPLAY_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+
+
+def normalize_message(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation
+
+    "What can you do?" and "what can you do" share a cache entry.
+    """
+    return " ".join(text.lower().split()).rstrip(" .!?。！？")
+
+
+def response_cache_key(model, messages, context_messages=None):
+    """Key for the messages built by ConversationContext.build_messages
+
+    Covers the model, the system prompt (and rolling summary, if any), the
+    last context_messages history messages and the prompt, all normalized.
+    """
+    context_messages = RESPONSE_CACHE_CONTEXT_MESSAGES if context_messages is None else context_messages
+    system = [m["content"] for m in messages[:-1] if m["role"] == "system"]
+    history = [m for m in messages[:-1] if m["role"] != "system"]
+    window = history[-context_messages:] if context_messages else []
+
+    payload = {
+        "model": model,
+        "system": system,
+        "window": [[m["role"], normalize_message(m["content"])] for m in window],
+        "prompt": normalize_message(messages[-1]["content"]),
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def replay_tokens(text):
+    """Split a cached answer into word-sized tokens for a simulated stream"""
+    return _REPLAY_TOKEN_RE.findall(text)
+
+
+class ResponseCache:
+    """Cache of LLM answers, stored in a TTSCache (memory LRU + disk, TTL, size caps)
+
+    Only the text is stored. The audio for an answer is found through the
+    audio cache, under the same key synthesize_text uses for the full reply
+    (text, voice and format), so each voice/format links to its own clip.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached answer text or None"""
+        entry = self.store.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(entry.decode("utf-8"))["text"]
+
+    def put(self, key, text, model):
+        entry = {"text": text, "model": model, "stored_at": time.time()}
+        self.store.put(key, json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+
+    def clear(self):
+        self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache, or None unless RESPONSE_CACHE is enabled"""
+    global _shared_cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache(TTSCache(
+                cache_dir=os.getenv("RESPONSE_CACHE_DIR", "") or None,
+                memory_items=int(os.getenv("RESPONSE_CACHE_MEMORY_ITEMS", "512")),
+                memory_bytes=int(float(os.getenv("RESPONSE_CACHE_MEMORY_MB", "16")) * 1024 * 1024),
+                disk_bytes=int(float(os.getenv("RESPONSE_CACHE_DISK_MB", "64")) * 1024 * 1024),
+                ttl_seconds=int(float(os.getenv("RESPONSE_CACHE_TTL_HOURS", "24")) * 3600),
+            ))
+        return _shared_cache
+
+
+def _cache_samples():
+    """Export response cache hits and misses (metrics collector)"""
+    if _shared_cache is None:
+        return []
+    stats = _shared_cache.stats()
+    return [
+        ("cache_hits_total", "counter", {"cache": "response"}, stats["hits"]),
+        ("cache_misses_total", "counter", {"cache": "response"}, stats["misses"]),
+    ]
+
+
+metrics.register_collector(_cache_samples)
@@ -0,0 +1,226 @@
+import os
+import threading
+import time
+
+import metrics
+
+# Priority classes, most urgent first
+PRIORITY_FIRST_AUDIO = 0   # The first sentence of the reply being spoken
+PRIORITY_INTERACTIVE = 1   # Everything else the active turn is waiting for
+PRIORITY_BACKGROUND = 2    # Audio for older messages, summaries, pre-synthesis
+PRIORITY_NAMES = {PRIORITY_FIRST_AUDIO: "first_audio", PRIORITY_INTERACTIVE: "interactive",
+                  PRIORITY_BACKGROUND: "background"}
+
+# Requests per second and burst, as "rate/burst" ("" or 0 = unlimited), per service
+# and per lane (the Polly voice engine). Polly's account quotas are per engine.
+DEFAULT_RATE_LIMITS = {
+    "polly": "80/100",
+    "polly_standard": "",
+    "polly_neural": "8/10",
+    "huggingface": "",
+}
+# A request that waited this long for its turn fails instead of piling up
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", "30"))
+
+# How often a queued request re-checks its stop_event
+_STOP_POLL_SECONDS = 0.1
+
+
+class QueueTimeoutError(Exception):
+    """A request gave up waiting for its upstream service's rate limit"""
+
+    def __init__(self, service, waited, cancelled=False):
+        reason = "cancelled while queued" if cancelled else f"still queued after {waited:.1f}s"
+        super().__init__(f"{service} is at its request limit, {reason}")
+        self.service = service
+        self.waited = waited
+        self.cancelled = cancelled
+
+
+def parse_rate_limit(value):
+    """Return (rate, burst) for "rate/burst" or "rate", or None for unlimited"""
+    value = (value or "").strip()
+    if not value:
+        return None
+    rate, _, burst = value.partition("/")
+    rate = float(rate)
+    if rate <= 0:
+        return None
+    return rate, max(1.0, float(burst) if burst else rate)
+
+
+def rate_limit_for(key):
+    """The configured limit for a service or "service_lane" key (env RATE_LIMIT_<KEY>)"""
+    return parse_rate_limit(os.getenv(f"RATE_LIMIT_{key.upper()}", DEFAULT_RATE_LIMITS.get(key, "")))
+
+
+class TokenBucket:
+    """rate requests per second on average, up to burst at once"""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def wait_time(self):
+        """Seconds until a token is available (0 if one is available now)"""
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _Ticket:
+    __slots__ = ("priority", "tag", "seq", "session_id", "lane", "enqueued_at")
+
+    def __init__(self, priority, tag, seq, session_id, lane, enqueued_at):
+        self.priority = priority
+        self.tag = tag
+        self.seq = seq
+        self.session_id = session_id
+        self.lane = lane
+        self.enqueued_at = enqueued_at
+
+    def order(self):
+        return self.priority, self.tag, self.seq
+
+
+class ServiceScheduler:
+    """Rate-limited, prioritized and fair admission to one upstream service
+
+    A request needs a token from the service bucket and, if its lane (e.g.
+    the Polly voice engine) has a limit, from the lane bucket. Waiting
+    requests are admitted by priority class, then by a per-session virtual
+    tag (start-time fair queuing): a session with many queued requests gets
+    every other slot, not all of them, while other sessions are waiting.
+    """
+
+    def __init__(self, service, limit=None, lane_limits=None, clock=time.monotonic):
+        self.service = service
+        self.clock = clock
+        self._bucket = TokenBucket(*limit, clock=clock) if limit else None
+        self._lane_limits = lane_limits if lane_limits is not None else {}
+        self._lane_buckets = {}
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._last_tag = {}      # session_id -> tag of its newest ticket
+        self._virtual_time = 0   # Tag of the most recently admitted ticket
+        self._seq = 0
+
+    def _lane_bucket(self, lane):
+        if lane not in self._lane_buckets:
+            limit = self._lane_limits.get(lane) if lane in self._lane_limits else rate_limit_for(f"{self.service}_{lane}")
+            self._lane_buckets[lane] = TokenBucket(*limit, clock=self.clock) if limit else None
+        return self._lane_buckets[lane]
+
+    def queue_depth(self):
+        """{priority name: requests waiting}"""
+        with self._cond:
+            depth = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+            for ticket in self._waiting:
+                depth[PRIORITY_NAMES[ticket.priority]] += 1
+            return depth
+
+    def _wait_time(self, ticket):
+        """Seconds until both of the ticket's buckets have a token"""
+        lane_bucket = self._lane_bucket(ticket.lane) if ticket.lane else None
+        waits = [bucket.wait_time() for bucket in (self._bucket, lane_bucket) if bucket is not None]
+        return max(waits, default=0.0)
+
+    def _next_ticket(self):
+        """The best-ordered waiting ticket that could be admitted right now, or None"""
+        for ticket in sorted(self._waiting, key=_Ticket.order):
+            if self._wait_time(ticket) == 0:
+                return ticket
+            if self._bucket is not None and self._bucket.wait_time() > 0:
+                return None  # Nobody gets through until the shared bucket refills
+        return None
+
+    def acquire(self, lane=None, priority=PRIORITY_INTERACTIVE, session_id=None, stop_event=None, max_wait=None):
+        """Block until this request may be sent; returns the seconds spent waiting
+
+        Raises QueueTimeoutError after max_wait seconds (SCHEDULER_MAX_WAIT)
+        or when stop_event is set while waiting.
+        """
+        max_wait = SCHEDULER_MAX_WAIT if max_wait is None else max_wait
+        with self._cond:
+            if self._bucket is None and (lane is None or self._lane_bucket(lane) is None):
+                return 0.0  # Unlimited: no queue at all
+            now = self.clock()
+            tag = max(self._virtual_time, self._last_tag.get(session_id, 0)) + 1
+            self._last_tag[session_id] = tag
+            self._seq += 1
+            ticket = _Ticket(priority, tag, self._seq, session_id, lane, now)
+            self._waiting.append(ticket)
+            try:
+                while True:
+                    best = self._next_ticket()
+                    if best is ticket:
+                        self._admit(ticket)
+                        waited = self.clock() - ticket.enqueued_at
+                        metrics.observe("queue_wait_seconds", waited, service=self.service,
+                                        priority=PRIORITY_NAMES[priority])
+                        return waited
+
+                    waited = self.clock() - ticket.enqueued_at
+                    cancelled = stop_event is not None and stop_event.is_set()
+                    if cancelled or waited >= max_wait:
+                        metrics.inc("queue_timeouts_total", service=self.service, priority=PRIORITY_NAMES[priority])
+                        raise QueueTimeoutError(self.service, waited, cancelled)
+                    if best is not None:
+                        self._cond.notify_all()  # Someone ahead of us can go: wake them
+                    timeout = min(max(self._wait_time(ticket), 0.001), max_wait - waited)
+                    if stop_event is not None:
+                        timeout = min(timeout, _STOP_POLL_SECONDS)
+                    self._cond.wait(timeout)
+            finally:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    self._forget(ticket)
+                    self._cond.notify_all()
+
+    def _admit(self, ticket):
+        if self._bucket is not None:
+            self._bucket.take()
+        if ticket.lane and self._lane_bucket(ticket.lane) is not None:
+            self._lane_bucket(ticket.lane).take()
+        self._waiting.remove(ticket)
+        self._virtual_time = max(self._virtual_time, ticket.tag)
+        self._forget(ticket)
+        self._cond.notify_all()
+
+    def _forget(self, ticket):
+        # A session's tag only matters while it has newer requests queued
+        if self._last_tag.get(ticket.session_id) == ticket.tag:
+            del self._last_tag[ticket.session_id]
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(service):
+    """Return the process-wide scheduler for a service ("polly", "huggingface", ...)"""
+    with _schedulers_lock:
+        if service not in _schedulers:
+            _schedulers[service] = ServiceScheduler(service, rate_limit_for(service))
+        return _schedulers[service]
+
+
+def _queue_samples():
+    """Export requests waiting per service and priority (metrics collector)"""
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return [
+        ("scheduler_queue_depth", "gauge", {"service": scheduler.service, "priority": priority}, depth)
+        for scheduler in schedulers
+        for priority, depth in scheduler.queue_depth().items()
+    ]
+
+
+metrics.register_collector(_queue_samples)
@@ -0,0 +1,381 @@
+"""Streaming HTTP entry point for the voice pipeline (no Streamlit)
+
+POST /v1/turns with a WAV recording (Content-Type: audio/wav, settings in the
+query string) or a JSON body ({"text": ..., settings...}) and read the reply
+as it is produced: one JSON event per line (application/x-ndjson), the same
+events PipelineEngine emits. Audio events carry base64 clips and their MIME
+type. Conversations are stored per session_id (conversation_store.py) and
+survive restarts; pass the same session_id to continue one.
+
+Usage:
+    python server.py                      # SERVER_HOST / SERVER_PORT (default 127.0.0.1:8600)
+    python server.py --port 9000
+
+    curl -N --data-binary @question.wav -H "Content-Type: audio/wav" \\
+        "http://localhost:8600/v1/turns?session_id=abc&voice_id=Matthew"
+    curl -N -H "Content-Type: application/json" -d '{"text": "Hi!"}' http://localhost:8600/v1/turns
+"""
+import argparse
+import base64
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file (before our modules read their settings)
+load_dotenv()
+
+from audio_format import AudioFormat, audio_mime  # noqa: E402
+from clients import get_hf_client, get_polly_client  # noqa: E402
+from conversation_context import ConversationContext  # noqa: E402
+from conversation_store import get_conversation_store, open_conversation  # noqa: E402
+from metrics import start_metrics_server  # noqa: E402
+from pipeline import get_pipeline_engine, make_turn  # noqa: E402
+from tts import polly_available  # noqa: E402
+from warmup import start_warm_up  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Local only by default: listening on other interfaces requires SERVER_API_TOKEN
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8600"))
+# Requests must send "Authorization: Bearer <token>" when set
+SERVER_API_TOKEN = os.getenv("SERVER_API_TOKEN", "")
+# Largest accepted request body (a minute of 16 kHz mono WAV is about 2 MB)
+SERVER_MAX_BODY_MB = float(os.getenv("SERVER_MAX_BODY_MB", "10"))
+# Sessions kept in memory (the least recently used one is dropped first; its
+# conversation stays in the store and is resumed by its next request)
+SERVER_MAX_SESSIONS = int(os.getenv("SERVER_MAX_SESSIONS", "1000"))
+SERVER_SESSION_IDLE_SECONDS = float(os.getenv("SERVER_SESSION_IDLE_MINUTES", "60")) * 60
+
+
+def _string(value):
+    """Parser for string settings; a JSON body could send any type"""
+    if not isinstance(value, str):
+        raise ValueError(f"Expected a string, got {json.dumps(value)}")
+    return value
+
+
+# Turn settings accepted in the query string or JSON body, with their parsers
+TURN_SETTINGS = {
+    "voice_language": _string,
+    "translate_to": _string,
+    "personality": _string,
+    "voice_id": _string,
+    "tts_language": _string,
+    "stream_audio": lambda value: value if isinstance(value, bool) else str(value).lower() in ("1", "true", "yes"),
+}
+
+
+class Session:
+    """One conversation: its history, prompt context and the turn being answered
+
+    The history lives in the conversation store, so a session evicted from
+    memory (or lost in a restart) resumes where it left off.
+    """
+
+    def __init__(self, session_id=None):
+        self.messages = open_conversation(session_id)
+        self.session_id = self.messages.conversation_id
+        self.context = ConversationContext()
+        self.messages.restore_context(self.context)
+        self.active_turn = None
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class SessionRegistry:
+    """Live sessions by id, bounded by count and idle time"""
+
+    def __init__(self, max_sessions=SERVER_MAX_SESSIONS, idle_seconds=SERVER_SESSION_IDLE_SECONDS):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id=None):
+        """Return the session for session_id, resuming or creating it (with a new id if None)
+
+        Raises ValueError for a malformed session_id.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(session_id)
+                self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            session.last_used = now
+            return session
+
+    def drop(self, session_id):
+        """Forget the session and delete its stored conversation; True if either existed"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return get_conversation_store().delete(session_id)
+        if session.active_turn and not session.active_turn.finished:
+            session.active_turn.cancel()
+        session.messages.delete()  # A turn still finishing keeps its snapshot
+        return True
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) < self.max_sessions and now - session.last_used < self.idle_seconds:
+                return
+            del self._sessions[session_id]
+
+
+def event_json(event):
+    """One pipeline event as a JSON line (audio as base64 with its MIME type)"""
+    data = dict(event)
+    audio = data.get("audio")
+    if audio is not None:
+        data["mime"] = audio_mime(audio)
+        data["audio"] = base64.b64encode(audio).decode("ascii")
+    if "failures" in data:
+        data["failures"] = [{"part": number, "count": count, "error": error}
+                            for number, count, error in data["failures"]]
+    return (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class VoiceRequestHandler(BaseHTTPRequestHandler):
+    # Chunked responses need HTTP/1.1
+    protocol_version = "HTTP/1.1"
+    engine = None
+    sessions = None
+    api_token = ""
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/healthz":
+            self._send_json(404, {"error": "Not found"})
+            return
+        self._send_json(200, {"status": "ok", "voice": polly_available(), "sessions": len(self.sessions)})
+
+    def do_DELETE(self):
+        path = urlsplit(self.path).path
+        if not self._authorized():
+            return
+        if not path.startswith("/v1/sessions/"):
+            self._send_json(404, {"error": "Not found"})
+            return
+        found = self.sessions.drop(path.rsplit("/", 1)[-1])
+        self._send_json(200 if found else 404, {"deleted": found})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/v1/turns":
+            self._send_json(404, {"error": "Not found"})
+            return
+        if not self._authorized():
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            self._send_json(400, {"error": "Send a WAV recording or a JSON body with \"text\""})
+            return
+        if length > SERVER_MAX_BODY_MB * 1024 * 1024:
+            self.close_connection = True  # The unread body can't be skipped on a kept-alive connection
+            self._send_json(413, {"error": f"Request body is larger than {SERVER_MAX_BODY_MB:g} MB"})
+            return
+        body = self.rfile.read(length)
+
+        # Settings come from the query string, and for JSON requests also from the body
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        audio = text = None
+        if self.headers.get("Content-Type", "").split(";")[0].strip() == "application/json":
+            try:
+                params.update(json.loads(body))
+            except (ValueError, TypeError):
+                self._send_json(400, {"error": "Invalid JSON body"})
+                return
+            text = params.get("text")
+            if not isinstance(text, str) or not text.strip():
+                self._send_json(400, {"error": "JSON body needs a non-empty \"text\""})
+                return
+        else:
+            audio = body
+
+        try:
+            settings = {}
+            for name, parse in TURN_SETTINGS.items():
+                if name in params:
+                    try:
+                        settings[name] = parse(params[name])
+                    except ValueError as e:
+                        raise ValueError(f"\"{name}\": {e}") from e
+            audio_format = None
+            if "audio_format" in params:
+                sample_rate = params.get("sample_rate")
+                if not isinstance(params["audio_format"], str) or isinstance(sample_rate, bool) \
+                        or not isinstance(sample_rate, (str, int, type(None))):
+                    raise ValueError("\"audio_format\" must be a string and \"sample_rate\" a string or number")
+                audio_format = AudioFormat(params["audio_format"], sample_rate)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        try:
+            turn_settings = make_turn(audio=audio, text=text, audio_format=audio_format, **settings)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        session_id = params.get("session_id")
+        if session_id is not None and not isinstance(session_id, str):
+            self._send_json(400, {"error": "\"session_id\" must be a string"})
+            return
+        try:
+            session = self.sessions.get(session_id)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        self._stream_turn(session, turn_settings)
+
+    def _stream_turn(self, session, turn_settings):
+        """Run one turn for session and stream its events until "done" """
+        with session.lock:
+            # A new question in the same conversation replaces the one still being answered
+            if session.active_turn is not None and not session.active_turn.finished:
+                session.active_turn.cancel()
+            # A snapshot, so the messages this turn's reply appends don't leak into its own prompt
+            turn_settings.update(history=session.messages.snapshot(), context=session.context,
+                                 session_id=session.session_id)
+            turn = self.engine.start_turn(turn_settings)
+            session.active_turn = turn
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        prompt = response = None
+        try:
+            self._write_chunk(event_json({"type": "session", "session_id": session.session_id}))
+            for event in turn.events():
+                if event["type"] == "prompt":
+                    prompt = event["text"]
+                elif event["type"] == "response" and not event["error"]:
+                    response = event["text"]
+                self._write_chunk(event_json(event))
+
+            if prompt is not None and response is not None and not turn.cancelled:
+                with session.lock:
+                    session.messages.extend([{"role": "user", "content": prompt},
+                                             {"role": "assistant", "content": response}])
+            self._write_chunk(b"")
+        except ClientDisconnected:
+            turn.cancel()  # Nobody is listening: stop the LLM stream and synthesis
+            self.close_connection = True
+            return
+        # In the background, after the reply was delivered, so it never delays the audio
+        self.engine.start_fold_context(session.context, session.messages, session.session_id,
+                                       on_folded=session.messages.save_context)
+
+    def _write_chunk(self, data):
+        try:
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise ClientDisconnected() from e
+
+    def _authorized(self):
+        # Constant-time comparison, so response timing doesn't leak how much of a guess matched
+        supplied = self.headers.get("Authorization", "").encode("utf-8")
+        if not self.api_token or hmac.compare_digest(supplied, f"Bearer {self.api_token}".encode("utf-8")):
+            return True
+        self._send_json(401, {"error": "Missing or invalid API token"})
+        return False
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+def is_loopback(host):
+    """True if host only accepts connections from this machine"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def create_server(engine, host=SERVER_HOST, port=SERVER_PORT, sessions=None, api_token=None):
+    """Return a ThreadingHTTPServer serving engine (call serve_forever() on it)
+
+    Raises ValueError when asked to listen beyond loopback without an API
+    token: anyone who can reach the port could spend the Polly and Hugging
+    Face quotas and delete stored conversations.
+    """
+    api_token = SERVER_API_TOKEN if api_token is None else api_token
+    if not api_token and not is_loopback(host):
+        raise ValueError(f"Refusing to listen on {host} without SERVER_API_TOKEN; "
+                         "set a token or use SERVER_HOST=127.0.0.1")
+    handler = type("BoundVoiceRequestHandler", (VoiceRequestHandler,), {
+        "engine": engine,
+        "sessions": sessions or SessionRegistry(),
+        "api_token": api_token,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    hf_token = os.getenv("HUGGINGFACE_TOKEN")
+    if not hf_token:
+        raise SystemExit("❌ HUGGINGFACE_TOKEN not found in .env file")
+
+    client = get_hf_client(hf_token)
+    polly_client = get_polly_client()
+    start_warm_up(polly_client, client)
+    start_metrics_server()
+
+    try:
+        server = create_server(get_pipeline_engine(client, polly_client), args.host, args.port)
+    except ValueError as e:
+        raise SystemExit(f"❌ {e}")
+    logger.info("🎙️ Voice pipeline listening on http://%s:%s/v1/turns", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
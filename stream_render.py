@@ -0,0 +1,76 @@
+import os
+import time
+
+# Streamlit re-sends the whole markdown element on every update, so streamed text
+# is rendered at most this many times per second...
+STREAM_RENDER_FPS = float(os.getenv("STREAM_RENDER_FPS", "10"))
+# ...unless this many characters are waiting (a fast burst is shown without waiting a frame)
+STREAM_RENDER_MAX_PENDING = int(os.getenv("STREAM_RENDER_MAX_PENDING", "400"))
+
+CURSOR = "▌"
+
+
+class ThrottledRenderer:
+    """Buffers streamed tokens and re-renders the growing text at a bounded rate
+
+    render is called with the full text so far (plus a cursor) when at least
+    1 / fps seconds passed since the previous render, or when max_pending
+    characters are buffered. finish() always renders the complete text, so
+    the last tokens are never lost. bytes_sent and renders count what was
+    handed to render, i.e. what travels to the browser.
+    """
+
+    def __init__(self, render, fps=None, max_pending=None, cursor=CURSOR, clock=time.monotonic):
+        self.render = render
+        self.interval = 1.0 / (fps or STREAM_RENDER_FPS)
+        self.max_pending = max_pending or STREAM_RENDER_MAX_PENDING
+        self.cursor = cursor
+        self.clock = clock
+
+        self._rendered = ""    # Text up to the last flush (grows once per flush, not per token)
+        self._pending = []     # Tokens received since the last flush
+        self._pending_chars = 0
+        self._last_render = None
+        self.renders = 0
+        self.bytes_sent = 0
+
+    @property
+    def text(self):
+        """Everything received so far"""
+        return self._rendered + "".join(self._pending)
+
+    def append(self, token):
+        """Add a streamed token, rendering if a frame is due"""
+        self._pending.append(token)
+        self._pending_chars += len(token)
+        now = self.clock()
+        if (self._last_render is None or now - self._last_render >= self.interval
+                or self._pending_chars >= self.max_pending):
+            self.flush(now)
+
+    def flush(self, now=None):
+        """Render the buffered tokens now (with the cursor)"""
+        if not self._pending:
+            return
+        self._rendered += "".join(self._pending)
+        self._pending = []
+        self._pending_chars = 0
+        self._emit(self._rendered + self.cursor)
+        self._last_render = self.clock() if now is None else now
+
+    def finish(self, final_text=None):
+        """Render the complete text without the cursor and return it
+
+        final_text replaces the streamed text (e.g. an error message).
+        """
+        text = self.text if final_text is None else final_text
+        self._rendered = text
+        self._pending = []
+        self._pending_chars = 0
+        self._emit(text)
+        return text
+
+    def _emit(self, text):
+        self.render(text)
+        self.renders += 1
+        self.bytes_sent += len(text.encode("utf-8"))
@@ -0,0 +1,242 @@
+import io
+import os
+import queue
+import threading
+import wave
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+import speech_recognition as sr
+
+import metrics
+from audio_preprocess import preprocess_audio
+
+# Downmix, resample to 16 kHz and trim silence before recognition (STT_PREPROCESS=0 to disable)
+STT_PREPROCESS = os.getenv("STT_PREPROCESS", "1").lower() not in ("0", "false", "no")
+
+# Default recognizer settings (restored every time a recognizer goes back to the pool)
+ENERGY_THRESHOLD = 300  # Adjust sensitivity
+PAUSE_THRESHOLD = 0.8  # Seconds of non-speaking audio before a phrase is complete
+
+# Configured recognizers are reused instead of being built for every call.
+# A recognizer is only used by one caller at a time because adjust_for_ambient_noise
+# changes its energy threshold.
+_recognizer_pool = queue.SimpleQueue()
+
+
+def _new_recognizer():
+    recognizer = sr.Recognizer()
+
+    # Adjust recognizer settings for better accuracy
+    recognizer.energy_threshold = ENERGY_THRESHOLD
+    recognizer.dynamic_energy_threshold = True
+    recognizer.pause_threshold = PAUSE_THRESHOLD
+    return recognizer
+
+
+@contextmanager
+def borrowed_recognizer():
+    """Borrow a configured Recognizer from the pool and always return it"""
+    try:
+        recognizer = _recognizer_pool.get_nowait()
+    except queue.Empty:
+        recognizer = _new_recognizer()
+    try:
+        yield recognizer
+    finally:
+        recognizer.energy_threshold = ENERGY_THRESHOLD
+        _recognizer_pool.put(recognizer)
+
+
+def as_audio_stream(audio):
+    """Wrap recorded audio in a seekable in-memory stream
+
+    Accepts bytes, bytearray, memoryview or an existing binary file-like object.
+    BytesIO shares the buffer of a bytes object, so nothing is copied for the
+    common case of the raw bytes returned by the audio recorder.
+    """
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return io.BytesIO(audio)
+    audio.seek(0)
+    return audio
+
+
+def load_audio_data(recognizer, audio, adjust_for_noise=True):
+    """Read recorded WAV audio into an sr.AudioData without touching the filesystem
+
+    adjust_for_ambient_noise consumes the first half second of the clip, so it
+    is skipped for preprocessed audio (already trimmed to the speech).
+    """
+    with sr.AudioFile(as_audio_stream(audio)) as source:
+        if adjust_for_noise:
+            # Adjust for ambient noise
+            recognizer.adjust_for_ambient_noise(source, duration=0.5)
+        return recognizer.record(source)
+
+
+def prepare_audio(audio):
+    """Run preprocess_audio on a recording when enabled
+
+    Returns:
+        (audio, stats): the 16 kHz mono trimmed WAV and its stats, or the
+        original audio and None if preprocessing is off or the WAV isn't PCM.
+    """
+    if not STT_PREPROCESS:
+        return audio, None
+    if not isinstance(audio, (bytes, bytearray, memoryview)):
+        audio.seek(0)
+        audio = audio.read()
+    try:
+        return preprocess_audio(audio)
+    except (wave.Error, ValueError, EOFError):
+        return audio, None  # Let the recognizer try the original recording
+
+
+class STTBackend(ABC):
+    """Interface for speech-to-text engines
+
+    recognize() gets a borrowed Recognizer and the loaded sr.AudioData and
+    returns the transcript. Like the speech_recognition recognizers it raises
+    sr.UnknownValueError when no speech was understood and sr.RequestError
+    when the engine itself failed.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def recognize(self, recognizer, audio_data, language):
+        """Transcript of audio_data in language (a BCP-47 code such as "en-US")"""
+
+
+class GoogleSTTBackend(STTBackend):
+    """Google Web Speech API (network round trip per utterance)"""
+
+    name = "google"
+
+    def recognize(self, recognizer, audio_data, language):
+        return recognizer.recognize_google(audio_data, language=language, show_all=False)
+
+
+class WhisperSTTBackend(STTBackend):
+    """Local, CPU-only recognition with faster-whisper (pip install faster-whisper)
+
+    The model is loaded once per process on first use and shared by every
+    session. Concurrent calls are bounded by STT_LOCAL_WORKERS; CTranslate2
+    releases the GIL so they really run in parallel inside the process.
+    """
+
+    name = "whisper"
+
+    def __init__(self, model_size=None, workers=None, compute_type=None):
+        self.model_size = model_size or os.getenv("STT_WHISPER_MODEL", "base")
+        self.workers = workers or int(os.getenv("STT_LOCAL_WORKERS", "2"))
+        self.compute_type = compute_type or os.getenv("STT_WHISPER_COMPUTE_TYPE", "int8")
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.workers)
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                try:
+                    from faster_whisper import WhisperModel
+                except ImportError as e:
+                    raise sr.RequestError("faster-whisper is not installed (pip install faster-whisper)") from e
+                self._model = WhisperModel(
+                    self.model_size,
+                    device="cpu",
+                    compute_type=self.compute_type,
+                    num_workers=self.workers,
+                )
+            return self._model
+
+    def recognize(self, recognizer, audio_data, language):
+        import numpy as np
+
+        model = self._get_model()
+
+        # Whisper expects 16 kHz mono float32 samples in [-1, 1]
+        raw = audio_data.get_raw_data(convert_rate=16000, convert_width=2)
+        samples = np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+
+        # "en-US" -> "en", "yue-Hant-HK" -> "yue"; fall back to auto-detect if unsupported
+        whisper_language = language.split('-')[0].lower()
+        if whisper_language not in getattr(model, "supported_languages", [whisper_language]):
+            whisper_language = None
+
+        with self._slots:
+            try:
+                segments, _ = model.transcribe(samples, language=whisper_language, beam_size=1)
+                text = " ".join(segment.text.strip() for segment in segments).strip()
+            except Exception as e:
+                raise sr.RequestError(f"local recognition failed: {e}") from e
+
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+# Available backends, selected per deployment with STT_BACKEND
+STT_BACKENDS = {
+    GoogleSTTBackend.name: GoogleSTTBackend,
+    WhisperSTTBackend.name: WhisperSTTBackend,
+}
+
+_backend_instances = {}
+_backend_lock = threading.Lock()
+
+
+def register_stt_backend(name, factory):
+    """Make a backend available by name (e.g. a fake engine for offline runs)"""
+    with _backend_lock:
+        STT_BACKENDS[name] = factory
+        _backend_instances.pop(name, None)
+
+
+def get_stt_backend(name=None):
+    """Return the shared backend instance for name (default: STT_BACKEND env, "google")"""
+    name = (name or os.getenv("STT_BACKEND", "google")).lower()
+    with _backend_lock:
+        if name not in _backend_instances:
+            if name not in STT_BACKENDS:
+                raise ValueError(f"Unknown STT backend '{name}'. Available: {', '.join(STT_BACKENDS)}")
+            _backend_instances[name] = STT_BACKENDS[name]()
+        return _backend_instances[name]
+
+
+# transcribe_audio returns user-facing error messages starting with one of these
+TRANSCRIPTION_ERROR_PREFIXES = ("Error", "Could not", "Speech recognition", "Transcription error")
+
+
+def is_transcription_error(text):
+    """True if transcribe_audio returned an error message instead of speech"""
+    return not text or text.startswith(TRANSCRIPTION_ERROR_PREFIXES)
+
+
+# Function to transcribe audio with language support
+def transcribe_audio(audio_bytes, language="en-US", backend=None):
+    """Convert audio bytes to text using speech recognition
+
+    Args:
+        audio_bytes: WAV audio as bytes, bytearray, memoryview or a BytesIO
+        language: The speech recognition language code (e.g. "en-US")
+        backend: An STTBackend instance or name (default: the deployment's STT_BACKEND)
+    """
+    try:
+        if backend is None or isinstance(backend, str):
+            backend = get_stt_backend(backend)
+
+        audio_bytes, preprocessed = prepare_audio(audio_bytes)
+        with metrics.timed("transcription", backend=backend.name), borrowed_recognizer() as recognizer:
+            audio_data = load_audio_data(recognizer, audio_bytes, adjust_for_noise=preprocessed is None)
+
+            # Recognize speech in the specified language
+            text = backend.recognize(recognizer, audio_data, language)
+
+        return text if text else "Could not detect speech. Please try again."
+    except sr.UnknownValueError:
+        return "Could not understand audio. Please speak louder and more clearly, then try again."
+    except sr.RequestError as e:
+        return f"Speech recognition service error: {e}. Please check your internet connection."
+    except Exception as e:
+        return f"Transcription error: {str(e)}. Please try recording again."
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Memory-only caches, so tests neither read nor leave files behind
+os.environ["TTS_CACHE_DIR"] = ""
+os.environ["TRANSLATION_CACHE_DIR"] = ""
+os.environ["CONVERSATION_DB"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
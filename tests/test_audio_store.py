@@ -0,0 +1,79 @@
+import threading
+
+import audio_store
+from audio_store import AudioStore
+
+
+def test_spill_failure_drops_the_clip_instead_of_raising(tmp_path):
+    blocker = tmp_path / "not-a-directory"
+    blocker.write_text("")
+    store = AudioStore(spill_dir=str(blocker), session_bytes=10)
+
+    store.put("s1", "a", b"x" * 8)
+    store.put("s1", "b", b"y" * 8)
+
+    assert store.keys("s1") == ["b"]
+    assert store.get("s1", "b") == b"y" * 8
+    assert store.stats()["spill_failures"] == 1
+    assert store.stats()["memory_bytes"] == 8
+
+
+def test_spill_writes_happen_outside_the_lock(tmp_path, monkeypatch):
+    store = AudioStore(spill_dir=str(tmp_path), session_bytes=10)
+    store.put("s1", "a", b"x" * 8)
+
+    writing = threading.Event()
+    release = threading.Event()
+    real_open = open
+
+    def slow_open(path, mode="r", *args, **kwargs):
+        if "w" in mode:
+            writing.set()
+            release.wait(5)
+        return real_open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr(audio_store, "open", slow_open, raising=False)
+    writer = threading.Thread(target=store.put, args=("s1", "b", b"y" * 8))
+    writer.start()
+    assert writing.wait(5)
+
+    # The store stays usable, and the clip being written is still readable
+    assert store.get("s1", "a") == b"x" * 8
+    assert store.stats()["memory_bytes"] == 8
+
+    release.set()
+    writer.join(5)
+    assert store.get("s1", "a") == b"x" * 8
+    assert store.stats()["spilled"] == 1
+
+
+def test_idle_sessions_are_swept_at_most_once_per_interval(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(audio_store.time, "time", lambda: now[0])
+    store = AudioStore(spill_dir=str(tmp_path), session_bytes=10, idle_seconds=60, sweep_seconds=30)
+    store.put("old", "a", b"x" * 8)
+    store.put("old", "b", b"y" * 8)  # Spills "a" to old's directory
+    assert (tmp_path / "old").is_dir()
+
+    now[0] += 61
+    sweeps = []
+    real_evict_idle = store.evict_idle
+    monkeypatch.setattr(store, "evict_idle", lambda: sweeps.append(now[0]) or real_evict_idle())
+    store.put("new", "a", b"z")
+    store.put("new", "b", b"z")
+
+    assert sweeps == [now[0]]
+    assert store.keys("old") == [] and store.stats()["evicted_sessions"] == 1
+    assert not (tmp_path / "old").exists()
+
+
+def test_spill_directories_are_deleted_outside_the_lock(tmp_path, monkeypatch):
+    store = AudioStore(spill_dir=str(tmp_path), session_bytes=10)
+    store.put("s1", "a", b"x" * 8)
+    store.put("s1", "b", b"y" * 8)
+
+    held = []
+    monkeypatch.setattr(audio_store.shutil, "rmtree", lambda path, **kwargs: held.append(store._lock.locked()))
+    store.clear_session("s1")
+
+    assert held == [False]
@@ -0,0 +1,36 @@
+import batch
+from benchmarks.fakes import make_wav
+
+
+class _SilentTurn:
+    cancelled = False
+
+    def events(self, idle_timeout=None):
+        yield {"type": "transcript", "text": "hello"}
+        yield {"type": "done"}
+
+
+class _SilentEngine:
+    def start_turn(self, turn):
+        return _SilentTurn()
+
+
+def test_turn_without_response_is_an_error_with_a_message(tmp_path, monkeypatch):
+    path = tmp_path / "q.wav"
+    path.write_bytes(make_wav(0.5, 16000, 1, 440.0))
+    monkeypatch.setattr(batch, "_engine", _SilentEngine())
+    settings = {"voice_language": "en-US", "translate_to": None, "personality": batch.DEFAULT_PERSONALITY,
+                "voice_id": "Joanna", "tts_language": "english"}
+    monkeypatch.setattr(batch, "_settings", dict(settings, audio_format=None, item_timeout=5))
+
+    result = batch._process_item({"id": "q", "path": str(path)})
+
+    assert result["status"] == "error"
+    assert result["error"] == "Turn ended without a response"
+    assert result["transcript"] == "hello"
+
+
+def test_summary_tolerates_results_without_an_error_message(capsys):
+    results = [{"status": "error", "error": None, "input_seconds": 1.0, "stages": {}}]
+    batch.print_summary(results, 0, 1.0)
+    assert "1 × unknown error" in capsys.readouterr().out
@@ -0,0 +1,63 @@
+import http.server
+import logging
+import threading
+
+import boto3
+import pytest
+
+import clients
+
+
+class _AudioHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", "3")
+        self.end_headers()
+        self.wfile.write(b"mp3")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def polly_endpoint():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _AudioHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_polly_connections_are_counted_without_touching_urllib3_logging(monkeypatch, polly_endpoint):
+    monkeypatch.setattr(clients, "_service_for_host", lambda host: "polly" if host == "127.0.0.1" else None)
+    monkeypatch.setattr(clients, "_connection_stats", {"polly": {"requests": 0, "new_connections": 0}})
+    urllib3_logger = logging.getLogger("urllib3.connectionpool")
+    level, propagate = urllib3_logger.level, urllib3_logger.propagate
+
+    clients._install_botocore_connection_counter()
+    clients._install_botocore_connection_counter()
+    polly_client = boto3.client("polly", endpoint_url=polly_endpoint, region_name="us-east-1",
+                                aws_access_key_id="test", aws_secret_access_key="test")
+    polly_client.meta.events.register("before-send.polly", lambda **kwargs: clients._count("polly", "requests"))
+    for _ in range(3):
+        polly_client.synthesize_speech(Text="hi", VoiceId="Joanna", OutputFormat="mp3")["AudioStream"].read()
+
+    stats = clients.connection_stats()["polly"]
+    assert stats["requests"] == 3
+    assert stats["new_connections"] == 1
+    assert (urllib3_logger.level, urllib3_logger.propagate) == (level, propagate)
+
+
+def test_hf_session_falls_back_when_httpx_is_unavailable(monkeypatch, caplog):
+    monkeypatch.setattr(clients, "_hf_http_internals", lambda: (None, None))
+    calls = []
+    monkeypatch.setattr(clients.huggingface_hub, "set_client_factory", calls.append)
+
+    with caplog.at_level(logging.WARNING, logger="clients"):
+        clients._configure_hf_session()
+
+    assert calls == []
+    assert "Could not tune the Hugging Face HTTP client" in caplog.text
@@ -0,0 +1,59 @@
+import pytest
+
+from conversation_store import ConversationStore, SQLiteConversationStore, open_conversation
+
+
+@pytest.fixture
+def store():
+    return SQLiteConversationStore(":memory:")
+
+
+def message(n):
+    return {"role": "user" if n % 2 == 0 else "assistant", "content": f"message {n}"}
+
+
+def test_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        ConversationStore()
+
+
+def test_two_writers_on_one_id_stay_in_sync(store):
+    first = open_conversation("shared", store=store)
+    second = open_conversation("shared", store=store)
+
+    first.append(message(0))
+    second.append(message(1))
+    first.append(message(2))
+
+    expected = [message(n)["content"] for n in range(3)]
+    assert len(first) == 3
+    assert [m["content"] for m in first] == expected
+    assert [m["content"] for m in open_conversation("shared", store=store)] == expected
+
+
+def test_tail_and_pages_after_another_writer(store):
+    first = open_conversation("paged", store=store)
+    first.memory_messages, first.page_size = 3, 2
+    second = open_conversation("paged", store=store)
+    for n in range(6):
+        second.append(message(n))
+    first.append(message(6))
+
+    assert len(first) == 7
+    assert [m["content"] for m in first[:]] == [message(n)["content"] for n in range(7)]
+
+
+def test_snapshot_survives_delete(store):
+    conversation = open_conversation("doomed", store=store)
+    conversation.memory_messages, conversation.page_size = 2, 2
+    for n in range(5):
+        conversation.append(message(n))
+    view = conversation.snapshot()
+
+    conversation.delete()
+
+    assert len(conversation) == 0
+    assert not store.exists("doomed")
+    assert len(view) == 5
+    assert view[0]["content"] == "message 0"
+    assert [m["content"] for m in view[-2:]] == ["message 3", "message 4"]
@@ -0,0 +1,60 @@
+import phrases
+import warmup
+from audio_format import AudioFormat
+from benchmarks.fakes import FakePollyClient
+from tts import DEFAULT_AUDIO_FORMAT, POLLY_VOICE_OPTIONS
+
+
+def _fake_translation(monkeypatch):
+    monkeypatch.setattr(phrases, "translate_batch",
+                        lambda texts, source, target: ([f"[{target}] {text}" for text in texts], [None] * len(texts)))
+    monkeypatch.setattr(phrases, "translate_text", lambda text, source, target: (f"[{target}] {text}", None))
+
+
+def test_presynthesize_defaults_to_mapped_voices_in_the_default_format(monkeypatch):
+    _fake_translation(monkeypatch)
+    polly = FakePollyClient(base_latency=0, per_char_latency=0, jitter=0)
+
+    report = phrases.presynthesize_phrases(polly, languages=["english", "french"])
+
+    assert report["cached"] + report["synthesized"] == 2 * len(phrases.PHRASES)
+    calls = polly.calls
+    assert phrases.phrase_audio(polly, "llm_busy", "Joanna", "english", DEFAULT_AUDIO_FORMAT)
+    assert phrases.phrase_audio(polly, "llm_busy", "Matthew", "french", DEFAULT_AUDIO_FORMAT)
+    assert polly.calls == calls
+
+
+def test_presynthesize_warms_opted_in_voices_and_formats(monkeypatch):
+    _fake_translation(monkeypatch)
+    polly = FakePollyClient(base_latency=0, per_char_latency=0, jitter=0)
+    formats = phrases.offered_audio_formats()
+
+    report = phrases.presynthesize_phrases(polly, languages=["english", "french"],
+                                           voices=list(POLLY_VOICE_OPTIONS.values()), audio_formats=formats)
+
+    expected = len(phrases.PHRASES) * len(formats) * (len(POLLY_VOICE_OPTIONS) + 1)
+    assert report["cached"] + report["synthesized"] == expected
+    assert report["failed"] == 0 and report["skipped_languages"] == []
+
+    # A session with any offered voice and format gets its notice from the cache
+    calls = polly.calls
+    for voice_id in POLLY_VOICE_OPTIONS.values():
+        for audio_format in formats:
+            assert phrases.phrase_audio(polly, "llm_busy", voice_id, "english", audio_format)
+    assert phrases.phrase_audio(polly, "llm_busy", "Matthew", "french", AudioFormat("ogg_vorbis", "16000"))
+    assert polly.calls == calls
+
+
+def test_warm_up_voice_and_format_settings(monkeypatch):
+    assert warmup.warm_up_voices() == []
+    assert warmup.warm_up_audio_formats() == [DEFAULT_AUDIO_FORMAT]
+
+    monkeypatch.setattr(warmup, "WARMUP_VOICES", "Matthew, Ivy")
+    monkeypatch.setattr(warmup, "WARMUP_AUDIO_FORMATS", "pcm@8000,ogg_vorbis")
+    assert warmup.warm_up_voices() == ["Matthew", "Ivy"]
+    assert warmup.warm_up_audio_formats()[1:] == [AudioFormat("pcm", "8000"), AudioFormat("ogg_vorbis")]
+
+    monkeypatch.setattr(warmup, "WARMUP_VOICES", "all")
+    monkeypatch.setattr(warmup, "WARMUP_AUDIO_FORMATS", "all")
+    assert warmup.warm_up_voices() == list(POLLY_VOICE_OPTIONS.values())
+    assert warmup.warm_up_audio_formats() == phrases.offered_audio_formats()
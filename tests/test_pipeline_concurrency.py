@@ -0,0 +1,43 @@
+import concurrent.futures
+import os
+import threading
+import time
+
+from benchmarks.fakes import FakeInferenceClient, FakePollyClient
+from pipeline import PipelineEngine, make_turn
+
+# asyncio's default executor size (where sentence synthesis, STT and translation run)
+DEFAULT_EXECUTOR_THREADS = min(32, (os.cpu_count() or 1) + 4)
+
+
+def _first_audio_seconds(engine, prompt):
+    start = time.perf_counter()
+    turn = engine.start_turn(make_turn(text=prompt, session_id=prompt))
+    for event in turn.events(idle_timeout=0.5):
+        if event["type"] == "audio_segment":
+            turn.cancel()
+            return time.perf_counter() - start
+        if time.perf_counter() - start > 20:
+            turn.cancel()
+            return None
+    return None
+
+
+def test_more_turns_than_executor_threads_all_get_audio():
+    # Long replies fill the small token queues, so every LLM stream blocks on its consumer
+    reply = " ".join(f"This is sentence number {n}." for n in range(150))
+    engine = PipelineEngine(
+        FakeInferenceClient(reply=reply, time_to_first_token=0.01, token_latency=0, jitter=0),
+        FakePollyClient(base_latency=0.01, jitter=0),
+        queue_size=4,
+    )
+    turns = DEFAULT_EXECUTOR_THREADS + 3
+    barrier = threading.Barrier(turns)
+
+    def run(number):
+        barrier.wait()
+        return _first_audio_seconds(engine, f"question {number} {threading.get_ident()}")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=turns) as pool:
+        results = list(pool.map(run, range(turns)))
+    assert all(seconds is not None for seconds in results), results
@@ -0,0 +1,19 @@
+import pipeline
+from benchmarks.fakes import FakeInferenceClient, FakePollyClient
+from pipeline import PipelineEngine, make_turn
+
+
+def test_unexpected_error_ends_the_turn_with_an_error_response(monkeypatch):
+    def broken_transcribe(audio, language):
+        raise KeyError("voice_language")
+
+    monkeypatch.setattr(pipeline, "transcribe_audio", broken_transcribe)
+    engine = PipelineEngine(FakeInferenceClient(), FakePollyClient(base_latency=0, jitter=0))
+
+    turn = engine.start_turn(make_turn(audio=b"RIFF", session_id="errors"))
+    events = list(turn.events(idle_timeout=5))
+    types = [event["type"] for event in events if event["type"] != "idle"]
+
+    assert types == ["response", "done"]
+    assert "voice_language" in events[0]["error"]
+    assert events[0]["retryable"] is False
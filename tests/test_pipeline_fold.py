@@ -0,0 +1,56 @@
+import threading
+
+from benchmarks.fakes import FakeInferenceClient, FakePollyClient
+from conversation_context import ConversationContext
+from pipeline import PipelineEngine
+
+
+def _engine_and_context(summarize):
+    engine = PipelineEngine(FakeInferenceClient(), FakePollyClient(base_latency=0, jitter=0))
+    engine.summarize = summarize
+    history = [{"role": "user" if n % 2 == 0 else "assistant", "content": f"message {n} " * 20} for n in range(10)]
+    context = ConversationContext(token_budget=200, summarize=True)
+    context.build_messages("You are helpful.", history, "next question")
+    assert context.window_start > 0
+    return engine, context, history
+
+
+def test_fold_runs_in_the_background_and_reports_the_new_summary():
+    release = threading.Event()
+
+    def summarize(request, max_tokens, session_id=None):
+        release.wait(5)
+        return "The user asked about several things."
+
+    engine, context, history = _engine_and_context(summarize)
+    folded = []
+    future = engine.start_fold_context(context, history, on_folded=folded.append)
+
+    # Returns while the summary call is still waiting
+    assert not future.done()
+    assert engine.start_fold_context(context, history).result(5) is False  # One fold per context at a time
+
+    release.set()
+    assert future.result(5) is True
+    assert folded == [context]
+    assert context.summary == "The user asked about several things."
+    assert context.summarized_count == context.window_start
+
+
+def test_fold_finishing_after_a_reset_is_dropped():
+    started, release = threading.Event(), threading.Event()
+
+    def summarize(request, max_tokens, session_id=None):
+        started.set()
+        release.wait(5)
+        return "Stale summary"
+
+    engine, context, history = _engine_and_context(summarize)
+    future = engine.start_fold_context(context, history)
+    assert started.wait(5)
+    context.reset()  # The user cleared the chat meanwhile
+    release.set()
+
+    assert future.result(5) is False
+    assert context.summary == ""
+    assert context.summarized_count == 0
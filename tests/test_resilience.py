@@ -0,0 +1,35 @@
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from resilience import PERMANENT, THROTTLED, TRANSIENT, call_with_retry, classify_error
+from tts import EmptyAudioStream
+
+
+def _client_error(code, status):
+    return ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "SynthesizeSpeech")
+
+
+@pytest.mark.parametrize("error, kind", [
+    (_client_error("ThrottlingException", 400), THROTTLED),
+    (_client_error("ServiceFailureException", 500), TRANSIENT),
+    (_client_error("InvalidSsmlException", 400), PERMANENT),
+    (EndpointConnectionError(endpoint_url="https://polly"), TRANSIENT),
+    (TimeoutError(), TRANSIENT),
+    (EmptyAudioStream("Polly returned no audio stream"), TRANSIENT),
+    (KeyError("choices"), PERMANENT),
+    (TypeError("bad argument"), PERMANENT),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+
+def test_unknown_errors_are_not_retried():
+    calls = []
+
+    def buggy():
+        calls.append(1)
+        raise KeyError("choices")
+
+    with pytest.raises(KeyError):
+        call_with_retry("resilience-test", buggy, max_attempts=3)
+    assert len(calls) == 1
@@ -0,0 +1,61 @@
+import uuid
+
+import pipeline
+import response_cache
+from benchmarks.fakes import FakeInferenceClient, FakePollyClient
+from pipeline import PipelineEngine, make_turn
+from response_cache import ResponseCache, replay_tokens, response_cache_key
+from tts_cache import TTSCache
+
+
+def _messages(prompt, history=()):
+    return [{"role": "system", "content": "Be brief."}, *history, {"role": "user", "content": prompt}]
+
+
+def test_key_ignores_case_spacing_and_trailing_punctuation():
+    key = response_cache_key("model", _messages("What can you do?"))
+    assert response_cache_key("model", _messages("  what CAN you   do")) == key
+    assert response_cache_key("other-model", _messages("What can you do?")) != key
+    assert response_cache_key("model", _messages("What can you do?", [{"role": "user", "content": "Hi"}])) != key
+
+
+def test_key_only_covers_the_recent_history_window():
+    old = [{"role": "user", "content": "Old question"}, {"role": "assistant", "content": "Old answer"}]
+    recent = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello!"}]
+    assert response_cache_key("model", _messages("And you?", old + recent), context_messages=2) == \
+        response_cache_key("model", _messages("And you?", recent), context_messages=2)
+
+
+def test_replay_tokens_rebuild_the_text():
+    text = "Sure! Here  is\nthe answer. "
+    tokens = replay_tokens(text)
+    assert len(tokens) > 1 and "".join(tokens) == text
+
+
+def test_cache_is_off_unless_enabled():
+    assert response_cache.get_response_cache() is None
+
+
+def _run(engine, prompt, session_id):
+    events = [event for event in engine.start_turn(make_turn(text=prompt, session_id=session_id)).events(idle_timeout=5)
+              if event["type"] != "idle"]
+    return events, next(event for event in events if event["type"] == "response")
+
+
+def test_repeated_question_is_replayed_as_a_stream_with_its_audio(monkeypatch):
+    monkeypatch.setattr(pipeline, "RESPONSE_CACHE_REPLAY_DELAY", 0)
+    reply = f"Answer {uuid.uuid4().hex[:8]}. It has two sentences to speak."
+    llm = FakeInferenceClient(reply=reply, time_to_first_token=0, token_latency=0, jitter=0)
+    polly = FakePollyClient(base_latency=0, jitter=0)
+    engine = PipelineEngine(llm, polly, response_cache=ResponseCache(TTSCache(None)))
+
+    _, first = _run(engine, "What can you do?", "cache-1")
+    assert first["text"] == reply and first["cached"] is False
+    polly_calls = polly.calls
+
+    events, second = _run(engine, "what can you do", "cache-2")
+    tokens = [event["text"] for event in events if event["type"] == "token"]
+    assert second["cached"] is True and second["text"] == reply
+    assert len(tokens) > 1 and "".join(tokens) == reply  # Streamed in like a live answer
+    assert llm.calls == 1 and polly.calls == polly_calls  # Neither the model nor Polly was asked again
+    assert [event["type"] for event in events].count("audio") == 1
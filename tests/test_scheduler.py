@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_FIRST_AUDIO,
+    PRIORITY_INTERACTIVE,
+    QueueTimeoutError,
+    ServiceScheduler,
+    TokenBucket,
+    parse_rate_limit,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize("value, limit", [
+    ("", None), ("0", None), ("0/10", None), ("5", (5.0, 5.0)), ("8/10", (8.0, 10.0)), ("0.5", (0.5, 1.0)),
+])
+def test_parse_rate_limit(value, limit):
+    assert parse_rate_limit(value) == limit
+
+
+def test_token_bucket_allows_a_burst_then_refills_at_the_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=3, clock=clock)
+    for _ in range(3):
+        assert bucket.wait_time() == 0
+        bucket.take()
+    assert bucket.wait_time() == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert bucket.wait_time() == 0
+    clock.now += 10
+    bucket.wait_time()
+    assert bucket.tokens == 3  # Never more than the burst
+
+
+def _queue(scheduler, requests):
+    """Queue (priority, session_id) requests one after another, return the order they were admitted in"""
+    admitted = []
+    threads = []
+    for number, (priority, session_id) in enumerate(requests):
+        def request(number=number, priority=priority, session_id=session_id):
+            scheduler.acquire(priority=priority, session_id=session_id, max_wait=5)
+            admitted.append(number)
+
+        threads.append(threading.Thread(target=request))
+        threads[-1].start()
+        while sum(scheduler.queue_depth().values()) < number + 1:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(5)
+    return admitted
+
+
+def _drained_scheduler(rate):
+    scheduler = ServiceScheduler("test", limit=(rate, 1))
+    scheduler.acquire(session_id="warm-up")  # Uses the only token, so the next requests queue
+    return scheduler
+
+
+def test_more_urgent_requests_go_first():
+    scheduler = _drained_scheduler(rate=5)
+    order = _queue(scheduler, [(PRIORITY_BACKGROUND, "a"), (PRIORITY_INTERACTIVE, "b"), (PRIORITY_FIRST_AUDIO, "c")])
+    assert order == [2, 1, 0]
+
+
+def test_sessions_share_the_rate_fairly():
+    scheduler = _drained_scheduler(rate=5)
+    order = _queue(scheduler, [(PRIORITY_INTERACTIVE, "busy")] * 3 + [(PRIORITY_INTERACTIVE, "quiet")])
+    assert order == [0, 3, 1, 2]  # The quiet session doesn't wait behind the busy one's backlog
+
+
+def test_queued_request_gives_up_after_max_wait_or_when_cancelled():
+    scheduler = _drained_scheduler(rate=0.1)
+    with pytest.raises(QueueTimeoutError) as timed_out:
+        scheduler.acquire(max_wait=0.05)
+    assert not timed_out.value.cancelled
+
+    stop = threading.Event()
+    stop.set()
+    with pytest.raises(QueueTimeoutError) as cancelled:
+        scheduler.acquire(stop_event=stop)
+    assert cancelled.value.cancelled
+    assert sum(scheduler.queue_depth().values()) == 0
+
+
+def test_unlimited_service_never_queues():
+    scheduler = ServiceScheduler("test", limit=None, lane_limits={"standard": None})
+    assert all(scheduler.acquire(lane="standard") == 0.0 for _ in range(100))
@@ -0,0 +1,50 @@
+import uuid
+
+from benchmarks.fakes import FakeInferenceClient, FakePollyClient
+from pipeline import PipelineEngine, make_turn
+from tts import SentenceSplitter
+
+
+def _feed_tokens(splitter, text):
+    sentences = []
+    for token in text.split(" "):
+        sentences += splitter.feed(token + " ")
+    return sentences + splitter.flush()
+
+
+def test_sentences_are_released_as_soon_as_they_end():
+    splitter = SentenceSplitter(min_chars=0)
+    assert splitter.feed("Hello there. How") == ["Hello there."]
+    assert splitter.feed(" are you?") == []  # Not until whitespace follows the "?"
+    assert splitter.feed(" Fine") == ["How are you?"]
+    assert splitter.flush() == ["Fine"]
+
+
+def test_short_sentences_are_merged_and_decimals_kept_whole():
+    text = "1. Pi is 3.14 and that is plenty. Yes. Bye now, see you later!"
+    assert _feed_tokens(SentenceSplitter(min_chars=20), text) == [
+        "1. Pi is 3.14 and that is plenty.",
+        "Yes. Bye now, see you later!",
+    ]
+
+
+def test_cjk_sentences_split_without_spaces():
+    splitter = SentenceSplitter(min_chars=0)
+    assert splitter.feed("你好。今天") == ["你好。"]
+    assert splitter.flush() == ["今天"]
+
+
+def test_first_sentence_is_spoken_before_the_reply_finishes():
+    tag = uuid.uuid4().hex[:8]  # A fresh reply, so no sentence comes from the shared audio cache
+    reply = f"This first sentence {tag} is long enough to speak. " + "Then the model keeps going. " * 10
+    engine = PipelineEngine(FakeInferenceClient(reply=reply.strip(), time_to_first_token=0, token_latency=0.02,
+                                                jitter=0),
+                            FakePollyClient(base_latency=0, jitter=0))
+
+    turn = engine.start_turn(make_turn(text="Hi", session_id=f"stream-{tag}"))
+    types = [event["type"] for event in turn.events(idle_timeout=5) if event["type"] != "idle"]
+
+    first_audio = types.index("audio_segment")
+    assert "token" in types[first_audio:]  # Audio started while tokens were still streaming
+    assert types.count("audio_segment") > 1
+    assert types.index("response") > first_audio
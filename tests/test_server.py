@@ -0,0 +1,43 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def post():
+    # Every request here is rejected before a turn starts, so no engine is needed
+    srv = server.create_server(None, "127.0.0.1", 0, api_token="secret")
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+
+    def send(payload, token="secret"):
+        connection = http.client.HTTPConnection("127.0.0.1", srv.server_address[1], timeout=5)
+        connection.request("POST", "/v1/turns", body=json.dumps(payload),
+                           headers={"Content-Type": "application/json", "Authorization": f"Bearer {token}"})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    yield send
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.mark.parametrize("payload", [
+    {"personality": ["Pirate"]},
+    {"personality": {"name": "Pirate"}},
+    {"voice_id": 7},
+    {"audio_format": ["mp3"]},
+    {"audio_format": "mp3", "sample_rate": [16000]},
+    {"audio_format": "flac"},
+])
+def test_malformed_settings_are_rejected_with_400(post, payload):
+    status, body = post({"text": "Hello", **payload})
+    assert status == 400
+    assert body["error"]
+
+
+def test_wrong_token_is_rejected(post):
+    assert post({"text": "Hello"}, token="guess")[0] == 401
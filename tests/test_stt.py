@@ -0,0 +1,20 @@
+import pytest
+
+import stt
+from benchmarks.fakes import FakeRecognizerBackend
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        stt.STTBackend()
+
+    class Incomplete(stt.STTBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_registered_backends_implement_recognize():
+    for backend in (stt.GoogleSTTBackend(), stt.WhisperSTTBackend(), FakeRecognizerBackend(latency=0)):
+        assert isinstance(backend, stt.STTBackend)
@@ -0,0 +1,67 @@
+import time
+
+from tts import POLLY_MAX_CHARS, sentence_spans, split_text_for_tts
+
+
+def _assert_chunks_cover(text, chunks, max_chars):
+    assert all(0 < len(chunk) <= max_chars for chunk in chunks)
+    # Nothing lost or reordered, only whitespace at the cuts
+    assert "".join("".join(chunk.split()) for chunk in chunks) == "".join(text.split())
+
+
+def test_short_text_is_one_chunk():
+    assert split_text_for_tts("Hello there. How are you?") == ["Hello there. How are you?"]
+
+
+def test_chunks_end_at_the_last_sentence_that_fits():
+    text = "One two three. Four five six. Seven eight nine."
+    assert split_text_for_tts(text, max_chars=30) == ["One two three. Four five six.", "Seven eight nine."]
+
+
+def test_decimals_are_not_sentence_ends():
+    text = "Pi is 3.14 today. Next"
+    assert [text[s:e] for s, e in sentence_spans(text)] == ["Pi is 3.14 today.", " Next"]
+
+
+def test_spans_cover_the_whole_text():
+    text = "  Hi! Ça va ? 你好。今天很好！ مرحبا؟ नमस्ते। end"
+    spans = list(sentence_spans(text))
+    assert "".join(text[s:e] for s, e in spans) == text
+    assert [text[s:e].strip() for s, e in spans] == ["Hi!", "Ça va ?", "你好。", "今天很好！", "مرحبا؟", "नमस्ते।", "end"]
+
+
+def test_cjk_text_splits_at_full_width_punctuation():
+    text = "今天天气很好。" * 10
+    chunks = split_text_for_tts(text, max_chars=20)
+    assert chunks[0] == "今天天气很好。今天天气很好。"
+    _assert_chunks_cover(text, chunks, 20)
+
+
+def test_long_sentence_is_cut_at_clauses_then_whitespace_then_hard():
+    clauses = "alpha beta, gamma delta, epsilon zeta, eta theta"
+    assert split_text_for_tts(clauses, max_chars=25)[0] == "alpha beta, gamma delta,"
+
+    words = "word " * 20
+    chunks = split_text_for_tts(words, max_chars=22)
+    assert all(chunk.endswith("word") for chunk in chunks)
+
+    unbroken = "字" * 50
+    assert split_text_for_tts(unbroken, max_chars=20) == ["字" * 20, "字" * 20, "字" * 10]
+
+
+def test_split_time_grows_linearly():
+    sentence = "This is a fairly ordinary sentence, with a clause. "
+
+    def seconds(repeats):
+        text = sentence * repeats
+        timings = []
+        for _ in range(5):  # Best of 5, so a busy machine doesn't make the test flaky
+            start = time.perf_counter()
+            chunks = split_text_for_tts(text, max_chars=POLLY_MAX_CHARS)
+            timings.append(time.perf_counter() - start)
+        _assert_chunks_cover(text, chunks, POLLY_MAX_CHARS)
+        return min(timings)
+
+    small, large = seconds(2000), seconds(20000)
+    # 10x the text: a quadratic splitter would take ~100x as long
+    assert large < small * 30
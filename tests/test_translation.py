@@ -0,0 +1,60 @@
+import threading
+
+import translation
+
+
+def test_translators_are_not_shared_between_threads():
+    mine = translation.get_translator("english", "french")
+    assert translation.get_translator("english", "french") is mine
+
+    theirs = []
+    thread = threading.Thread(target=lambda: theirs.append(translation.get_translator("english", "french")))
+    thread.start()
+    thread.join()
+    assert theirs[0] is not mine
+
+
+def test_concurrent_batches_keep_their_own_texts(monkeypatch):
+    # Mimics deep_translator: the text is stored on the instance, then the request is made
+    class StatefulTranslator:
+        def __init__(self, source, target):
+            self._params = {}
+
+        def translate(self, text):
+            self._params["q"] = text
+            barrier.wait()
+            return "fr:" + self._params["q"]
+
+    barrier = threading.Barrier(4)
+    monkeypatch.setattr(translation, "GoogleTranslator", StatefulTranslator)
+    monkeypatch.setattr(translation, "_local", threading.local())
+
+    results = {}
+
+    def run(text):
+        results[text] = translation.translate_text(text, "english", "french")[0]
+
+    texts = [f"private message {n} {threading.get_ident()}" for n in range(4)]
+    threads = [threading.Thread(target=run, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {text: "fr:" + text for text in texts}
+
+
+def test_unsupported_target_falls_back_to_the_original_text(monkeypatch):
+    class UnsupportedTranslator:
+        def __init__(self, source, target):
+            raise ValueError(f"{target} is not supported")
+
+    monkeypatch.setattr(translation, "GoogleTranslator", UnsupportedTranslator)
+    monkeypatch.setattr(translation, "_local", threading.local())
+    failures = translation.translation_stats()["failures"]
+
+    translations, errors = translation.translate_batch(["Hello there", "How are you?"], "english", "cantonese")
+
+    assert translations == ["Hello there", "How are you?"]
+    assert all(error and "cantonese is not supported" in error for error in errors)
+    assert translation.translation_stats()["failures"] == failures + 1
+    assert translation.translate_text("Hello there", "english", "cantonese")[0] == "Hello there"
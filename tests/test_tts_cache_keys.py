@@ -0,0 +1,57 @@
+import os
+import uuid
+
+import tts_cache
+
+from audio_format import AudioFormat, assemble_audio, audio_mime
+from benchmarks.fakes import FakePollyClient
+from tts import clean_text_for_tts, resolve_voice, synthesize_cached, synthesize_text
+from tts_cache import TTSCache
+
+PCM = AudioFormat("pcm", "16000")
+
+
+def _sentence():
+    # A new text per test, so the process-wide cache starts empty for it
+    return f"Hello there number {uuid.uuid4().hex[:8]}."
+
+
+def _chunk(polly, text):
+    voice_id, language_code, engine = resolve_voice("Joanna", "english")
+    return synthesize_cached(polly, clean_text_for_tts(text), voice_id, language_code, engine, audio_format=PCM)
+
+
+def test_clip_after_cached_chunk_is_a_wav():
+    polly = FakePollyClient(base_latency=0, jitter=0)
+    text = _sentence()
+    chunk, error = _chunk(polly, text)
+    assert error is None and not chunk.startswith(b"RIFF")
+
+    clip, failures = synthesize_text(polly, text, "Joanna", "english", audio_format=PCM)
+    assert failures == []
+    assert audio_mime(clip) == "audio/wav"
+    assert clip.count(b"RIFF") == 1
+
+
+def test_chunk_after_cached_clip_is_raw():
+    polly = FakePollyClient(base_latency=0, jitter=0)
+    text = _sentence()
+    clip, _ = synthesize_text(polly, text, "Joanna", "english", audio_format=PCM)
+    assert clip.startswith(b"RIFF")
+
+    chunk, error = _chunk(polly, text)
+    assert error is None and not chunk.startswith(b"RIFF")
+    assert assemble_audio([chunk], PCM).count(b"RIFF") == 1
+
+
+def test_failed_disk_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    cache = TTSCache(str(tmp_path))
+
+    def full_disk(src, dst):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(tts_cache.os, "replace", full_disk)
+    cache.put("key", b"audio")
+
+    assert cache.get("key") == b"audio"  # Still served from memory
+    assert not [name for _, _, files in os.walk(tmp_path) for name in files]
@@ -0,0 +1,72 @@
+import threading
+import time
+import uuid
+
+from audio_format import AudioFormat
+from tts import synthesize_text
+
+MP3 = AudioFormat("mp3", "22050")
+
+
+class EchoPolly:
+    """Returns each chunk's text as its audio; earlier chunks answer slower"""
+
+    class meta:
+        class events:
+            @staticmethod
+            def register(*args, **kwargs):
+                pass
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.active = 0
+        self.max_active = 0
+        self.finished = []
+        self._lock = threading.Lock()
+
+    def synthesize_speech(self, Text, **kwargs):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(0.2 if Text.startswith("First") else 0.05)
+            if self.fail_on and Text.startswith(self.fail_on):
+                return {}  # No audio stream
+            return {"AudioStream": _Stream(Text.encode("utf-8"))}
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.finished.append(Text.split()[0])
+
+
+class _Stream:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+def _long_text():
+    # Three sentences of ~2000 characters: too long to share a 3000-character chunk
+    tag = uuid.uuid4().hex[:8]
+    return " ".join(f"{word} {tag} " + "word " * 400 + "end." for word in ("First", "Second", "Third"))
+
+
+def test_chunks_are_synthesized_concurrently_and_reassembled_in_order():
+    polly = EchoPolly()
+    audio, failures = synthesize_text(polly, _long_text(), audio_format=MP3)
+
+    assert failures == []
+    assert polly.max_active > 1
+    assert polly.finished[-1] == "First"  # The first chunk finished last...
+    positions = [audio.index(word.encode()) for word in ("First", "Second", "Third")]
+    assert positions == sorted(positions)  # ...but its audio still comes first
+
+
+def test_a_failed_chunk_is_reported_by_position_and_the_rest_kept():
+    polly = EchoPolly(fail_on="Second")
+    audio, failures = synthesize_text(polly, _long_text(), audio_format=MP3, max_retries=0)
+
+    assert [(number, count) for number, count, _ in failures] == [(2, 3)]
+    assert b"First" in audio and b"Third" in audio and b"Second" not in audio
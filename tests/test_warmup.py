@@ -0,0 +1,17 @@
+import warmup
+
+
+def test_failed_warm_up_still_publishes_a_report(monkeypatch, caplog):
+    def broken_probe(polly_client, hf_client):
+        raise RuntimeError("no route to host")
+
+    monkeypatch.setattr(warmup, "warm_up_clients", broken_probe)
+    monkeypatch.setattr(warmup, "_report", None)
+
+    warmup._run_and_report(None, None)
+
+    report = warmup.warm_up_report()
+    assert report["error"] == "no route to host"
+    assert report["phrases"] is None and report["stages"] == {}
+    assert "Warm-up failed" in caplog.text
+    assert warmup._warm_up_samples() == [("warm_up_seconds", "gauge", {}, report["seconds"])]
@@ -0,0 +1,217 @@
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+
+from deep_translator import GoogleTranslator
+
+import metrics
+from tts_cache import TTSCache
+
+# Segments are joined with this separator for a single batched request
+BATCH_SEPARATOR = "\n"
+# Google's web endpoint rejects requests over 5000 characters
+BATCH_MAX_CHARS = 4500
+
+# Map speech recognition language codes to Google Translator language codes
+SPEECH_TO_TRANSLATOR_LANG = {
+    "en": "english",
+    "zh": "chinese (simplified)",
+    "yue": "chinese (traditional)",
+    "fr": "french"
+}
+
+# GoogleTranslator instances per thread (see get_translator)
+_local = threading.local()
+
+# Recent failures, kept so they can be shown in diagnostics instead of being lost
+_failures = deque(maxlen=100)
+_stats = {"hits": 0, "misses": 0, "requests": 0, "failures": 0}
+_stats_lock = threading.Lock()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    """Process-wide translation cache (memory LRU + disk, same store as TTS audio)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TTSCache(
+                cache_dir=os.getenv("TRANSLATION_CACHE_DIR", ".translation_cache") or None,
+                memory_items=int(os.getenv("TRANSLATION_CACHE_MEMORY_ITEMS", "2048")),
+                memory_bytes=8 * 1024 * 1024,
+                disk_bytes=int(float(os.getenv("TRANSLATION_CACHE_DISK_MB", "64")) * 1024 * 1024),
+                ttl_seconds=int(float(os.getenv("TRANSLATION_CACHE_TTL_HOURS", "720")) * 3600),
+            )
+        return _cache
+
+
+def source_language_for(voice_language):
+    """Translator source language for a speech recognition code like "zh-CN" """
+    return SPEECH_TO_TRANSLATOR_LANG.get(voice_language.split('-')[0], "auto")
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different inputs share a cache entry"""
+    return " ".join(text.split())
+
+
+def _cache_key(source, target, text):
+    payload = "\x1f".join([source, target, text])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_translator(source, target):
+    """Return this thread's reusable GoogleTranslator for the language pair
+
+    deep_translator keeps the text being translated on the instance while the
+    request is made, so a translator shared between threads could answer one
+    session with another session's text. Each thread gets its own.
+    """
+    translators = getattr(_local, "translators", None)
+    if translators is None:
+        translators = _local.translators = {}
+    translator = translators.get((source, target))
+    if translator is None:
+        translator = GoogleTranslator(source=source, target=target)
+        translators[(source, target)] = translator
+    return translator
+
+
+def _record_failure(source, target, error):
+    metrics.inc("errors_total", stage="translation")
+    with _stats_lock:
+        _stats["failures"] += 1
+        _failures.append({"time": time.time(), "source": source, "target": target, "error": str(error)})
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def translate_text(text, source, target):
+    """Translate a single text through the cache
+
+    Returns:
+        (translated_text, None) on success or (text, error message) on failure,
+        so callers can fall back to the original text.
+    """
+    translations, errors = translate_batch([text], source, target)
+    return translations[0], errors[0]
+
+
+def translate_batch(texts, source, target):
+    """Translate several segments, sending all cache misses in as few requests as possible
+
+    Returns:
+        (translations, errors): two lists in the same order as texts. A failed
+        segment keeps its original text and has an error message.
+    """
+    cache = _get_cache()
+    normalized = [normalize_text(text) for text in texts]
+    translations = list(texts)
+    errors = [None] * len(texts)
+
+    # Serve cached segments and collect the distinct misses
+    missing = {}
+    for index, text in enumerate(normalized):
+        if not text:
+            continue
+        cached = cache.get(_cache_key(source, target, text))
+        if cached is not None:
+            translations[index] = cached.decode("utf-8")
+            _count("hits")
+        else:
+            missing.setdefault(text, []).append(index)
+            _count("misses")
+
+    if not missing:
+        return translations, errors
+
+    for batch in _pack_batches(list(missing)):
+        try:
+            translator = get_translator(source, target)
+        except Exception as e:
+            # e.g. a target the translator doesn't support: every segment keeps its original text
+            _record_failure(source, target, e)
+            results = [(None, f"Translation failed: {str(e)}")] * len(batch)
+        else:
+            with metrics.timed("translation"):
+                results = _translate_joined(translator, batch, source, target)
+        for text, (translated, error) in zip(batch, results):
+            for index in missing[text]:
+                translations[index] = translated if translated else texts[index]
+                errors[index] = error
+            if translated and not error:
+                cache.put(_cache_key(source, target, text), translated.encode("utf-8"))
+
+    return translations, errors
+
+
+def _pack_batches(texts):
+    """Group segments so each joined request stays under BATCH_MAX_CHARS"""
+    batches = []
+    current = []
+    size = 0
+    for text in texts:
+        if current and size + len(text) + len(BATCH_SEPARATOR) > BATCH_MAX_CHARS:
+            batches.append(current)
+            current = []
+            size = 0
+        current.append(text)
+        size += len(text) + len(BATCH_SEPARATOR)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _translate_joined(translator, batch, source, target):
+    """Translate a batch in one request, falling back to one request per segment
+
+    Normalized segments never contain newlines, so the joined translation
+    can be split back apart as long as the line count is preserved.
+    """
+    if len(batch) > 1:
+        try:
+            _count("requests")
+            joined = translator.translate(BATCH_SEPARATOR.join(batch))
+            parts = joined.split(BATCH_SEPARATOR) if joined else []
+            if len(parts) == len(batch):
+                return [(part.strip(), None) for part in parts]
+        except Exception as e:
+            _record_failure(source, target, e)
+        # The joined request failed or lost lines: retry segment by segment
+        metrics.inc("retries_total", service="translation")
+
+    results = []
+    for text in batch:
+        try:
+            _count("requests")
+            results.append((translator.translate(text), None))
+        except Exception as e:
+            _record_failure(source, target, e)
+            results.append((None, f"Translation failed: {str(e)}"))
+    return results
+
+
+def translation_stats():
+    """Return cache/request counters and the most recent failures"""
+    with _stats_lock:
+        return dict(_stats, recent_failures=list(_failures))
+
+
+def _cache_samples():
+    """Export the translation cache counters (metrics collector)"""
+    with _stats_lock:
+        return [
+            ("cache_hits_total", "counter", {"cache": "translation"}, _stats["hits"]),
+            ("cache_misses_total", "counter", {"cache": "translation"}, _stats["misses"]),
+            ("requests_total", "counter", {"service": "translation"}, _stats["requests"]),
+        ]
+
+
+metrics.register_collector(_cache_samples)
@@ -0,0 +1,370 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+import metrics
+from audio_format import assemble_audio, default_audio_format
+from resilience import CircuitOpenError, EmptyResponseError, call_with_retry, get_breaker
+from scheduler import PRIORITY_INTERACTIVE, QueueTimeoutError
+from tts_cache import get_tts_cache, make_cache_key
+
+# AWS Polly language and voice mapping
+# Maps translation language names to Polly language codes and default voices
+POLLY_LANGUAGE_MAP = {
+    "english": {"code": "en-US", "voice": "Joanna", "engine": "standard"},
+    "chinese (simplified)": {"code": "cmn-CN", "voice": "Zhiyu", "engine": "standard"},
+    "chinese (traditional)": {"code": "cmn-CN", "voice": "Zhiyu", "engine": "standard"},
+    "cantonese": {"code": "yue-CN", "voice": "Hiujin", "engine": "neural"},  # Cantonese only has neural voice
+    "french": {"code": "fr-FR", "voice": "Celine", "engine": "standard"},
+    "spanish": {"code": "es-ES", "voice": "Conchita", "engine": "standard"},
+    "german": {"code": "de-DE", "voice": "Marlene", "engine": "standard"},
+    "japanese": {"code": "ja-JP", "voice": "Mizuki", "engine": "standard"},
+    "korean": {"code": "ko-KR", "voice": "Seoyeon", "engine": "standard"},
+    "italian": {"code": "it-IT", "voice": "Carla", "engine": "standard"},
+    "portuguese": {"code": "pt-BR", "voice": "Vitoria", "engine": "standard"},
+    "russian": {"code": "ru-RU", "voice": "Tatyana", "engine": "standard"},
+    "arabic": {"code": "arb", "voice": "Zeina", "engine": "standard"},
+    "hindi": {"code": "hi-IN", "voice": "Aditi", "engine": "standard"},
+}
+
+# English voices offered in the app's voice menu (other languages always use their mapped voice)
+POLLY_VOICE_OPTIONS = {
+    "👩 Joanna (Female)": "Joanna",
+    "👨 Matthew (Male)": "Matthew",
+    "👧 Ivy (Child)": "Ivy",
+    "👩 Salli (Female)": "Salli",
+    "👨 Joey (Male)": "Joey",
+    "👩 Kendra (Female)": "Kendra",
+    "👨 Justin (Male)": "Justin"
+}
+
+# Bounded worker pool for Polly calls, shared by every session of the process
+TTS_MAX_WORKERS = int(os.getenv("TTS_MAX_WORKERS", "4"))
+_tts_executor = ThreadPoolExecutor(max_workers=TTS_MAX_WORKERS, thread_name_prefix="polly")
+
+# Output format used when a caller doesn't pick one (TTS_OUTPUT_FORMAT / TTS_SAMPLE_RATE)
+DEFAULT_AUDIO_FORMAT = default_audio_format()
+
+
+# Polly accepts up to 3000 billed characters per plain-text request
+POLLY_MAX_CHARS = 3000
+
+# Sentence enders, shared by split_text_for_tts and the streaming SentenceSplitter.
+# Western, Arabic and Indic punctuation needs trailing whitespace (so "3.14" stays
+# whole); CJK full-width punctuation is not followed by spaces.
+SENTENCE_END_RE = re.compile(
+    r'[.!?…؟۔।॥]+["\'”’)\]]*(?=\s)'
+    r'|[。！？｡．]+[」』）〕】”’"]*'
+)
+
+# Weaker break points used inside a sentence that is longer than a chunk
+CLAUSE_BREAKS = ("，", "、", "；", "：", "،", ",", ";", ":")
+
+
+def sentence_spans(text, start=0):
+    """Yield (start, end) offsets of the sentences in text, in one linear pass
+
+    The last span runs to the end of the text even if it has no ender, so the
+    spans always cover the whole text. Offsets include surrounding whitespace.
+    """
+    for match in SENTENCE_END_RE.finditer(text, start):
+        yield start, match.end()
+        start = match.end()
+    if start < len(text):
+        yield start, len(text)
+
+
+def _skip_space(text, pos, end):
+    while pos < end and text[pos].isspace():
+        pos += 1
+    return pos
+
+
+def _cut_point(text, start, limit):
+    """Best offset in (start, limit] to cut an over-long sentence
+
+    Prefers clause punctuation, then whitespace, in the second half of the
+    window so chunks stay large; otherwise cuts hard at the limit (e.g. CJK
+    text without punctuation).
+    """
+    floor = start + (limit - start) // 2
+    best = max(text.rfind(mark, floor, limit) for mark in CLAUSE_BREAKS)
+    if best >= floor:
+        return best + 1
+    for pos in range(limit, floor, -1):
+        if text[pos - 1].isspace():
+            return pos
+    return limit
+
+
+def _last_sentence_end(text, start, limit):
+    """Offset of the last sentence end in (start, limit], or None
+
+    Only the tail of the window is scanned, growing it when it holds no
+    sentence end, so each chunk costs a few regex matches instead of one
+    Python iteration per sentence.
+    """
+    window = 256
+    while True:
+        low = max(start, limit - window)
+        last = None
+        # One extra character so the whitespace lookahead can see past the limit
+        for match in SENTENCE_END_RE.finditer(text, low, limit + 1):
+            if start < match.end() <= limit:
+                last = match.end()
+        if last is not None or low == start:
+            return last
+        window *= 4
+
+
+def split_text_for_tts(text, max_chars=POLLY_MAX_CHARS):
+    """Split text into as few chunks as possible at sentence boundaries
+
+    Each chunk is filled up to max_chars and ends at the last sentence end
+    that fits, so the work is linear in the length of the text and no string
+    is built by repeated concatenation. A sentence longer than max_chars is
+    cut at clause punctuation or whitespace.
+    """
+    if len(text) <= max_chars:
+        return [text]
+
+    chunks = []
+    start = _skip_space(text, 0, len(text))
+    while len(text) - start > max_chars:
+        limit = start + max_chars
+        end = _last_sentence_end(text, start, limit) or _cut_point(text, start, limit)
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = _skip_space(text, end, len(text))
+
+    if text[start:].strip():
+        chunks.append(text[start:].strip())
+
+    return chunks
+
+
+def clean_text_for_tts(text):
+    """Remove markdown and normalize whitespace before sending text to Polly"""
+    clean_text = text.replace("**", "").replace("*", "").replace("`", "")
+    clean_text = clean_text.replace("#", "").replace("---", "").replace("```", "")
+    return " ".join(clean_text.split())  # Normalize whitespace
+
+
+def resolve_voice(voice_id, language):
+    """Return (voice_id, language_code, engine) for the target language
+
+    The selected voice is used for English, other languages use their mapped voice.
+    """
+    lang_settings = POLLY_LANGUAGE_MAP.get(language.lower(), POLLY_LANGUAGE_MAP["english"])
+    if language.lower() != "english":
+        voice_id = lang_settings["voice"]
+    return voice_id, lang_settings["code"], lang_settings.get("engine", "standard")
+
+
+class EmptyAudioStream(EmptyResponseError):
+    """Polly answered without an audio stream (retried like a server error)"""
+
+
+def _request_chunk(polly_client, chunk, voice_id, language_code, engine, audio_format):
+    start = time.perf_counter()
+    try:
+        # Call AWS Polly to synthesize speech
+        response = polly_client.synthesize_speech(
+            Engine=engine,
+            LanguageCode=language_code,
+            Text=chunk,
+            VoiceId=voice_id,
+            **audio_format.polly_params()
+        )
+
+        # Read the audio stream
+        if "AudioStream" not in response:
+            raise EmptyAudioStream("Polly returned no audio stream")
+        return response["AudioStream"].read()
+    finally:
+        metrics.observe("stage_seconds", time.perf_counter() - start, stage="polly_chunk", engine=engine)
+
+
+def synthesize_chunk(polly_client, chunk, voice_id, language_code, engine, max_retries=2, audio_format=None,
+                     priority=PRIORITY_INTERACTIVE, session_id=None):
+    """Synthesize a single chunk, retrying throttling and transient errors with backoff
+
+    Fails fast without calling Polly while its circuit breaker is open. The
+    request waits for the Polly rate limit of its voice engine, ordered by
+    priority and shared fairly between sessions.
+
+    Returns:
+        (audio_bytes, None) on success or (None, error message) on failure. The
+        bytes are Polly's raw output; use assemble_audio to make a playable clip.
+    """
+    try:
+        audio = call_with_retry(
+            "polly", _request_chunk, polly_client, chunk, voice_id, language_code, engine,
+            audio_format or DEFAULT_AUDIO_FORMAT, max_attempts=max_retries + 1,
+            lane=engine, priority=priority, session_id=session_id,
+        )
+        return audio, None
+    except CircuitOpenError as e:
+        error = f"Voice output paused: {str(e)}"
+    except QueueTimeoutError as e:
+        error = f"Voice output is busy: {str(e)}"
+    except EmptyAudioStream as e:
+        error = str(e)
+    except (BotoCoreError, ClientError) as e:
+        error = f"Audio generation failed: {str(e)}"
+    except Exception as e:
+        error = f"TTS Error: {str(e)}"
+
+    metrics.inc("errors_total", stage="polly_chunk")
+    return None, error
+
+
+def polly_available():
+    """False while the Polly circuit breaker is open (replies should be text-only)"""
+    return not get_breaker("polly").is_open
+
+
+def synthesize_cached(polly_client, clean_text, voice_id, language_code, engine, max_retries=2, audio_format=None,
+                      priority=PRIORITY_INTERACTIVE, session_id=None):
+    """Synthesize one already-cleaned chunk through the shared audio cache
+
+    Returns:
+        (audio_bytes, None) on success or (None, error message) on failure.
+        Like synthesize_chunk, the bytes are Polly's raw output.
+    """
+    audio_format = audio_format or DEFAULT_AUDIO_FORMAT
+    tts_cache = get_tts_cache()
+    # Raw chunks are cached apart from assembled clips: for pcm only clips have a WAV header
+    cache_key = make_cache_key(clean_text, voice_id, language_code, engine, audio_format.cache_tag, kind="chunk")
+    cached_audio = tts_cache.get(cache_key)
+    if cached_audio:
+        return cached_audio, None
+
+    audio_bytes, error = synthesize_chunk(polly_client, clean_text, voice_id, language_code, engine, max_retries,
+                                          audio_format, priority, session_id)
+    if audio_bytes:
+        tts_cache.put(cache_key, audio_bytes)
+    return audio_bytes, error
+
+
+def synthesize_text(polly_client, text, voice_id="Joanna", language="english", max_retries=2, audio_format=None,
+                    priority=PRIORITY_INTERACTIVE, session_id=None):
+    """Convert text to speech using AWS Polly, synthesizing chunks in parallel
+
+    Args:
+        polly_client: The boto3 Polly client
+        text: The text to convert to speech
+        voice_id: The Polly voice ID (used for English, ignored for other languages)
+        language: The target language (maps to appropriate voice and language code)
+        max_retries: Number of retry attempts per chunk
+        audio_format: The AudioFormat to produce (default: TTS_OUTPUT_FORMAT / TTS_SAMPLE_RATE)
+        priority, session_id: Scheduling of the Polly requests (see scheduler.py)
+
+    Returns:
+        (audio_bytes, failures) where failures is a list of
+        (chunk_number, chunk_count, error message). audio_bytes is one playable
+        clip assembled from every chunk that succeeded, in order, and is None
+        only if nothing could be synthesized.
+    """
+    audio_format = audio_format or DEFAULT_AUDIO_FORMAT
+    voice_id, language_code, engine = resolve_voice(voice_id, language)
+    clean_text = clean_text_for_tts(text)
+
+    # Check the shared audio cache first (shared by every session of the process)
+    tts_cache = get_tts_cache()
+    cache_key = make_cache_key(clean_text, voice_id, language_code, engine, audio_format.cache_tag)
+    cached_audio = tts_cache.get(cache_key)
+    if cached_audio:
+        return cached_audio, []
+
+    # Split text into chunks if too long
+    text_chunks = [chunk for chunk in split_text_for_tts(clean_text) if chunk.strip()]
+    if not text_chunks:
+        return None, []
+
+    if len(text_chunks) == 1:
+        results = [synthesize_chunk(polly_client, text_chunks[0], voice_id, language_code, engine, max_retries,
+                                    audio_format, priority, session_id)]
+    else:
+        futures = [
+            _tts_executor.submit(synthesize_chunk, polly_client, chunk, voice_id, language_code, engine, max_retries,
+                                 audio_format, priority, session_id)
+            for chunk in text_chunks
+        ]
+        # Collect in submission order so the audio is reassembled in order
+        results = [future.result() for future in futures]
+
+    all_audio_bytes = []
+    failures = []
+    for number, (audio_bytes, error) in enumerate(results, start=1):
+        if audio_bytes:
+            all_audio_bytes.append(audio_bytes)
+        else:
+            failures.append((number, len(text_chunks), error))
+
+    # Combine all audio chunks into one clip
+    if not all_audio_bytes:
+        return None, failures
+    audio = assemble_audio(all_audio_bytes, audio_format)
+    if not failures:
+        # Only cache audio when every chunk was synthesized
+        tts_cache.put(cache_key, audio)
+    return audio, failures
+
+
+def _cache_samples():
+    """Export the shared audio cache counters (metrics collector)"""
+    stats = get_tts_cache().stats()
+    return [
+        ("cache_hits_total", "counter", {"cache": "tts"}, stats["hits"]),
+        ("cache_misses_total", "counter", {"cache": "tts"}, stats["misses"]),
+        ("cache_bytes", "gauge", {"cache": "tts", "tier": "memory"}, stats["memory_bytes"]),
+        ("cache_bytes", "gauge", {"cache": "tts", "tier": "disk"}, stats["disk_bytes"]),
+    ]
+
+
+metrics.register_collector(_cache_samples)
+
+
+class SentenceSplitter:
+    """Incrementally split a token stream into complete sentences
+
+    Tokens are fed as they arrive and every complete sentence is returned as
+    soon as its end is seen. Sentences shorter than min_chars are held back and
+    merged with the next one so Polly isn't called for fragments like "1."
+    """
+
+    def __init__(self, min_chars=20):
+        self.min_chars = min_chars
+        self._pending = ""
+        self._scan_from = 0  # No sentence end exists before this offset
+
+    def feed(self, text):
+        """Add streamed text and return the list of newly completed sentences"""
+        self._pending += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END_RE.finditer(self._pending, self._scan_from):
+            end = match.end()
+            if end - start < self.min_chars:
+                continue
+            sentence = self._pending[start:end].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = end
+
+        self._pending = self._pending[start:]
+        # A western ender at the very end may still be followed by whitespace
+        self._scan_from = max(0, len(self._pending) - 4)
+        return sentences
+
+    def flush(self):
+        """Return whatever is left once the stream has finished"""
+        remainder = self._pending.strip()
+        self._pending = ""
+        self._scan_from = 0
+        return [remainder] if remainder else []
@@ -0,0 +1,234 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(text, voice_id, language_code, engine, output_format="mp3", kind="clip"):
+    """Build a content-addressed key for a synthesized clip
+
+    Args:
+        text: The cleaned text that is sent to Polly
+        voice_id: The Polly voice ID
+        language_code: The Polly language code (e.g. "en-US")
+        engine: The Polly engine ("standard" or "neural")
+        output_format: The Polly output format
+        kind: "clip" for a playable clip assembled by synthesize_text, "chunk"
+            for Polly's raw output of one chunk (e.g. headerless PCM)
+    """
+    # Use a separator that can't appear in the normalized text
+    payload = "\x1f".join([text, voice_id, language_code, engine, output_format, kind])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """Two-tier (memory LRU + disk) cache for synthesized audio
+
+    The memory tier is bounded by item count and total bytes. The disk tier
+    is bounded by total bytes and entries expire after ttl_seconds. When the
+    disk tier is over its cap, the least recently used files are removed first.
+    All methods are thread-safe so the cache can be shared by every session.
+    """
+
+    def __init__(self, cache_dir, memory_items=256, memory_bytes=64 * 1024 * 1024,
+                 disk_bytes=512 * 1024 * 1024, ttl_seconds=7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (audio bytes, stored_at)
+        self._memory_size = 0
+        self._disk_size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._disk_size = sum(size for _, size, _ in self._scan_disk())
+
+    # Disk layout: <cache_dir>/<first two hex chars>/<key>.audio
+    def _path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".audio")
+
+    def _scan_disk(self):
+        """Yield (path, size, stat) for every cached file on disk
+
+        mtime is when the clip was stored (used for TTL) and atime is when it
+        was last read (used for LRU eviction, set explicitly on every hit).
+        """
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".audio"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat
+
+    def _remember(self, key, audio, stored_at):
+        """Insert into the memory tier and evict LRU entries (lock held)"""
+        if len(audio) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old[0])
+        self._memory[key] = (audio, stored_at)
+        self._memory_size += len(audio)
+        while self._memory and (len(self._memory) > self.memory_items
+                                or self._memory_size > self.memory_bytes):
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _remove_file(self, path, size):
+        try:
+            os.unlink(path)
+            with self._lock:
+                self._disk_size -= size
+        except OSError:
+            pass
+
+    def get(self, key):
+        """Return cached audio bytes for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                audio, stored_at = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return audio
+                del self._memory[key]
+                self._memory_size -= len(audio)
+
+        if self.cache_dir:
+            path = self._path_for(key)
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime > self.ttl_seconds:
+                    self._remove_file(path, stat.st_size)
+                else:
+                    with open(path, "rb") as f:
+                        audio = f.read()
+                    # Bump atime (keeping mtime) so eviction sees it as recently used
+                    os.utime(path, (now, stat.st_mtime))
+                    with self._lock:
+                        self._remember(key, audio, stat.st_mtime)
+                        self.hits += 1
+                        self.disk_hits += 1
+                    return audio
+            except OSError:
+                pass
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, audio):
+        """Store audio bytes under key in both tiers"""
+        if not audio:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, audio, now)
+
+        if not self.cache_dir or len(audio) > self.disk_bytes:
+            return
+
+        path = self._path_for(key)
+        # Write to a temp file first so readers never see a partial clip
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(audio)
+                os.replace(tmp_path, path)
+            except OSError:
+                # e.g. a full disk: don't leave a partial temp file behind
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+            with self._lock:
+                self._disk_size += len(audio) - previous_size
+                over_cap = self._disk_size > self.disk_bytes
+            if over_cap:
+                self.evict()
+        except OSError:
+            pass
+
+    def evict(self):
+        """Remove expired disk entries, then LRU entries until under the cap"""
+        if not self.cache_dir:
+            return
+        now = time.time()
+        entries = []
+        total = 0
+        for path, size, stat in self._scan_disk():
+            if now - stat.st_mtime > self.ttl_seconds:
+                self._remove_file(path, size)
+                continue
+            entries.append((stat.st_atime, path, size))
+            total += size
+
+        with self._lock:
+            self._disk_size = total
+
+        entries.sort()
+        for _, path, size in entries:
+            if self._disk_size <= self.disk_bytes:
+                break
+            self._remove_file(path, size)
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+        if self.cache_dir:
+            for path, size, _ in list(self._scan_disk()):
+                self._remove_file(path, size)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_bytes": self._disk_size,
+            }
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_tts_cache():
+    """Return the process-wide TTS cache, creating it from env settings once
+
+    Streamlit re-runs app.py on every interaction, but imported modules are
+    only loaded once per process, so this instance is shared by all sessions.
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = TTSCache(
+                cache_dir=os.getenv("TTS_CACHE_DIR", ".tts_cache") or None,
+                memory_items=int(os.getenv("TTS_CACHE_MEMORY_ITEMS", "256")),
+                memory_bytes=int(float(os.getenv("TTS_CACHE_MEMORY_MB", "64")) * 1024 * 1024),
+                disk_bytes=int(float(os.getenv("TTS_CACHE_DISK_MB", "512")) * 1024 * 1024),
+                ttl_seconds=int(float(os.getenv("TTS_CACHE_TTL_HOURS", "168")) * 3600),
+            )
+        return _shared_cache
@@ -0,0 +1,149 @@
+import logging
+import os
+import threading
+import time
+
+import metrics
+from audio_format import AudioFormat
+from clients import warm_up_clients
+from phrases import offered_audio_formats, presynthesize_phrases
+from stt import get_stt_backend
+from tts import DEFAULT_AUDIO_FORMAT, POLLY_VOICE_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+# Pre-synthesize the fixed phrases (phrases.py) at start-up (0 to skip, e.g. to save Polly characters)
+WARMUP_PHRASES = os.getenv("WARMUP_PHRASES", "1").lower() in ("1", "true", "yes")
+# Comma-separated reply languages to prepare phrases for (default: every POLLY_LANGUAGE_MAP language)
+WARMUP_LANGUAGES = [language.strip() for language in os.getenv("WARMUP_LANGUAGES", "").split(",") if language.strip()]
+# Extra English voices ("Matthew,Ivy", or "all" for the voice menu) and audio formats
+# ("mp3@16000,pcm@8000", or "all" for the quality menu) to prepare phrases in. Each one
+# adds a Polly request per phrase and language on a cold cache, so both are opt-in.
+WARMUP_VOICES = os.getenv("WARMUP_VOICES", "")
+WARMUP_AUDIO_FORMATS = os.getenv("WARMUP_AUDIO_FORMATS", "")
+
+_report = None
+_report_lock = threading.Lock()
+_warm_up_started = False
+
+
+def _split(setting):
+    return [value.strip() for value in setting.split(",") if value.strip()]
+
+
+def warm_up_voices():
+    """The English voices to pre-synthesize phrases in, besides the default one"""
+    if WARMUP_VOICES.strip().lower() == "all":
+        return list(POLLY_VOICE_OPTIONS.values())
+    return _split(WARMUP_VOICES)
+
+
+def warm_up_audio_formats():
+    """The AudioFormats to pre-synthesize phrases in, the deployment's default first
+
+    Raises ValueError for an entry that isn't a Polly format and sample rate.
+    """
+    if WARMUP_AUDIO_FORMATS.strip().lower() == "all":
+        return offered_audio_formats()
+    formats = [DEFAULT_AUDIO_FORMAT]
+    for tag in _split(WARMUP_AUDIO_FORMATS):
+        name, _, sample_rate = tag.partition("@")
+        audio_format = AudioFormat(name.strip(), sample_rate.strip() or None)
+        if audio_format not in formats:
+            formats.append(audio_format)
+    return formats
+
+
+def run_warm_up(polly_client, hf_client, phrases=None):
+    """Prepare this process for its first user and return a report
+
+    Opens pooled connections with a cheap probe per service, loads the
+    speech recognition backend (imports, and the model for whisper) and
+    pre-synthesizes the fixed phrases into the audio cache.
+
+    Returns:
+        {"seconds": total, "stages": {stage: seconds}, "probes": {service: error or None},
+         "phrases": presynthesize_phrases report, or None when skipped}
+        (_run_and_report adds "error" when the warm-up itself failed)
+    """
+    phrases = WARMUP_PHRASES if phrases is None else phrases
+    start = time.perf_counter()
+    report = {"stages": {}, "probes": {}, "phrases": None}
+
+    def stage(name, func, *args):
+        stage_start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            report["stages"][name] = time.perf_counter() - stage_start
+
+    report["probes"] = stage("connections", warm_up_clients, polly_client, hf_client)
+    try:
+        stage("speech_backend", get_stt_backend)
+    except Exception as e:
+        report["probes"]["speech_backend"] = str(e)
+    if phrases:
+        report["phrases"] = stage("phrases", presynthesize_phrases, polly_client, WARMUP_LANGUAGES or None,
+                                  warm_up_voices(), warm_up_audio_formats())
+
+    report["seconds"] = time.perf_counter() - start
+    metrics.observe("stage_seconds", report["seconds"], stage="warm_up")
+    return report
+
+
+def _run_and_report(polly_client, hf_client):
+    global _report
+    start = time.perf_counter()
+    try:
+        report = run_warm_up(polly_client, hf_client)
+    except Exception as e:
+        # Still publish a report, or the UI would wait for the warm-up forever
+        logger.exception("⚠️ Warm-up failed")
+        report = {"seconds": time.perf_counter() - start, "stages": {}, "probes": {}, "phrases": None,
+                  "error": str(e) or type(e).__name__}
+    with _report_lock:
+        _report = report
+    if report.get("error"):
+        return
+
+    failed = [f"{service}: {error}" for service, error in report["probes"].items() if error]
+    summary = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in report["stages"].items())
+    phrases = report["phrases"]
+    if phrases:
+        summary += f"; {phrases['cached'] + phrases['synthesized']} phrases ready ({phrases['synthesized']} synthesized"
+        summary += f", {phrases['failed']} failed)" if phrases["failed"] else ")"
+    logger.info("🔥 Warm-up finished in %.1fs (%s)", report["seconds"], summary)
+    for failure in failed:
+        logger.warning("⚠️ Warm-up probe failed for %s", failure)
+
+
+def start_warm_up(polly_client, hf_client):
+    """Run the warm-up once per process in a background thread"""
+    global _warm_up_started
+    with _report_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+    threading.Thread(target=_run_and_report, args=(polly_client, hf_client),
+                     name="warm-up", daemon=True).start()
+
+
+def warm_up_report():
+    """The last warm-up report, or None while it is still running"""
+    with _report_lock:
+        return _report
+
+
+def _warm_up_samples():
+    """Export the warm-up duration and phrase counts (metrics collector)"""
+    report = warm_up_report()
+    if report is None:
+        return []
+    samples = [("warm_up_seconds", "gauge", {}, report["seconds"])]
+    if report["phrases"]:
+        for outcome in ("cached", "synthesized", "failed"):
+            samples.append(("warm_up_phrases", "gauge", {"outcome": outcome}, report["phrases"][outcome]))
+    return samples
+
+
+metrics.register_collector(_warm_up_samples)